@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Microbenchmark for the Discord reply chunker (`bot._chunk_text`).
+
+Times the chunker on multi-megabyte random markdown (paragraphs, headings, lists, tables, fenced
+code, very long lines and unbroken words). Its correctness properties are checked by
+tests/test_chunker.py.
+
+Example:
+
+    python benchmarks/bench_chunker.py --sizes 1,4,16 --compare-legacy
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+from openclaw_mini.bot import DISCORD_MESSAGE_SAFE_LIMIT, _chunk_text  # noqa: E402
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu queue worker shard".split()
+
+
+def legacy_chunk_text(text: str, max_len: int = DISCORD_MESSAGE_SAFE_LIMIT) -> list[str]:
+    # The previous implementation, kept for timing comparisons.
+    if len(text) <= max_len:
+        return [text]
+    remaining = text
+    chunks: list[str] = []
+    while len(remaining) > max_len:
+        split_at = remaining.rfind("\n", 0, max_len + 1)
+        if split_at < max_len // 2:
+            split_at = remaining.rfind(" ", 0, max_len + 1)
+        if split_at < max_len // 2:
+            split_at = max_len
+        chunk = remaining[:split_at].rstrip()
+        if not chunk:
+            chunk = remaining[:max_len]
+            split_at = max_len
+        chunks.append(chunk)
+        remaining = remaining[split_at:].lstrip()
+    if remaining:
+        chunks.append(remaining)
+    return chunks
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def random_markdown(rng: random.Random, target_chars: int) -> str:
+    blocks: list[str] = []
+    size = 0
+    while size < target_chars:
+        kind = rng.random()
+        if kind < 0.35:
+            block = " ".join(_sentence(rng, rng.randint(4, 30)) for _ in range(rng.randint(1, 12)))
+        elif kind < 0.45:
+            block = "#" * rng.randint(1, 3) + " " + _sentence(rng, rng.randint(2, 6))
+        elif kind < 0.6:
+            block = "\n".join(f"- {_sentence(rng, rng.randint(3, 20))}" for _ in range(rng.randint(2, 40)))
+        elif kind < 0.68:
+            rows = [f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} |" for _ in range(rng.randint(2, 30))]
+            block = "| name | value |\n| --- | --- |\n" + "\n".join(rows)
+        elif kind < 0.9:
+            marker = rng.choice(["```", "````", "~~~"])
+            lang = rng.choice(["", "python", "bash", "json"])
+            lines = [
+                "    " * rng.randint(0, 3) + " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 15)))
+                for _ in range(rng.randint(1, 200))
+            ]
+            if rng.random() < 0.1:
+                lines.append("x" * rng.randint(2000, 6000))
+            block = f"{marker}{lang}\n" + "\n".join(lines) + f"\n{marker}"
+        elif kind < 0.95:
+            block = " ".join(rng.choice(WORDS) for _ in range(rng.randint(300, 1500)))
+        else:
+            block = "y" * rng.randint(1900, 8000)
+        blocks.append(block)
+        size += len(block) + 2
+    separator = "\r\n\r\n" if rng.random() < 0.1 else "\n\n"
+    return separator.join(blocks)
+
+
+def run_benchmark(sizes_mb: list[float], seed: int, compare_legacy: bool) -> None:
+    rng = random.Random(seed)
+    for size_mb in sizes_mb:
+        text = random_markdown(rng, int(size_mb * 1024 * 1024))
+        started = time.perf_counter()
+        chunks = _chunk_text(text)
+        elapsed = time.perf_counter() - started
+        line = f"{len(text) / 1024 / 1024:6.1f} MiB  chunks={len(chunks):6d}  chunker={elapsed * 1000:8.1f} ms"
+        if compare_legacy:
+            started = time.perf_counter()
+            legacy_chunk_text(text)
+            line += f"  legacy={(time.perf_counter() - started) * 1000:9.1f} ms"
+        print(line)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sizes", default="1,4,8", help="comma-separated input sizes in MiB")
+    parser.add_argument("--compare-legacy", action="store_true", help="also time the previous quadratic chunker")
+    args = parser.parse_args(argv)
+
+    run_benchmark([float(size) for size in args.sizes.split(",") if size], args.seed, args.compare_legacy)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark: synthetic Discord messages through on_message against a fake Codex.
+
+Builds the real bot with `build_discord_client`, replaces the gateway with in-process
+message objects, and points CODEX_COMMAND at benchmarks/fake_codex.py. Reports reply
+latency percentiles, throughput, Codex process counts, RSS, and bytes written to the
+session store and memory directory per turn.
+
+Example:
+
+    python benchmarks/bench_pipeline.py --messages 200 --conversations 20 --rate 20
+    python benchmarks/bench_pipeline.py --backend worker --latency-ms 500 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+FAKE_CODEX = BENCH_DIR / "fake_codex.py"
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+from openclaw_mini.replay import FakeChannel, FakeGuild, FakeMessage, FakeUser, percentile  # noqa: E402
+
+PHRASES = [
+    "what's the status of the deploy",
+    "summarize the last incident",
+    "how do I rotate the api keys",
+    "write a haiku about queues",
+    "list open tasks for this week",
+    "explain the retry policy",
+    "what changed since yesterday",
+    "draft a reply to the customer",
+]
+
+def _dir_size(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _files_size(paths: list[Path]) -> int:
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+
+def _proc_write_bytes() -> int | None:
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("write_bytes:"):
+                return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def configure_environment(args: argparse.Namespace, workdir: Path) -> None:
+    env = {
+        "DISCORD_BOT_TOKEN": "benchmark",
+        "CODEX_COMMAND": str(FAKE_CODEX),
+        "CODEX_WORKSPACE_ROOT": str(workdir),
+        "CODEX_SESSION_DB_PATH": str(workdir / "sessions.db"),
+        "CODEX_SESSION_STORE_PATH": str(workdir / "sessions.json"),
+        "CODEX_MEMORY_INDEX_PATH": str(workdir / "memory-index.db"),
+        "CODEX_MEMORY_DIR": "memory",
+        "SOUL_PATH": str(REPO_ROOT / "SOUL.md"),
+        "CODEX_BACKEND": args.backend,
+        "CODEX_WORKSPACE_MODE": args.workspace_mode,
+        "CODEX_WORKSPACES_DIR": str(workdir / "workspaces"),
+        "CODEX_MAX_CONCURRENCY": str(args.concurrency),
+        "DISCORD_STREAM_REPLIES": "true" if args.stream else "false",
+        "FAKE_CODEX_LATENCY_MS": str(args.latency_ms),
+        "FAKE_CODEX_LATENCY_DIST": args.dist,
+        "FAKE_CODEX_FAILURE_RATE": str(args.failure_rate),
+        "FAKE_CODEX_REPLY_CHARS": str(args.reply_chars),
+        "FAKE_CODEX_PID_DIR": str(workdir / "pids"),
+        "FAKE_CODEX_SPAWN_LOG": str(workdir / "spawns.log"),
+    }
+    (workdir / "pids").mkdir(parents=True, exist_ok=True)
+    os.environ.update(env)
+
+
+def build_messages(args: argparse.Namespace, rng: random.Random) -> list[FakeMessage]:
+    messages = []
+    for index in range(args.messages):
+        conversation = rng.randrange(args.conversations)
+        if rng.random() < args.duplicate_ratio:
+            text = rng.choice(PHRASES)
+        else:
+            text = f"{rng.choice(PHRASES)} #{index}"
+        guild = FakeGuild(id=1000 + conversation % 4) if conversation % 5 else None
+        messages.append(
+            FakeMessage(
+                content=text,
+                channel=FakeChannel(id=10_000 + conversation),
+                guild=guild,
+                author=FakeUser(id=rng.randrange(args.users)),
+            ),
+        )
+    return messages
+
+
+async def run_benchmark(args: argparse.Namespace, workdir: Path) -> dict[str, object]:
+    from openclaw_mini.bot import build_discord_client
+    from openclaw_mini.config import load_settings
+
+    settings = load_settings()
+    client = build_discord_client(settings)
+    await client.setup_hook()
+    on_message = client.on_message
+
+    rng = random.Random(args.seed)
+    messages = build_messages(args, rng)
+    pid_dir = workdir / "pids"
+    store_files = [settings.codex_session_db_path, Path(f"{settings.codex_session_db_path}-wal")]
+    store_before = _files_size(store_files)
+    memory_before = _dir_size(settings.codex_memory_dir)
+    io_before = _proc_write_bytes()
+
+    peak_processes = 0
+    sampling = True
+
+    async def sample_processes() -> None:
+        nonlocal peak_processes
+        while sampling:
+            peak_processes = max(peak_processes, sum(1 for _ in pid_dir.iterdir()))
+            await asyncio.sleep(0.005)
+
+    latencies: list[float] = []
+    first_output: list[float] = []
+
+    async def deliver(message: FakeMessage, delay: float) -> None:
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        await on_message(message)
+        latencies.append(time.perf_counter() - started)
+        if message.first_output_at is not None:
+            first_output.append(message.first_output_at - started)
+
+    delays: list[float] = []
+    at = 0.0
+    for _ in messages:
+        delays.append(at)
+        if args.rate > 0:
+            at += rng.expovariate(args.rate)
+
+    sampler = asyncio.create_task(sample_processes())
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(deliver(message, delay) for message, delay in zip(messages, delays)))
+    wall = time.perf_counter() - wall_start
+    sampling = False
+    await sampler
+
+    spawn_log = workdir / "spawns.log"
+    spawned = len(spawn_log.read_text().splitlines()) if spawn_log.exists() else 0
+    turns = max(1, len(messages))
+    io_after = _proc_write_bytes()
+    return {
+        "messages": len(messages),
+        "conversations": args.conversations,
+        "backend": args.backend,
+        "wall_sec": round(wall, 3),
+        "messages_per_sec": round(len(messages) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0.0) * 1000, 1),
+        },
+        "first_output_ms": {
+            "p50": round(percentile(first_output, 50) * 1000, 1),
+            "p95": round(percentile(first_output, 95) * 1000, 1),
+        },
+        "codex_processes_spawned": spawned,
+        "codex_processes_peak": peak_processes,
+        "max_rss_mb": round(_max_rss_mb(), 1),
+        "session_store_bytes_per_turn": round((_files_size(store_files) - store_before) / turns, 1),
+        "memory_dir_bytes_per_turn": round((_dir_size(settings.codex_memory_dir) - memory_before) / turns, 1),
+        "process_write_bytes_per_turn": (
+            round((io_after - io_before) / turns, 1) if io_before is not None and io_after is not None else None
+        ),
+    }
+
+
+def print_report(report: dict[str, object]) -> None:
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = "  ".join(f"{k}={v}" for k, v in value.items())
+        print(f"{key.ljust(width)}  {value}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--users", type=int, default=25)
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrival rate in msgs/sec (0 = all at once)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=4, help="CODEX_MAX_CONCURRENCY")
+    parser.add_argument("--backend", choices=["exec", "worker"], default="exec")
+    parser.add_argument("--workspace-mode", choices=["shared", "copy"], default="shared", help="CODEX_WORKSPACE_MODE")
+    parser.add_argument("--stream", action="store_true", help="enable DISCORD_STREAM_REPLIES")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", type=Path, default=None, help="keep artifacts here instead of a temp dir")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir
+    if workdir is None:
+        workdir = Path(tempfile.mkdtemp(prefix="openclaw-bench-"))
+        # Registered before the bot's own exit hooks, so it runs after them.
+        atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    workdir.mkdir(parents=True, exist_ok=True)
+    configure_environment(args, workdir)
+    report = asyncio.run(run_benchmark(args, workdir))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""Executable wrapper for openclaw_mini.fake_codex; point CODEX_COMMAND here.
+
+See src/openclaw_mini/fake_codex.py for the supported invocations and FAKE_CODEX_* variables.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from openclaw_mini.fake_codex import main  # noqa: E402
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,30 @@
 __all__ = [
+    "admission",
+    "capture",
     "config",
+    "dedupe",
+    "delivery",
     "bot",
+    "events",
+    "expiry",
+    "fake_codex",
+    "filecache",
+    "hedging",
     "llm",
+    "memory_archive",
+    "memory_index",
+    "metrics",
+    "prompt",
+    "replay",
+    "scheduler",
+    "session",
+    "session_store",
+    "sharding",
     "skills",
     "soul",
+    "streaming",
+    "timeouts",
+    "traces",
+    "workers",
+    "workspaces",
 ]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+
+from .metrics import ADMISSION_REJECTED, log_event
+
+# Idle buckets are dropped once the table grows past this and they have refilled.
+MAX_TRACKED_BUCKETS = 4096
+
+
+class RateLimiter:
+    # One token bucket per key: `burst` requests at once, refilled at `rate_per_min`.
+    def __init__(self, rate_per_min: int, burst: int) -> None:
+        self._rate_per_sec = rate_per_min / 60.0
+        self._burst = float(burst)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (self._burst, now))
+        return min(self._burst, tokens + (now - updated_at) * self._rate_per_sec)
+
+    def retry_after(self, key: str, now: float) -> float:
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens >= 1.0 else (1.0 - tokens) / self._rate_per_sec
+
+    def take(self, key: str, now: float) -> None:
+        self._buckets[key] = (self._tokens(key, now) - 1.0, now)
+        if len(self._buckets) > MAX_TRACKED_BUCKETS:
+            self._buckets = {
+                bucket_key: state
+                for bucket_key, state in self._buckets.items()
+                if self._tokens(bucket_key, now) < self._burst
+            }
+
+
+@dataclass(frozen=True)
+class AdmissionDecision:
+    allowed: bool
+    reason: str | None = None
+    retry_after: float = 0.0
+    position: int = 0
+
+    @property
+    def message(self) -> str:
+        if self.reason == "queue_full":
+            return (
+                f"⏳ Busy right now: you would be #{self.position} in the queue. "
+                "Please try again in a minute."
+            )
+        return f"⏳ Slow down a little: try again in {max(1, math.ceil(self.retry_after))}s."
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        user_rate_per_min: int,
+        user_burst: int,
+        guild_rate_per_min: int,
+        guild_burst: int,
+        max_queue_depth: int,
+    ) -> None:
+        self._users = RateLimiter(user_rate_per_min, user_burst) if user_rate_per_min else None
+        self._guilds = RateLimiter(guild_rate_per_min, guild_burst) if guild_rate_per_min else None
+        self._max_queue_depth = max_queue_depth
+
+    def check(self, user_id: int, guild_id: int | None, queue_depth: int) -> AdmissionDecision:
+        # Shed before touching the buckets so a rejected request does not also cost a token.
+        if self._max_queue_depth and queue_depth >= self._max_queue_depth:
+            return self._reject("queue_full", user_id, guild_id, position=queue_depth + 1)
+        now = time.monotonic()
+        user_key = str(user_id)
+        guild_key = str(guild_id) if guild_id is not None else None
+        if self._users is not None:
+            wait = self._users.retry_after(user_key, now)
+            if wait:
+                return self._reject("user_rate", user_id, guild_id, retry_after=wait)
+        if self._guilds is not None and guild_key is not None:
+            wait = self._guilds.retry_after(guild_key, now)
+            if wait:
+                return self._reject("guild_rate", user_id, guild_id, retry_after=wait)
+        if self._users is not None:
+            self._users.take(user_key, now)
+        if self._guilds is not None and guild_key is not None:
+            self._guilds.take(guild_key, now)
+        return AdmissionDecision(allowed=True)
+
+    @staticmethod
+    def _reject(
+        reason: str,
+        user_id: int,
+        guild_id: int | None,
+        retry_after: float = 0.0,
+        position: int = 0,
+    ) -> AdmissionDecision:
+        ADMISSION_REJECTED.inc(reason=reason)
+        log_event("admission_rejected", reason=reason, user_id=user_id, guild_id=guild_id, position=position)
+        return AdmissionDecision(allowed=False, reason=reason, retry_after=retry_after, position=position)
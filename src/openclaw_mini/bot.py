@@ -1,100 +1,456 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
 import logging
+import re
+import signal
+import time
+from collections.abc import Awaitable
 
 import discord
 
+from .admission import AdmissionController
 from .config import Settings
-from .llm import CodexClient
-from .skills import format_skill_cards_for_prompt, handle_skill_command, load_skill_cards
-from .soul import load_soul
+from .dedupe import ReplyCache, SingleFlight, request_key
+from .delivery import OutboundDispatcher
+from .llm import RESTARTING_TEXT, CodexClient, CodexReply
+from .metrics import MESSAGES, REGISTRY, STAGE_SECONDS, configure_json_logs, span, start_metrics_server
+from .scheduler import ConversationScheduler
+from .sharding import ShardPlan
+from .skills import SkillCardsCache, handle_skill_command, split_fresh_command
+from .soul import SoulCache
+from .streaming import ReplyStreamer
+from .traces import TraceRecorder, trace_id
 
 logger = logging.getLogger(__name__)
 DISCORD_MESSAGE_SAFE_LIMIT = 1900
 
 
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+# Longer opener lines (odd info strings) are not repeated; the bare marker is reopened instead.
+MAX_REOPEN_LINE = 80
+
+
+class _MarkdownChunker:
+    # Packs lines into chunks in a single pass. A chunk preferably ends at a paragraph or heading
+    # boundary; code fences split across chunks are closed and reopened so each chunk renders.
+    def __init__(self, max_len: int) -> None:
+        self._max_len = max_len
+        self._chunks: list[str] = []
+        self._parts: list[str] = []
+        self._size = 0
+        self._fence: str | None = None
+        self._reopen = ""
+        self._break_index = 0
+        self._break_size = 0
+
+    def run(self, text: str) -> list[str]:
+        for line in text.splitlines(keepends=True):
+            self._feed(line)
+        self._emit(final=True)
+        return self._chunks
+
+    def _room(self) -> int:
+        closing = len(self._fence) + 1 if self._fence else 0
+        return self._max_len - closing - self._size
+
+    def _append(self, piece: str) -> None:
+        self._parts.append(piece)
+        self._size += len(piece)
+
+    def _mark_break(self) -> None:
+        self._break_index = len(self._parts)
+        self._break_size = self._size
+
+    def _feed(self, line: str) -> None:
+        if self._fence is None and not line.strip() and not self._parts:
+            return
+        opener: str | None = None
+        closes = False
+        match = _FENCE_RE.match(line)
+        if match is not None:
+            if self._fence is None:
+                opener = match.group(1)
+            else:
+                stripped = line.strip()
+                closes = stripped.startswith(self._fence) and stripped == stripped[0] * len(stripped)
+        if self._fence is None and line.startswith("#") and self._parts:
+            self._mark_break()
+
+        # An opening fence must leave room for the closing marker it may need.
+        need = len(line) + (len(opener) + 1 if opener else 0)
+        if need > self._room():
+            self._make_room(need)
+        if need > self._room():
+            self._add_long_line(line)
+        else:
+            self._append(line)
+
+        if opener is not None:
+            self._fence = opener
+            self._reopen = line if len(line) <= MAX_REOPEN_LINE else opener + "\n"
+        elif closes:
+            self._fence = None
+            self._reopen = ""
+            self._mark_break()
+        elif self._fence is None and not line.strip():
+            self._mark_break()
+
+    def _make_room(self, need: int) -> None:
+        # Prefer the last paragraph/heading boundary if it keeps this chunk at least half full.
+        if self._break_index and self._break_size >= self._max_len // 2:
+            carry = self._parts[self._break_index :]
+            self._parts = self._parts[: self._break_index]
+            fence, reopen = self._fence, self._reopen
+            # Boundaries are only recorded outside fences, so the head needs no closing marker.
+            self._fence = None
+            self._emit()
+            self._fence, self._reopen = fence, reopen
+            for piece in carry:
+                self._append(piece)
+            if need <= self._room():
+                return
+        if self._parts and self._parts != [self._reopen]:
+            self._emit()
+
+    def _add_long_line(self, line: str) -> None:
+        remaining = line
+        while remaining:
+            room = self._room()
+            if len(remaining) <= room:
+                self._append(remaining)
+                return
+            if room < self._max_len // 4 and self._parts != [self._reopen]:
+                self._emit()
+                continue
+            cut = remaining.rfind(" ", room // 2, room)
+            if cut <= 0:
+                cut = room
+            self._append(remaining[:cut])
+            self._emit()
+            remaining = remaining[cut:]
+            if self._fence is None:
+                remaining = remaining.lstrip(" ")
+
+    def _emit(self, final: bool = False) -> None:
+        body = "".join(self._parts).rstrip()
+        if self._parts == [self._reopen] or not body:
+            body = ""
+        elif self._fence is not None and not final:
+            body = f"{body}\n{self._fence}"
+        if body:
+            self._chunks.append(body)
+        self._parts = []
+        self._size = 0
+        self._break_index = 0
+        self._break_size = 0
+        if self._fence is not None and not final:
+            self._append(self._reopen)
+
+
 def _chunk_text(text: str, max_len: int = DISCORD_MESSAGE_SAFE_LIMIT) -> list[str]:
     if len(text) <= max_len:
         return [text]
+    return _MarkdownChunker(max_len).run(text)
 
-    remaining = text
-    chunks: list[str] = []
-    while len(remaining) > max_len:
-        split_at = remaining.rfind("\n", 0, max_len + 1)
-        if split_at < max_len // 2:
-            split_at = remaining.rfind(" ", 0, max_len + 1)
-        if split_at < max_len // 2:
-            split_at = max_len
 
-        chunk = remaining[:split_at].rstrip()
-        if not chunk:
-            chunk = remaining[:max_len]
-            split_at = max_len
-        chunks.append(chunk)
-        remaining = remaining[split_at:].lstrip()
+def _conversation_key(channel_id: int, guild_id: int | None) -> str:
+    return f"guild:{guild_id}:channel:{channel_id}" if guild_id is not None else f"dm:{channel_id}"
 
-    if remaining:
-        chunks.append(remaining)
-    return chunks
 
+def build_discord_client(settings: Settings, shard_plan: ShardPlan | None = None) -> discord.Client:
+    intents = discord.Intents.default()
+    intents.message_content = True
 
-async def _reply_in_chunks(message: discord.Message, text: str) -> None:
-    content = text or ""
-    for chunk in _chunk_text(content):
-        await message.reply(chunk, mention_author=False)
+    plan = shard_plan or ShardPlan()
+    client: discord.Client
+    if plan.sharded:
+        client = discord.AutoShardedClient(
+            intents=intents,
+            shard_count=plan.shard_count,
+            shard_ids=list(plan.shard_ids),
+        )
+    else:
+        client = discord.Client(intents=intents)
+    codex = CodexClient(settings, plan)
+    scheduler = ConversationScheduler(settings.codex_max_concurrency)
+    admission = AdmissionController(
+        user_rate_per_min=settings.codex_user_rate_per_min,
+        user_burst=settings.codex_user_burst,
+        guild_rate_per_min=settings.codex_guild_rate_per_min,
+        guild_burst=settings.codex_guild_burst,
+        max_queue_depth=settings.codex_queue_max_depth,
+    )
+    soul_cache = SoulCache(settings.soul_path, settings.content_cache_check_sec)
+    skills_cache = SkillCardsCache(None, settings.content_cache_check_sec)
+    single_flight: SingleFlight[CodexReply] = SingleFlight()
+    reply_cache = ReplyCache(settings.codex_reply_cache_ttl_sec, settings.codex_reply_cache_max_entries)
+    recorder: TraceRecorder | None = None
+    if settings.trace_path is not None:
+        recorder = TraceRecorder(settings.trace_path)
+        atexit.register(recorder.flush)
+    # Exposed for the replay tool, which reads back its own trace.
+    client.trace_recorder = recorder  # type: ignore[attr-defined]
+    outbound = OutboundDispatcher(
+        max_len=DISCORD_MESSAGE_SAFE_LIMIT,
+        attachment_threshold=settings.discord_attachment_threshold_chars,
+        max_attempts=settings.discord_send_max_attempts,
+    )
 
+    configure_json_logs(settings.metrics_json_logs)
+    REGISTRY.callback(
+        "openclaw_scheduler_running",
+        "Codex jobs holding a concurrency slot.",
+        "gauge",
+        lambda: scheduler.running,
+    )
+    REGISTRY.callback(
+        "openclaw_scheduler_pending",
+        "Codex jobs waiting for a lane or slot.",
+        "gauge",
+        lambda: scheduler.pending,
+    )
+    REGISTRY.callback(
+        "openclaw_scheduler_waiting_flows",
+        "Distinct users with a Codex job waiting for a slot.",
+        "gauge",
+        lambda: scheduler.waiting_flows,
+    )
+    REGISTRY.callback(
+        "openclaw_singleflight_in_flight",
+        "Distinct requests currently running.",
+        "gauge",
+        single_flight.in_flight,
+    )
+    REGISTRY.callback(
+        "openclaw_singleflight_coalesced_total",
+        "Requests that joined an identical in-flight run.",
+        "counter",
+        lambda: single_flight.coalesced,
+    )
+    REGISTRY.callback("openclaw_reply_cache_hits_total", "Reply cache hits.", "counter", lambda: reply_cache.hits)
+    REGISTRY.callback("openclaw_reply_cache_misses_total", "Reply cache misses.", "counter", lambda: reply_cache.misses)
+    REGISTRY.callback("openclaw_reply_cache_entries", "Reply cache size.", "gauge", lambda: len(reply_cache))
+    REGISTRY.callback(
+        "openclaw_outbound_pending",
+        "Replies queued or sending on per-channel lanes.",
+        "gauge",
+        lambda: outbound.pending,
+    )
 
-def build_discord_client(settings: Settings) -> discord.Client:
-    intents = discord.Intents.default()
-    intents.message_content = True
+    async def send_reply(message: discord.Message, text: str, placeholder: discord.Message | None = None) -> None:
+        try:
+            await outbound.send_reply(message, text, _chunk_text, placeholder=placeholder)
+        except (discord.HTTPException, discord.RateLimited):
+            logger.exception("Failed to deliver reply in channel %s", message.channel.id)
 
-    client = discord.Client(intents=intents)
-    codex = CodexClient(settings)
-    skill_cards = load_skill_cards()
-    skills_context = format_skill_cards_for_prompt(skill_cards)
+    shutdown_tasks: list[asyncio.Task[None]] = []
+
+    async def shutdown(signame: str) -> None:
+        logger.info("Received %s; draining before shutdown", signame)
+        try:
+            await codex.shutdown(settings.codex_drain_timeout_sec)
+        except Exception:  # noqa: BLE001
+            logger.exception("Drain failed")
+        if recorder is not None:
+            recorder.flush()
+        await client.close()
+
+    def on_signal(signum: int) -> None:
+        # A second signal during the drain is ignored; the service manager escalates on its own.
+        if not shutdown_tasks:
+            shutdown_tasks.append(asyncio.ensure_future(shutdown(signal.Signals(signum).name)))
 
     @client.event
-    async def on_ready() -> None:
-        logger.info("Connected as %s", client.user)
+    async def setup_hook() -> None:
+        codex.start_background_tasks()
+        if recorder is not None:
+            recorder.start()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, on_signal, signum)
+        if settings.metrics_port:
+            # Keep a reference on the client so the listening server is not garbage collected.
+            client.metrics_server = await start_metrics_server(  # type: ignore[attr-defined]
+                settings.metrics_host,
+                settings.metrics_port,
+            )
 
     @client.event
-    async def on_message(message: discord.Message) -> None:
-        if message.author.bot:
+    async def on_ready() -> None:
+        if plan.sharded:
+            logger.info("Connected as %s (shards %s of %d)", client.user, list(plan.shard_ids), plan.shard_count)
+        else:
+            logger.info("Connected as %s", client.user)
+
+    async def on_typing(channel: discord.abc.Messageable, user: discord.abc.User, when: object) -> None:
+        # Typing usually means a message is coming; warm up its conversation in the meantime.
+        if user.bot or codex.draining:
             return
+        channel_id = getattr(channel, "id", None)
+        if channel_id is None:
+            return
+        if settings.allowed_channel_ids and channel_id not in settings.allowed_channel_ids:
+            return
+        guild = getattr(channel, "guild", None)
+        conversation_key = _conversation_key(channel_id, guild.id if guild is not None else None)
+        if not plan.owns(conversation_key):
+            return
+        # Re-reads SOUL.md and the skill cards now if they changed, instead of on the message.
+        soul_cache.get()
+        skills_cache.get()
+        await codex.prewarm(conversation_key)
+
+    if settings.codex_prewarm:
+        client.event(on_typing)
 
+    async def handle_message(message: discord.Message, trace: dict[str, object]) -> None:
+        # Sets trace["outcome"] for every message it answers; on_message counts and records it.
         if settings.allowed_channel_ids and message.channel.id not in settings.allowed_channel_ids:
             return
 
-        text = message.content.strip()
+        text, bypass_cache = split_fresh_command(message.content)
         if not text:
             return
 
-        soul = load_soul(settings.soul_path)
-        soul_excerpt = soul[:1200]
+        conversation_key = _conversation_key(
+            message.channel.id,
+            message.guild.id if message.guild is not None else None,
+        )
+        trace.update(
+            conv=trace_id(conversation_key),
+            user=trace_id(message.author.id),
+            guild=trace_id(message.guild.id) if message.guild is not None else None,
+            chars=len(text),
+            fresh=bypass_cache or None,
+        )
+
+        with span("soul_load"):
+            soul = soul_cache.get()
+        with span("skills_load"):
+            skills = skills_cache.get()
+
+        if codex.draining:
+            trace["outcome"] = "draining"
+            await send_reply(message, RESTARTING_TEXT)
+            return
 
-        skill_result = handle_skill_command(text, soul_excerpt, skill_cards)
+        skill_result = handle_skill_command(
+            text, soul.excerpt, skills.cards, skills_cache.selected, skills_cache.selections
+        )
         if skill_result.handled:
-            await _reply_in_chunks(message, skill_result.response or "")
+            trace["outcome"] = "skill_command"
+            await send_reply(message, skill_result.response or "")
             return
 
-        async with message.channel.typing():
-            try:
-                conversation_key = (
-                    f"guild:{message.guild.id}:channel:{message.channel.id}"
-                    if message.guild is not None
-                    else f"dm:{message.channel.id}"
-                )
-                result = await codex.generate_reply(
+        if not plan.owns(conversation_key):
+            # The gateway routes each guild to one shard; anything else is a misconfigured peer.
+            logger.warning("Ignoring message for %s owned by another shard process", conversation_key)
+            return
+        cache_key = request_key(conversation_key, text, f"{soul.digest}:{skills.digest}")
+        # Identical messages share this, so a replay can reproduce cache hits and coalescing.
+        trace["msg"] = trace_id(request_key(conversation_key, text, ""))
+        if reply_cache.enabled:
+            if bypass_cache:
+                reply_cache.bypassed += 1
+            else:
+                cached = reply_cache.get(cache_key)
+                if cached is not None:
+                    trace["outcome"] = "cache_hit"
+                    await send_reply(message, cached)
+                    return
+
+        decision = admission.check(
+            message.author.id,
+            message.guild.id if message.guild is not None else None,
+            scheduler.pending,
+        )
+        if not decision.allowed:
+            trace["outcome"] = "rejected"
+            await send_reply(message, decision.message)
+            return
+
+        with span("skills_select"):
+            skill_selection = skills_cache.select(skills, text, settings.codex_skills_budget_chars)
+
+        streamer: ReplyStreamer | None = None
+        if settings.discord_stream_replies:
+            streamer = ReplyStreamer(
+                message,
+                edit_interval_sec=settings.discord_stream_edit_interval_sec,
+                max_len=DISCORD_MESSAGE_SAFE_LIMIT,
+            )
+            await streamer.start()
+
+        def run_codex() -> Awaitable[CodexReply]:
+            queued_at = time.perf_counter()
+
+            def job() -> Awaitable[CodexReply]:
+                queue_wait = time.perf_counter() - queued_at
+                STAGE_SECONDS.observe(queue_wait, stage="queue_wait")
+                trace["queue_ms"] = round(queue_wait * 1000, 1)
+                return codex.generate_reply(
                     conversation_key=conversation_key,
-                    soul=soul,
-                    skills_context=skills_context,
+                    soul=soul.text,
+                    skills=skill_selection,
                     user_text=text,
+                    on_event=streamer.on_event if streamer is not None else None,
                 )
+
+            # Fair-share slots per author, so one busy user cannot crowd out everyone else;
+            # CODEX_USER_WEIGHTS gives some authors a bigger share.
+            return scheduler.run(
+                conversation_key,
+                job,
+                flow=f"user:{message.author.id}",
+                weight=settings.codex_user_weights.get(message.author.id, 1.0),
+            )
+
+        async with message.channel.typing():
+            try:
+                if bypass_cache or not settings.codex_coalesce_duplicates:
+                    reply, shared = await run_codex(), False
+                else:
+                    reply, shared = await single_flight.run(cache_key, run_codex)
+                if reply.ok and not shared:
+                    reply_cache.put(cache_key, reply.text)
+                result = reply.text
+                trace["outcome"] = "coalesced" if shared else ("ok" if reply.ok else "failed")
+                if not shared:
+                    trace.update(
+                        resume=reply.resumed,
+                        codex_ms=round(reply.codex_sec * 1000, 1) if reply.codex_sec is not None else None,
+                        exit=reply.exit_code,
+                        timed_out=reply.timed_out or None,
+                    )
             except Exception as exc:  # noqa: BLE001
                 logger.exception("Codex local request failed")
-                await _reply_in_chunks(message, f"Codex local request failed: {exc}")
-                return
+                result = f"Codex local request failed: {exc}"
+                trace["outcome"] = "error"
+
+        trace["reply_chars"] = len(result)
+        await send_reply(message, result, placeholder=streamer.stop() if streamer is not None else None)
 
-        await _reply_in_chunks(message, result)
+    @client.event
+    async def on_message(message: discord.Message) -> None:
+        if message.author.bot:
+            return
+        received_at = time.time()
+        started = time.perf_counter()
+        trace: dict[str, object] = {}
+        try:
+            await handle_message(message, trace)
+        finally:
+            outcome = trace.pop("outcome", None)
+            if outcome is not None:
+                MESSAGES.inc(outcome=outcome)
+                if recorder is not None:
+                    recorder.record(
+                        ts=round(received_at, 3),
+                        path=outcome,
+                        total_ms=round((time.perf_counter() - started) * 1000, 1),
+                        **trace,
+                    )
 
     return client
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Enough for the failure message shown to the user (which is cut at 3000 chars anyway).
+OUTPUT_TAIL_CHARS = 4000
+# Single event lines can be whole tool outputs; only their start is worth keeping.
+MAX_LINE_CHARS = 1000
+DRAIN_GRACE_SEC = 2.0
+OVERSIZED_LINE = b"[line longer than the stream limit skipped]\n"
+
+
+class OutputTail:
+    # The last `max_chars` of a stream, kept line by line so memory stays flat however much a
+    # run prints. Lines longer than `max_line_chars` are clipped before they are stored.
+    def __init__(self, max_chars: int = OUTPUT_TAIL_CHARS, max_line_chars: int = MAX_LINE_CHARS) -> None:
+        self._max_chars = max_chars
+        self._max_line_chars = max_line_chars
+        self._lines: deque[str] = deque()
+        self._chars = 0
+        self.total_lines = 0
+        self.dropped_lines = 0
+
+    def append(self, line: str) -> None:
+        if len(line) > self._max_line_chars:
+            line = f"{line[: self._max_line_chars]}… [{len(line) - self._max_line_chars} chars clipped]"
+        self._lines.append(line)
+        self._chars += len(line) + 1
+        self.total_lines += 1
+        while self._chars > self._max_chars and len(self._lines) > 1:
+            self._chars -= len(self._lines.popleft()) + 1
+            self.dropped_lines += 1
+
+    def text(self) -> str:
+        body = "\n".join(self._lines).strip()
+        if self.dropped_lines and body:
+            return f"[{self.dropped_lines} earlier lines omitted]\n{body}"
+        return body
+
+
+async def read_line(stream: asyncio.StreamReader) -> bytes:
+    # Like StreamReader.readline(), but a line over the stream's limit is read through and
+    # replaced by OVERSIZED_LINE instead of raising ValueError. b"" still means EOF.
+    oversized = False
+    while True:
+        try:
+            line = await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as exc:
+            line = exc.partial
+        except asyncio.LimitOverrunError as exc:
+            await stream.readexactly(exc.consumed)
+            oversized = True
+            continue
+        return OVERSIZED_LINE if oversized else line
+
+
+async def drain_lines(stream: asyncio.StreamReader, tail: OutputTail) -> None:
+    while True:
+        raw = await read_line(stream)
+        if not raw:
+            return
+        tail.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+
+
+async def finish_drain(task: asyncio.Task[None]) -> None:
+    # A grandchild can keep the pipe open after codex exits; do not wait on it forever.
+    try:
+        await asyncio.wait_for(task, timeout=DRAIN_GRACE_SEC)
+    except asyncio.TimeoutError:
+        pass
+    except Exception:  # noqa: BLE001
+        logger.exception("Reading Codex output failed")
@@ -18,16 +18,69 @@ class Settings:
     codex_base_args: tuple[str, ...]
     codex_model: str | None
     codex_timeout_sec: int
+    codex_idle_timeout_sec: int
+    codex_drain_timeout_sec: int
+    codex_retry_attempts: int
+    codex_hedge: bool
+    codex_hedge_model: str | None
+    codex_hedge_min_delay_sec: float
+    codex_prewarm: bool
+    codex_prewarm_threads: bool
+    codex_prewarm_max_threads: int
+    codex_prewarm_ttl_sec: int
     codex_workspace_root: Path
+    codex_workspace_mode: str
+    codex_workspaces_dir: Path
+    codex_workspace_pool_size: int
+    codex_workspace_idle_ttl_sec: int
     codex_enable_search: bool
     codex_use_full_auto: bool
     codex_session_ttl_sec: int
+    codex_session_sweep_interval_sec: float
+    codex_session_sweep_batch: int
     codex_session_store_path: Path
+    codex_session_store_backend: str
+    codex_session_db_path: Path
     codex_memory_dir: Path
     codex_session_max_turns: int
+    codex_memory_index_path: Path | None
+    codex_memory_top_k: int
+    codex_memory_context_chars: int
+    codex_skills_budget_chars: int
+    codex_memory_compaction: bool
+    codex_memory_archive_period: str
+    codex_memory_compress_after_days: int
+    codex_memory_retention_days: int
+    codex_memory_max_bytes: int
+    codex_memory_compact_interval_sec: int
     codex_sandbox: str | None
     codex_ask_for_approval: str | None
     codex_dangerous_bypass: bool
+    codex_max_concurrency: int
+    codex_queue_max_depth: int
+    codex_user_rate_per_min: int
+    codex_user_burst: int
+    codex_guild_rate_per_min: int
+    codex_guild_burst: int
+    codex_user_weights: dict[int, float]
+    codex_backend: str
+    codex_worker_args: tuple[str, ...]
+    codex_worker_pool_size: int
+    codex_worker_max_requests: int
+    discord_stream_replies: bool
+    discord_stream_edit_interval_sec: float
+    discord_attachment_threshold_chars: int
+    discord_send_max_attempts: int
+    discord_shard_count: int
+    discord_shard_processes: int
+    content_cache_check_sec: float
+    codex_coalesce_duplicates: bool
+    codex_reply_cache_ttl_sec: int
+    codex_reply_cache_max_entries: int
+    metrics_host: str
+    metrics_port: int
+    metrics_json_logs: bool
+    trace_path: Path | None
 
 
 def _parse_bool(raw: str | None, default: bool) -> bool:
@@ -56,6 +109,26 @@ def _parse_channel_ids(raw: str | None) -> frozenset[int]:
     return frozenset(values)
 
 
+def _parse_user_weights(raw: str | None) -> dict[int, float]:
+    # `USER_ID=WEIGHT,...`; users not listed weigh 1.
+    if not raw:
+        return {}
+    weights: dict[int, float] = {}
+    for chunk in raw.split(","):
+        stripped = chunk.strip()
+        if not stripped:
+            continue
+        user_id, _, weight = stripped.partition("=")
+        try:
+            value = float(weight)
+            weights[int(user_id)] = value
+        except ValueError as exc:
+            raise ValueError(f"Invalid entry in CODEX_USER_WEIGHTS (expected USER_ID=WEIGHT): {stripped}") from exc
+        if value <= 0:
+            raise ValueError(f"CODEX_USER_WEIGHTS weights must be > 0: {stripped}")
+    return weights
+
+
 def _parse_positive_int(raw: str | None, default: int, env_name: str) -> int:
     if raw is None:
         return default
@@ -68,6 +141,30 @@ def _parse_positive_int(raw: str | None, default: int, env_name: str) -> int:
     return value
 
 
+def _parse_non_negative_int(raw: str | None, default: int, env_name: str) -> int:
+    if raw is None:
+        return default
+    try:
+        value = int(raw.strip())
+    except ValueError as exc:
+        raise ValueError(f"Invalid integer in {env_name}: {raw}") from exc
+    if value < 0:
+        raise ValueError(f"{env_name} must be >= 0")
+    return value
+
+
+def _parse_positive_float(raw: str | None, default: float, env_name: str) -> float:
+    if raw is None:
+        return default
+    try:
+        value = float(raw.strip())
+    except ValueError as exc:
+        raise ValueError(f"Invalid number in {env_name}: {raw}") from exc
+    if value <= 0:
+        raise ValueError(f"{env_name} must be > 0")
+    return value
+
+
 def _parse_one_of(raw: str | None, allowed: frozenset[str], env_name: str) -> str | None:
     if raw is None:
         return None
@@ -110,6 +207,17 @@ def load_settings() -> Settings:
             f"CODEX_WORKSPACE_ROOT does not exist or is not a directory: {codex_workspace_root}"
         )
 
+    codex_workspace_mode = (
+        _parse_one_of(
+            os.getenv("CODEX_WORKSPACE_MODE"),
+            frozenset({"shared", "copy", "worktree"}),
+            "CODEX_WORKSPACE_MODE",
+        )
+        or "shared"
+    )
+    if codex_workspace_mode == "worktree" and not (codex_workspace_root / ".git").exists():
+        raise ValueError("CODEX_WORKSPACE_MODE=worktree needs CODEX_WORKSPACE_ROOT to be a git checkout")
+
     codex_model = os.getenv("CODEX_MODEL", "").strip() or None
     codex_sandbox = _parse_one_of(
         os.getenv("CODEX_SANDBOX"),
@@ -133,6 +241,35 @@ def load_settings() -> Settings:
         "CODEX_SESSION_MAX_TURNS",
     )
 
+    codex_max_concurrency = _parse_positive_int(
+        os.getenv("CODEX_MAX_CONCURRENCY"),
+        4,
+        "CODEX_MAX_CONCURRENCY",
+    )
+    codex_worker_args = tuple(shlex.split(os.getenv("CODEX_WORKER_ARGS", "app-server").strip() or "app-server"))
+
+    discord_shard_count = _parse_positive_int(os.getenv("DISCORD_SHARD_COUNT"), 1, "DISCORD_SHARD_COUNT")
+    discord_shard_processes = _parse_positive_int(
+        os.getenv("DISCORD_SHARD_PROCESSES"),
+        1,
+        "DISCORD_SHARD_PROCESSES",
+    )
+    if discord_shard_processes > discord_shard_count:
+        raise ValueError("DISCORD_SHARD_PROCESSES must be <= DISCORD_SHARD_COUNT")
+
+    metrics_port = _parse_non_negative_int(os.getenv("METRICS_PORT"), 0, "METRICS_PORT")
+    # Shard processes listen on consecutive ports starting at METRICS_PORT.
+    if metrics_port + discord_shard_processes - 1 > 65535:
+        raise ValueError("METRICS_PORT must be <= 65535 (including one port per shard process)")
+
+    codex_memory_index_path: Path | None = None
+    if _parse_bool(os.getenv("CODEX_MEMORY_INDEX"), True):
+        codex_memory_index_path = Path(
+            os.getenv("CODEX_MEMORY_INDEX_PATH", ".codex-memory-index.db"),
+        ).expanduser()
+
+    trace_path_raw = os.getenv("TRACE_PATH", "").strip()
+
     return Settings(
         discord_bot_token=discord_bot_token,
         soul_path=Path(os.getenv("SOUL_PATH", "SOUL.md")).expanduser(),
@@ -140,8 +277,54 @@ def load_settings() -> Settings:
         codex_command=codex_command,
         codex_base_args=codex_base_args,
         codex_model=codex_model,
-        codex_timeout_sec=_parse_positive_int(os.getenv("CODEX_TIMEOUT_SEC"), 240, "CODEX_TIMEOUT_SEC"),
+        codex_timeout_sec=_parse_positive_int(os.getenv("CODEX_TIMEOUT_SEC"), 900, "CODEX_TIMEOUT_SEC"),
+        codex_idle_timeout_sec=_parse_positive_int(
+            os.getenv("CODEX_IDLE_TIMEOUT_SEC"),
+            120,
+            "CODEX_IDLE_TIMEOUT_SEC",
+        ),
+        codex_drain_timeout_sec=_parse_non_negative_int(
+            os.getenv("CODEX_DRAIN_TIMEOUT_SEC"),
+            60,
+            "CODEX_DRAIN_TIMEOUT_SEC",
+        ),
+        codex_retry_attempts=_parse_positive_int(
+            os.getenv("CODEX_RETRY_ATTEMPTS"),
+            2,
+            "CODEX_RETRY_ATTEMPTS",
+        ),
+        codex_hedge=_parse_bool(os.getenv("CODEX_HEDGE"), False),
+        codex_hedge_model=os.getenv("CODEX_HEDGE_MODEL", "").strip() or None,
+        codex_hedge_min_delay_sec=_parse_positive_float(
+            os.getenv("CODEX_HEDGE_MIN_DELAY_SEC"),
+            10.0,
+            "CODEX_HEDGE_MIN_DELAY_SEC",
+        ),
+        codex_prewarm=_parse_bool(os.getenv("CODEX_PREWARM"), True),
+        codex_prewarm_threads=_parse_bool(os.getenv("CODEX_PREWARM_THREADS"), False),
+        codex_prewarm_max_threads=_parse_positive_int(
+            os.getenv("CODEX_PREWARM_MAX_THREADS"),
+            4,
+            "CODEX_PREWARM_MAX_THREADS",
+        ),
+        codex_prewarm_ttl_sec=_parse_positive_int(
+            os.getenv("CODEX_PREWARM_TTL_SEC"),
+            120,
+            "CODEX_PREWARM_TTL_SEC",
+        ),
         codex_workspace_root=codex_workspace_root,
+        codex_workspace_mode=codex_workspace_mode,
+        codex_workspaces_dir=Path(os.getenv("CODEX_WORKSPACES_DIR", ".codex-workspaces")).expanduser(),
+        codex_workspace_pool_size=_parse_non_negative_int(
+            os.getenv("CODEX_WORKSPACE_POOL_SIZE"),
+            2,
+            "CODEX_WORKSPACE_POOL_SIZE",
+        ),
+        codex_workspace_idle_ttl_sec=_parse_positive_int(
+            os.getenv("CODEX_WORKSPACE_IDLE_TTL_SEC"),
+            86400,
+            "CODEX_WORKSPACE_IDLE_TTL_SEC",
+        ),
         codex_enable_search=_parse_bool(os.getenv("CODEX_ENABLE_SEARCH"), True),
         codex_use_full_auto=_parse_bool(os.getenv("CODEX_USE_FULL_AUTO"), True),
         codex_session_ttl_sec=_parse_positive_int(
@@ -149,12 +332,144 @@ def load_settings() -> Settings:
             3600,
             "CODEX_SESSION_TTL_SEC",
         ),
+        codex_session_sweep_interval_sec=_parse_positive_float(
+            os.getenv("CODEX_SESSION_SWEEP_INTERVAL_SEC"),
+            30.0,
+            "CODEX_SESSION_SWEEP_INTERVAL_SEC",
+        ),
+        codex_session_sweep_batch=_parse_positive_int(
+            os.getenv("CODEX_SESSION_SWEEP_BATCH"),
+            32,
+            "CODEX_SESSION_SWEEP_BATCH",
+        ),
         codex_session_store_path=Path(
             os.getenv("CODEX_SESSION_STORE_PATH", ".codex-discord-sessions.json"),
         ).expanduser(),
+        codex_session_store_backend=_parse_one_of(
+            os.getenv("CODEX_SESSION_STORE_BACKEND"),
+            frozenset({"sqlite", "json"}),
+            "CODEX_SESSION_STORE_BACKEND",
+        )
+        or "sqlite",
+        codex_session_db_path=Path(
+            os.getenv("CODEX_SESSION_DB_PATH", ".codex-discord-sessions.db"),
+        ).expanduser(),
         codex_memory_dir=codex_memory_dir,
         codex_session_max_turns=codex_session_max_turns,
+        codex_memory_index_path=codex_memory_index_path,
+        codex_memory_top_k=_parse_positive_int(os.getenv("CODEX_MEMORY_TOP_K"), 5, "CODEX_MEMORY_TOP_K"),
+        codex_memory_context_chars=_parse_positive_int(
+            os.getenv("CODEX_MEMORY_CONTEXT_CHARS"),
+            2000,
+            "CODEX_MEMORY_CONTEXT_CHARS",
+        ),
+        codex_skills_budget_chars=_parse_positive_int(
+            os.getenv("CODEX_SKILLS_BUDGET_CHARS"),
+            4000,
+            "CODEX_SKILLS_BUDGET_CHARS",
+        ),
+        codex_memory_compaction=_parse_bool(os.getenv("CODEX_MEMORY_COMPACTION"), True),
+        codex_memory_archive_period=_parse_one_of(
+            os.getenv("CODEX_MEMORY_ARCHIVE_PERIOD"),
+            frozenset({"day", "month"}),
+            "CODEX_MEMORY_ARCHIVE_PERIOD",
+        )
+        or "month",
+        codex_memory_compress_after_days=_parse_non_negative_int(
+            os.getenv("CODEX_MEMORY_COMPRESS_AFTER_DAYS"),
+            30,
+            "CODEX_MEMORY_COMPRESS_AFTER_DAYS",
+        ),
+        codex_memory_retention_days=_parse_non_negative_int(
+            os.getenv("CODEX_MEMORY_RETENTION_DAYS"),
+            0,
+            "CODEX_MEMORY_RETENTION_DAYS",
+        ),
+        codex_memory_max_bytes=_parse_non_negative_int(
+            os.getenv("CODEX_MEMORY_MAX_BYTES"),
+            0,
+            "CODEX_MEMORY_MAX_BYTES",
+        ),
+        codex_memory_compact_interval_sec=_parse_positive_int(
+            os.getenv("CODEX_MEMORY_COMPACT_INTERVAL_SEC"),
+            3600,
+            "CODEX_MEMORY_COMPACT_INTERVAL_SEC",
+        ),
         codex_sandbox=codex_sandbox,
         codex_ask_for_approval=codex_ask_for_approval,
         codex_dangerous_bypass=codex_dangerous_bypass,
+        codex_max_concurrency=codex_max_concurrency,
+        codex_queue_max_depth=_parse_non_negative_int(
+            os.getenv("CODEX_QUEUE_MAX_DEPTH"),
+            0,
+            "CODEX_QUEUE_MAX_DEPTH",
+        ),
+        codex_user_rate_per_min=_parse_non_negative_int(
+            os.getenv("CODEX_USER_RATE_PER_MIN"),
+            0,
+            "CODEX_USER_RATE_PER_MIN",
+        ),
+        codex_user_burst=_parse_positive_int(os.getenv("CODEX_USER_BURST"), 3, "CODEX_USER_BURST"),
+        codex_guild_rate_per_min=_parse_non_negative_int(
+            os.getenv("CODEX_GUILD_RATE_PER_MIN"),
+            0,
+            "CODEX_GUILD_RATE_PER_MIN",
+        ),
+        codex_guild_burst=_parse_positive_int(os.getenv("CODEX_GUILD_BURST"), 10, "CODEX_GUILD_BURST"),
+        codex_user_weights=_parse_user_weights(os.getenv("CODEX_USER_WEIGHTS")),
+        codex_backend=_parse_one_of(
+            os.getenv("CODEX_BACKEND"),
+            frozenset({"exec", "worker"}),
+            "CODEX_BACKEND",
+        )
+        or "exec",
+        codex_worker_args=codex_worker_args,
+        codex_worker_pool_size=_parse_positive_int(
+            os.getenv("CODEX_WORKER_POOL_SIZE"),
+            codex_max_concurrency,
+            "CODEX_WORKER_POOL_SIZE",
+        ),
+        codex_worker_max_requests=_parse_positive_int(
+            os.getenv("CODEX_WORKER_MAX_REQUESTS"),
+            100,
+            "CODEX_WORKER_MAX_REQUESTS",
+        ),
+        discord_stream_replies=_parse_bool(os.getenv("DISCORD_STREAM_REPLIES"), False),
+        discord_stream_edit_interval_sec=_parse_positive_float(
+            os.getenv("DISCORD_STREAM_EDIT_INTERVAL_SEC"),
+            1.5,
+            "DISCORD_STREAM_EDIT_INTERVAL_SEC",
+        ),
+        discord_attachment_threshold_chars=_parse_non_negative_int(
+            os.getenv("DISCORD_ATTACHMENT_THRESHOLD_CHARS"),
+            8000,
+            "DISCORD_ATTACHMENT_THRESHOLD_CHARS",
+        ),
+        discord_send_max_attempts=_parse_positive_int(
+            os.getenv("DISCORD_SEND_MAX_ATTEMPTS"),
+            5,
+            "DISCORD_SEND_MAX_ATTEMPTS",
+        ),
+        discord_shard_count=discord_shard_count,
+        discord_shard_processes=discord_shard_processes,
+        content_cache_check_sec=_parse_positive_float(
+            os.getenv("CONTENT_CACHE_CHECK_SEC"),
+            2.0,
+            "CONTENT_CACHE_CHECK_SEC",
+        ),
+        codex_coalesce_duplicates=_parse_bool(os.getenv("CODEX_COALESCE_DUPLICATES"), True),
+        codex_reply_cache_ttl_sec=_parse_non_negative_int(
+            os.getenv("CODEX_REPLY_CACHE_TTL_SEC"),
+            0,
+            "CODEX_REPLY_CACHE_TTL_SEC",
+        ),
+        codex_reply_cache_max_entries=_parse_positive_int(
+            os.getenv("CODEX_REPLY_CACHE_MAX_ENTRIES"),
+            256,
+            "CODEX_REPLY_CACHE_MAX_ENTRIES",
+        ),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1",
+        metrics_port=metrics_port,
+        metrics_json_logs=_parse_bool(os.getenv("METRICS_JSON_LOGS"), False),
+        trace_path=Path(trace_path_raw).expanduser() if trace_path_raw else None,
     )
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+
+import discord
+
+from .metrics import DISCORD_SEND_RETRIES, DISCORD_SENDS, span
+
+logger = logging.getLogger(__name__)
+ATTACHMENT_FILENAME = "reply.md"
+ATTACHMENT_SUMMARY_CHARS = 300
+# Discord allows roughly 5 messages per 5 seconds per channel; pacing below that avoids most 429s.
+CHANNEL_BURST = 5
+CHANNEL_REFILL_PER_SEC = 1.0
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 30.0
+
+
+def summarize_for_attachment(text: str, limit: int = ATTACHMENT_SUMMARY_CHARS) -> str:
+    parts: list[str] = []
+    used = 0
+    in_fence = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            continue
+        if in_fence or not stripped:
+            # Summarize the first prose paragraph; code does not read well as a preview.
+            if parts:
+                break
+            continue
+        parts.append(stripped)
+        used += len(stripped) + 1
+        if used >= limit:
+            break
+    summary = " ".join(parts)
+    if len(summary) > limit:
+        summary = summary[: limit - 1].rstrip() + "…"
+    note = f"📎 Full reply attached as `{ATTACHMENT_FILENAME}` ({len(text):,} characters)."
+    return f"{summary}\n\n{note}" if summary else note
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float | None:
+    retry_after: float | None = None
+    if isinstance(exc, discord.RateLimited):
+        retry_after = exc.retry_after
+    elif isinstance(exc, discord.HTTPException):
+        if exc.status != 429 and exc.status < 500:
+            return None
+        retry_after = getattr(exc, "retry_after", None)
+    else:
+        return None
+    backoff = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2**attempt))
+    # Full jitter keeps several queued replies from retrying in lockstep.
+    delay = random.uniform(0, backoff)
+    return max(delay, float(retry_after)) if retry_after else delay
+
+
+class _ChannelLane:
+    __slots__ = ("lock", "tokens", "updated_at", "pending")
+
+    def __init__(self) -> None:
+        # asyncio.Lock wakes waiters in arrival order, so replies leave a channel FIFO and whole.
+        self.lock = asyncio.Lock()
+        self.tokens = float(CHANNEL_BURST)
+        self.updated_at = time.monotonic()
+        self.pending = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(float(CHANNEL_BURST), self.tokens + (now - self.updated_at) * CHANNEL_REFILL_PER_SEC)
+        self.updated_at = now
+
+    async def take_token(self) -> None:
+        while True:
+            self.refill(time.monotonic())
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / CHANNEL_REFILL_PER_SEC)
+
+
+class OutboundDispatcher:
+    def __init__(self, max_len: int, attachment_threshold: int, max_attempts: int) -> None:
+        self._max_len = max_len
+        self._attachment_threshold = attachment_threshold
+        self._max_attempts = max_attempts
+        self._lanes: dict[int, _ChannelLane] = {}
+
+    @property
+    def pending(self) -> int:
+        return sum(lane.pending for lane in self._lanes.values())
+
+    async def send_reply(
+        self,
+        message: discord.Message,
+        text: str,
+        chunker: Callable[[str, int], list[str]],
+        placeholder: discord.Message | None = None,
+    ) -> None:
+        content = text or ""
+        attachment: bytes | None = None
+        if self._attachment_threshold and len(content) > self._attachment_threshold:
+            attachment = content.encode("utf-8")
+            chunks = [summarize_for_attachment(content)]
+        else:
+            chunks = chunker(content, self._max_len) or [""]
+
+        steps: list[tuple[str, Callable[[], Awaitable[object]]]] = []
+        first = chunks[0] or "(empty reply)"
+        if placeholder is not None:
+            steps.append(("edit", lambda: self._edit_or_reply(message, placeholder, first, attachment)))
+        elif attachment is not None:
+            steps.append(("attachment", lambda: message.reply(first, file=_file(attachment), mention_author=False)))
+        else:
+            steps.append(("message", lambda: message.reply(first, mention_author=False)))
+        for chunk in chunks[1:]:
+            steps.append(("message", lambda chunk=chunk: message.reply(chunk, mention_author=False)))
+
+        with span("reply_send", chunks=len(chunks), attachment=attachment is not None):
+            await self._run_in_lane(message.channel.id, steps)
+
+    async def _edit_or_reply(
+        self,
+        message: discord.Message,
+        placeholder: discord.Message,
+        content: str,
+        attachment: bytes | None,
+    ) -> object:
+        try:
+            if attachment is not None:
+                return await placeholder.edit(content=content, attachments=[_file(attachment)])
+            return await placeholder.edit(content=content)
+        except discord.NotFound:
+            logger.warning("Streaming placeholder is gone; sending the reply instead")
+        if attachment is not None:
+            return await message.reply(content, file=_file(attachment), mention_author=False)
+        return await message.reply(content, mention_author=False)
+
+    def _prune_idle_lanes(self) -> None:
+        # Idle lanes are kept until their bucket refills, so a quick follow-up reply is still paced.
+        now = time.monotonic()
+        for channel_id, lane in list(self._lanes.items()):
+            if lane.pending:
+                continue
+            lane.refill(now)
+            if lane.tokens >= CHANNEL_BURST:
+                del self._lanes[channel_id]
+
+    async def _run_in_lane(
+        self,
+        channel_id: int,
+        steps: list[tuple[str, Callable[[], Awaitable[object]]]],
+    ) -> None:
+        lane = self._lanes.get(channel_id)
+        if lane is None:
+            self._prune_idle_lanes()
+            lane = _ChannelLane()
+            self._lanes[channel_id] = lane
+        lane.pending += 1
+        try:
+            async with lane.lock:
+                for kind, step in steps:
+                    await lane.take_token()
+                    await self._send_with_retry(kind, step)
+        finally:
+            lane.pending -= 1
+
+    async def _send_with_retry(self, kind: str, step: Callable[[], Awaitable[object]]) -> None:
+        attempt = 0
+        while True:
+            try:
+                await step()
+                DISCORD_SENDS.inc(kind=kind)
+                return
+            except (discord.RateLimited, discord.HTTPException) as exc:
+                attempt += 1
+                delay = _retry_delay(exc, attempt - 1)
+                if delay is None or attempt >= self._max_attempts:
+                    raise
+                reason = "rate_limited" if isinstance(exc, discord.RateLimited) or exc.status == 429 else "server_error"
+                DISCORD_SEND_RETRIES.inc(reason=reason)
+                logger.warning("Discord send failed (%s); retrying in %.1fs", exc, delay)
+                await asyncio.sleep(delay)
+
+
+def _file(data: bytes) -> discord.File:
+    # A fresh File per attempt: discord.File is consumed once its buffer has been read.
+    return discord.File(io.BytesIO(data), filename=ATTACHMENT_FILENAME)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+# Helpers for the `codex exec --json` event stream (one JSON object per stdout line).
+
+EventCallback = Callable[[dict[str, object]], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class CodexRun:
+    thread_id: str | None
+    last_message: str | None
+    exit_code: int | None
+    output: str
+    timed_out: bool = False
+    # Why the run failed, from stderr and structured error events only; never tool output.
+    error: str = ""
+
+
+def parse_event_line(line: str) -> dict[str, object] | None:
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        payload = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(payload, dict) or not isinstance(payload.get("type"), str):
+        return None
+    return payload
+
+
+def event_thread_id(event: dict[str, object]) -> str | None:
+    if event.get("type") != "thread.started":
+        return None
+    thread_id = event.get("thread_id")
+    if isinstance(thread_id, str) and thread_id:
+        return thread_id
+    return None
+
+
+def _event_item(event: dict[str, object]) -> dict[str, object] | None:
+    item = event.get("item")
+    if isinstance(item, dict):
+        return item
+    return None
+
+
+def agent_message_text(event: dict[str, object]) -> str | None:
+    if event.get("type") != "item.completed":
+        return None
+    item = _event_item(event)
+    if item is None or item.get("type") != "agent_message":
+        return None
+    text = item.get("text")
+    if isinstance(text, str) and text.strip():
+        return text.strip()
+    return None
+
+
+def event_error_message(event: dict[str, object]) -> str | None:
+    event_type = event.get("type")
+    if event_type == "turn.failed":
+        error = event.get("error")
+        message = error.get("message") if isinstance(error, dict) else None
+    elif event_type == "error":
+        message = event.get("message")
+    else:
+        return None
+    return message if isinstance(message, str) and message else None
+
+
+def _shorten(text: str, limit: int = 120) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
+
+
+def describe_progress(event: dict[str, object]) -> str | None:
+    event_type = event.get("type")
+    if event_type == "turn.started":
+        return "Thinking…"
+    if event_type == "turn.failed":
+        error = event.get("error")
+        message = error.get("message") if isinstance(error, dict) else None
+        return f"Turn failed: {_shorten(message)}" if isinstance(message, str) else "Turn failed."
+    if event_type == "error":
+        message = event.get("message")
+        return f"Error: {_shorten(message)}" if isinstance(message, str) else None
+    if event_type not in {"item.started", "item.completed"}:
+        return None
+
+    item = _event_item(event)
+    if item is None:
+        return None
+    item_type = item.get("type")
+    started = event_type == "item.started"
+    if item_type == "command_execution":
+        command = item.get("command")
+        if not isinstance(command, str):
+            return None
+        if started:
+            return f"Running `{_shorten(command, 80)}`"
+        exit_code = item.get("exit_code")
+        suffix = f" (exit {exit_code})" if isinstance(exit_code, int) and exit_code != 0 else ""
+        return f"Ran `{_shorten(command, 80)}`{suffix}"
+    if item_type == "web_search" and started:
+        query = item.get("query")
+        return f"Searching the web: {_shorten(query, 80)}" if isinstance(query, str) else "Searching the web"
+    if item_type == "file_change" and not started:
+        changes = item.get("changes")
+        paths = [
+            change.get("path")
+            for change in (changes if isinstance(changes, list) else [])
+            if isinstance(change, dict) and isinstance(change.get("path"), str)
+        ]
+        return f"Edited {', '.join(paths[:3])}" if paths else "Edited files"
+    if item_type == "mcp_tool_call" and started:
+        server = item.get("server")
+        tool = item.get("tool")
+        if isinstance(server, str) and isinstance(tool, str):
+            return f"Calling {server}.{tool}"
+        return None
+    if item_type == "reasoning" and not started:
+        text = item.get("text")
+        return _shorten(text) if isinstance(text, str) and text.strip() else None
+    return None
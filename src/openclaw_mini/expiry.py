@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import heapq
+
+
+class ExpiryQueue:
+    # Min-heap of (deadline, key). Rescheduling pushes a new entry and leaves the old one in
+    # place; stale entries are recognised against `_deadlines` and dropped when they surface.
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, str]] = []
+        self._deadlines: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._deadlines
+
+    def schedule(self, key: str, deadline: float) -> None:
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._rebuild()
+
+    def discard(self, key: str) -> None:
+        self._deadlines.pop(key, None)
+
+    def pop_due(self, now: float, limit: int) -> list[str]:
+        due: list[str] = []
+        while len(due) < limit:
+            self._drop_stale_head()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+        return due
+
+    def _drop_stale_head(self) -> None:
+        while self._heap:
+            deadline, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def _rebuild(self) -> None:
+        self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
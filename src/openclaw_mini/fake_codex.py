@@ -0,0 +1,230 @@
+"""Local stand-in for the `codex` CLI, for exercising openclaw-mini without a real Codex.
+
+Point CODEX_COMMAND at an executable that calls `main` (benchmarks/fake_codex.py is one).
+Supported invocations:
+
+    fake_codex.py [global flags] exec [flags] PROMPT                  new thread
+    fake_codex.py [global flags] exec resume THREAD_ID [flags] PROMPT resumed thread
+    fake_codex.py [global flags] app-server                           JSON-RPC worker (CODEX_BACKEND=worker)
+
+A prompt whose last line contains `[fake-codex ms=N exit=N reply=N]` takes that turn's duration,
+exit code and minimum reply size from it instead of the variables below; the replay tool
+uses this to reproduce recorded runs.
+
+Environment:
+    FAKE_CODEX_LATENCY_MS     median simulated model time per turn (default 200)
+    FAKE_CODEX_LATENCY_DIST   fixed | uniform | lognormal (default lognormal)
+    FAKE_CODEX_LATENCY_SIGMA  lognormal sigma (default 0.5)
+    FAKE_CODEX_FAILURE_RATE   probability a turn fails with a non-zero exit (default 0)
+    FAKE_CODEX_TOOL_EVENTS    command_execution items emitted per turn (default 2)
+    FAKE_CODEX_REPLY_CHARS    minimum reply size in characters (default 0)
+    FAKE_CODEX_APPROVALS      app-server only: command approvals requested per turn (default 0)
+    FAKE_CODEX_PID_DIR        if set, a <pid> file exists there while the process runs
+    FAKE_CODEX_SPAWN_LOG      if set, one line is appended per process start
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+DIRECTIVE_RE = re.compile(r"\[fake-codex ms=(\d+) exit=(\d+) reply=(\d+)\]")
+
+
+@dataclass(frozen=True)
+class TurnPlan:
+    latency_sec: float
+    exit_code: int
+    reply_chars: int
+
+
+def directive(latency_ms: float, exit_code: int, reply_chars: int) -> str:
+    return f"[fake-codex ms={round(latency_ms)} exit={exit_code} reply={reply_chars}]"
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    return float(raw) if raw else default
+
+
+def _latency_sec() -> float:
+    median = _env_float("FAKE_CODEX_LATENCY_MS", 200.0) / 1000.0
+    dist = os.getenv("FAKE_CODEX_LATENCY_DIST", "lognormal")
+    if dist == "fixed":
+        return median
+    if dist == "uniform":
+        return random.uniform(0.0, 2.0 * median)
+    return random.lognormvariate(0.0, _env_float("FAKE_CODEX_LATENCY_SIGMA", 0.5)) * median
+
+
+def _last_line(prompt: str) -> str:
+    return prompt.strip().splitlines()[-1] if prompt.strip() else ""
+
+
+def _plan_turn(prompt: str) -> TurnPlan:
+    # Only the user message (the last line) counts, not directives echoed back from memory.
+    match = DIRECTIVE_RE.search(_last_line(prompt))
+    if match:
+        latency_ms, exit_code, reply_chars = (int(value) for value in match.groups())
+        return TurnPlan(latency_ms / 1000.0, exit_code, reply_chars)
+    failed = random.random() < _env_float("FAKE_CODEX_FAILURE_RATE", 0.0)
+    return TurnPlan(_latency_sec(), 1 if failed else 0, int(_env_float("FAKE_CODEX_REPLY_CHARS", 0)))
+
+
+def _reply_text(prompt: str, min_chars: int) -> str:
+    text = f"fake-codex reply to: {DIRECTIVE_RE.sub('', _last_line(prompt)).strip()[:200]}"
+    if len(text) < min_chars:
+        filler = " ".join(f"word{i}" for i in range(min_chars // 6 + 1))
+        text = f"{text}\n\n{filler[: min_chars - len(text)]}"
+    return text
+
+
+def _send(payload: dict[str, object]) -> None:
+    sys.stdout.write(json.dumps(payload) + "\n")
+    sys.stdout.flush()
+
+
+def _simulate_turn(emit_item, prompt: str) -> tuple[int, str]:
+    plan = _plan_turn(prompt)
+    tool_events = int(_env_float("FAKE_CODEX_TOOL_EVENTS", 2))
+    step = plan.latency_sec / (tool_events + 1)
+    for index in range(tool_events):
+        item_id = f"cmd-{index}"
+        emit_item("started", {"id": item_id, "type": "command_execution", "command": f"echo step {index}"})
+        time.sleep(step)
+        emit_item("completed", {"id": item_id, "type": "command_execution", "command": f"echo step {index}", "exit_code": 0})
+    time.sleep(step)
+    if plan.exit_code:
+        return plan.exit_code, "simulated failure"
+    return 0, _reply_text(prompt, plan.reply_chars)
+
+
+def run_exec(argv: list[str]) -> int:
+    output_file: str | None = None
+    if "--output-last-message" in argv:
+        output_file = argv[argv.index("--output-last-message") + 1]
+    if "resume" in argv:
+        thread_id = argv[argv.index("resume") + 1]
+    else:
+        thread_id = str(uuid.uuid4())
+    prompt = argv[-1] if argv else ""
+
+    def emit_item(phase: str, item: dict[str, object]) -> None:
+        _send({"type": f"item.{phase}", "item": item})
+
+    _send({"type": "thread.started", "thread_id": thread_id})
+    _send({"type": "turn.started"})
+    exit_code, text = _simulate_turn(emit_item, prompt)
+    if exit_code:
+        _send({"type": "turn.failed", "error": {"message": text}})
+        print(f"fake_codex: {text}", file=sys.stderr)
+        return exit_code
+    emit_item("completed", {"id": "msg-0", "type": "agent_message", "text": text})
+    _send({"type": "turn.completed", "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}})
+    if output_file:
+        Path(output_file).write_text(text, encoding="utf-8")
+    return 0
+
+
+def _request_approval(turn_id: str, item_id: str, command: str) -> str:
+    # Asks the client to approve a command the way `codex app-server` does and waits for the
+    # answer; unrelated messages arriving meanwhile are ignored.
+    request_id = f"approval-{item_id}"
+    _send(
+        {
+            "id": request_id,
+            "method": "item/commandExecution/requestApproval",
+            "params": {"turnId": turn_id, "itemId": item_id, "command": command},
+        },
+    )
+    for raw in sys.stdin:
+        try:
+            message = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        if message.get("id") == request_id:
+            result = message.get("result")
+            decision = result.get("decision") if isinstance(result, dict) else None
+            return decision if isinstance(decision, str) else "error"
+    return "error"
+
+
+def run_app_server() -> int:
+    for raw in sys.stdin:
+        try:
+            message = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        method = message.get("method")
+        request_id = message.get("id")
+        params = message.get("params") or {}
+        if request_id is None:
+            continue
+        if method == "initialize":
+            _send({"id": request_id, "result": {"userAgent": "fake-codex"}})
+        elif method == "thread/start":
+            _send({"id": request_id, "result": {"thread": {"id": str(uuid.uuid4())}}})
+        elif method == "thread/resume":
+            _send({"id": request_id, "result": {"thread": {"id": params.get("threadId")}}})
+        elif method == "turn/start":
+            turn_id = str(uuid.uuid4())
+            prompt = "".join(part.get("text", "") for part in params.get("input", []))
+            _send({"id": request_id, "result": {"turn": {"id": turn_id, "status": "inProgress"}}})
+            _send({"method": "turn/started", "params": {"turn": {"id": turn_id}}})
+
+            def emit_item(phase: str, item: dict[str, object]) -> None:
+                camel = dict(item)
+                camel["type"] = {"command_execution": "commandExecution", "agent_message": "agentMessage"}[item["type"]]
+                if "exit_code" in camel:
+                    camel["exitCode"] = camel.pop("exit_code")
+                _send({"method": f"item/{phase}", "params": {"item": camel}})
+
+            for index in range(int(_env_float("FAKE_CODEX_APPROVALS", 0))):
+                item_id = f"approval-cmd-{index}"
+                command = f"rm -rf build-{index}"
+                emit_item("started", {"id": item_id, "type": "command_execution", "command": command})
+                decision = _request_approval(turn_id, item_id, command)
+                status = "declined" if decision == "decline" else "completed"
+                emit_item("completed", {"id": item_id, "type": "command_execution", "command": command, "status": status})
+            exit_code, text = _simulate_turn(emit_item, prompt)
+            if not exit_code:
+                emit_item("completed", {"id": str(uuid.uuid4()), "type": "agent_message", "text": text})
+                status: dict[str, object] = {"id": turn_id, "status": "completed"}
+            else:
+                status = {"id": turn_id, "status": "failed", "error": {"message": text}}
+            _send({"method": "turn/completed", "params": {"turn": status}})
+        else:
+            _send({"id": request_id, "error": {"code": -32601, "message": f"unknown method {method}"}})
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    spawn_log = os.getenv("FAKE_CODEX_SPAWN_LOG")
+    if spawn_log:
+        with open(spawn_log, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+    pid_dir = os.getenv("FAKE_CODEX_PID_DIR")
+    pid_file = Path(pid_dir) / str(os.getpid()) if pid_dir else None
+    if pid_file is not None:
+        pid_file.touch()
+    try:
+        if "app-server" in argv:
+            return run_app_server()
+        if "exec" in argv:
+            return run_exec(argv[argv.index("exec") + 1 :])
+        print(f"fake_codex: unsupported invocation: {argv}", file=sys.stderr)
+        return 2
+    finally:
+        if pid_file is not None:
+            pid_file.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
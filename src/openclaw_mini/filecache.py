@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Callable, Hashable
+from pathlib import Path
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def file_signature(path: Path) -> tuple[int, int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class CachedLoader(Generic[T]):
+    # Serves a built value from memory and only re-stats its sources once per check
+    # interval; the value is rebuilt when the source signature changes.
+    def __init__(
+        self,
+        signature: Callable[[], Hashable],
+        build: Callable[[], T],
+        check_interval_sec: float,
+    ) -> None:
+        self._signature = signature
+        self._build = build
+        self._check_interval_sec = check_interval_sec
+        self._value: T | None = None
+        self._current_signature: Hashable = None
+        self._next_check_at = 0.0
+
+    def get(self) -> T:
+        now = time.monotonic()
+        if self._value is not None and now < self._next_check_at:
+            return self._value
+        self._next_check_at = now + self._check_interval_sec
+        signature = self._signature()
+        if self._value is None or signature != self._current_signature:
+            self._value = self._build()
+            self._current_signature = signature
+        return self._value
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import random
+import re
+from collections import deque
+
+from .events import CodexRun
+
+RETRY_BASE_SEC = 1.0
+RETRY_MAX_SEC = 10.0
+# The hedge delay is only trusted once this many runs have been timed.
+MIN_SAMPLES = 20
+SAMPLE_WINDOW = 200
+# Failures that usually go away on their own: API rate limits and 5xx, dropped connections,
+# a worker process that died. Anything else (bad flags, auth) fails the same way again.
+_TRANSIENT_RE = re.compile(
+    r"rate.?limit|too many requests|overloaded|service unavailable|bad gateway|gateway timeout|"
+    r"internal server error|status(?: code)?:? ?(?:429|5\d\d)\b|"
+    r"stream (?:disconnected|error)|connection (?:reset|refused|closed|error)|econnreset|broken pipe|"
+    r"\btimed out\b|worker \d+ (?:exited|is not running)",
+    re.IGNORECASE,
+)
+
+
+def is_transient(run: CodexRun) -> bool:
+    # Timeouts are left to hedging: retrying one would double an already long wait. Only the
+    # error text is classified; tool output mentioning a 503 or a timeout flag is not a failure.
+    if run.timed_out or run.last_message or run.exit_code == 0:
+        return False
+    return bool(_TRANSIENT_RE.search(run.error))
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter, as for Discord sends, so failures in several channels do not retry in lockstep.
+    return random.uniform(0, min(RETRY_MAX_SEC, RETRY_BASE_SEC * (2**attempt)))
+
+
+class FirstOutputTracker:
+    # Recent times from starting a run to its first item event (reasoning, command, message).
+    def __init__(self, window: int = SAMPLE_WINDOW) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
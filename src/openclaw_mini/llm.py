@@ -2,51 +2,272 @@ from __future__ import annotations
 
 import atexit
 import asyncio
-import json
-import tempfile
+import logging
 import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 
+from .capture import OutputTail, drain_lines, finish_drain, read_line
 from .config import Settings
+from .events import CodexRun, EventCallback, agent_message_text, parse_event_line
+from .expiry import ExpiryQueue
+from .hedging import FirstOutputTracker, backoff_delay, is_transient
+from .memory_archive import MemoryCompactor
+from .memory_index import MemoryIndex, format_memory_hits
+from .metrics import (
+    CODEX_HEDGES,
+    CODEX_IN_FLIGHT,
+    CODEX_NONZERO_EXITS,
+    CODEX_RETRIES,
+    CODEX_RUNS,
+    CODEX_TIMEOUTS,
+    MEMORY_WRITE_BYTES,
+    PREWARM_THREADS,
+    REGISTRY,
+    SESSIONS_EXPIRED,
+    log_event,
+    span,
+)
+from .prompt import build_prompt, section_hashes, static_sections
+from .session import SessionRecord, Turn
+from .session_store import open_session_store
+from .sharding import ShardPlan
+from .skills import SkillSelection
+from .timeouts import LatencyHistory, RunWatch
+from .workers import CodexWorkerPool
+from .workspaces import WorkspaceError, WorkspaceManager, template_exclusions
+
+logger = logging.getLogger(__name__)
+# Single JSON event lines can carry whole tool outputs; keep the reader from choking on them.
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+STDERR_TAIL_CHARS = 2000
+# Time an interrupted run gets to deliver its "please resend" reply before shutdown moves on.
+INTERRUPT_GRACE_SEC = 5.0
+RESTARTING_TEXT = "♻️ Restarting right now; please send that again in a few seconds."
+INTERRUPTED_TEXT = "♻️ The bot restarted before Codex finished; please send that again."
+
+
+@dataclass(frozen=True)
+class CodexReply:
+    text: str
+    ok: bool
+    # How the Codex run went, for traces; unset when no run happened.
+    resumed: bool | None = None
+    exit_code: int | None = None
+    codex_sec: float | None = None
+    timed_out: bool = False
+
+
+@dataclass(frozen=True)
+class WarmThread:
+    thread_id: str
+    expires_at: float
 
 
 class CodexClient:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, shard_plan: ShardPlan | None = None) -> None:
         self._settings = settings
-        self._session_store_path = settings.codex_session_store_path
-        self._session_store: dict[str, dict[str, object]] = self._load_session_store()
-        atexit.register(self._archive_all_sessions_on_exit)
-
-    def _load_session_store(self) -> dict[str, dict[str, object]]:
-        path = self._session_store_path
-        if not path.exists():
-            return {}
-        try:
-            raw = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-        if not isinstance(raw, dict):
-            return {}
-        parsed: dict[str, dict[str, object]] = {}
-        for key, value in raw.items():
-            if not isinstance(key, str) or not isinstance(value, dict):
+        self._shard_plan = shard_plan or ShardPlan()
+        self._store = open_session_store(settings)
+        self._session_store: dict[str, SessionRecord] = self._store.load_all()
+        self._memory_index: MemoryIndex | None = None
+        if settings.codex_memory_index_path is not None:
+            self._memory_index = MemoryIndex(settings.codex_memory_index_path, settings.codex_memory_dir)
+        self._compactor: MemoryCompactor | None = None
+        if settings.codex_memory_compaction:
+            self._compactor = MemoryCompactor(
+                settings.codex_memory_dir,
+                granularity=settings.codex_memory_archive_period,
+                compress_after_days=settings.codex_memory_compress_after_days,
+                retention_days=settings.codex_memory_retention_days,
+                max_bytes=settings.codex_memory_max_bytes,
+                index=self._memory_index,
+                owns=self._shard_plan.owns if self._shard_plan.process_count > 1 else None,
+            )
+        self._background_tasks: set[asyncio.Task[object]] = set()
+        self._expiry = ExpiryQueue()
+        self._in_flight: dict[str, int] = {}
+        self._run_tasks: set[asyncio.Task[object]] = set()
+        self._draining = False
+        self._closed = False
+        self._first_output = FirstOutputTracker()
+        self._latency = LatencyHistory(float(settings.codex_idle_timeout_sec), float(settings.codex_timeout_sec))
+        self._hedges_running = 0
+        self._prewarming: set[str] = set()
+        # Insertion-ordered, so the first entry is the oldest when the budget is full.
+        self._warm_threads: dict[str, WarmThread] = {}
+        for conversation_key, record in self._session_store.items():
+            self._schedule_expiry(conversation_key, record)
+        if self._session_store:
+            # Threads of sessions still inside their TTL are resumed by the next message.
+            logger.info("Loaded %d sessions from the session store", len(self._session_store))
+        self._workspaces: WorkspaceManager | None = None
+        if settings.codex_workspace_mode != "shared":
+            self._workspaces = WorkspaceManager(
+                settings.codex_workspace_root,
+                settings.codex_workspaces_dir,
+                mode=settings.codex_workspace_mode,
+                pool_size=settings.codex_workspace_pool_size,
+                idle_ttl_sec=settings.codex_workspace_idle_ttl_sec,
+                exclude=template_exclusions(
+                    settings.codex_workspace_root,
+                    [
+                        settings.codex_workspaces_dir,
+                        settings.codex_memory_dir,
+                        settings.codex_session_store_path,
+                        settings.codex_session_db_path,
+                        *([settings.codex_memory_index_path] if settings.codex_memory_index_path else []),
+                        *([settings.trace_path] if settings.trace_path else []),
+                    ],
+                ),
+            )
+            workspaces = self._workspaces
+            REGISTRY.callback(
+                "openclaw_workspaces",
+                "Per-conversation Codex workspaces on disk.",
+                "gauge",
+                lambda: workspaces.active,
+            )
+            REGISTRY.callback(
+                "openclaw_workspace_spares",
+                "Prepared workspaces waiting for a new conversation.",
+                "gauge",
+                lambda: workspaces.spares,
+            )
+            REGISTRY.callback(
+                "openclaw_workspaces_created_total",
+                "Workspaces created from the template.",
+                "counter",
+                lambda: workspaces.created,
+            )
+            REGISTRY.callback(
+                "openclaw_workspaces_removed_total",
+                "Idle workspaces removed.",
+                "counter",
+                lambda: workspaces.removed,
+            )
+        self._worker_pool: CodexWorkerPool | None = None
+        if settings.codex_backend == "worker":
+            self._worker_pool = CodexWorkerPool(settings, self._build_worker_cmd())
+            pool = self._worker_pool
+            REGISTRY.callback(
+                "openclaw_worker_pool_size",
+                "Live Codex app-server workers.",
+                "gauge",
+                lambda: len(pool.workers),
+            )
+            REGISTRY.callback(
+                "openclaw_worker_pool_started_total",
+                "Codex app-server workers started.",
+                "counter",
+                lambda: pool.started,
+            )
+            REGISTRY.callback(
+                "openclaw_worker_pool_recycled_total",
+                "Codex app-server workers recycled.",
+                "counter",
+                lambda: pool.recycled,
+            )
+        REGISTRY.callback(
+            "openclaw_active_sessions",
+            "Conversations with a live session record.",
+            "gauge",
+            lambda: len(self._session_store),
+        )
+        # Fallback for exits that skip shutdown(), e.g. a crash in the event loop.
+        atexit.register(self._checkpoint_sessions)
+
+    def start_background_tasks(self) -> None:
+        self._spawn(self._memory_maintenance())
+        self._spawn(self._expiry_loop())
+        if self._workspaces is not None:
+            self._spawn(self._workspaces.maintain())
+
+    def _schedule_expiry(self, conversation_key: str, record: SessionRecord) -> None:
+        self._expiry.schedule(conversation_key, record.last_active_at + self._settings.codex_session_ttl_sec)
+
+    async def _expiry_loop(self) -> None:
+        while True:
+            try:
+                swept = await self._sweep_expired()
+            except Exception:  # noqa: BLE001
+                logger.exception("Session expiry sweep failed")
+                swept = 0
+            # A full batch means more sessions are already due; come back soon instead of waiting.
+            full = swept >= self._settings.codex_session_sweep_batch
+            await asyncio.sleep(0.1 if full else self._settings.codex_session_sweep_interval_sec)
+
+    async def _sweep_expired(self) -> int:
+        now = time.time()
+        due = self._expiry.pop_due(now, self._settings.codex_session_sweep_batch)
+        expired: list[tuple[str, SessionRecord]] = []
+        for conversation_key in due:
+            record = self._session_store.get(conversation_key)
+            if record is None:
+                continue
+            if self._in_flight.get(conversation_key):
+                # The running turn reschedules on completion; this covers runs that fail first.
+                self._expiry.schedule(conversation_key, now + self._settings.codex_session_sweep_interval_sec)
                 continue
-            parsed[key] = value
-        return parsed
-
-    def _save_session_store(self) -> None:
-        self._session_store_path.parent.mkdir(parents=True, exist_ok=True)
-        self._session_store_path.write_text(
-            json.dumps(self._session_store, ensure_ascii=True, indent=2),
-            encoding="utf-8",
+            if self._is_record_fresh(record):
+                self._schedule_expiry(conversation_key, record)
+                continue
+            self._session_store.pop(conversation_key, None)
+            expired.append((conversation_key, record))
+        if expired:
+            with span("archive", trigger="sweeper", sessions=len(expired)):
+                await asyncio.to_thread(self._archive_batch, expired, "ttl_expired")
+            SESSIONS_EXPIRED.inc(len(expired), trigger="sweeper")
+        return len(due)
+
+    def _archive_batch(self, records: list[tuple[str, SessionRecord]], reason: str) -> None:
+        for conversation_key, record in records:
+            try:
+                self._archive_and_delete(conversation_key, record, reason)
+            except Exception:  # noqa: BLE001
+                logger.exception("Failed to archive session %s", conversation_key)
+
+    async def _memory_maintenance(self) -> None:
+        # Backfill first so compaction never moves a file the backfill is still reading.
+        if self._memory_index is not None:
+            await asyncio.to_thread(self._memory_index.backfill)
+        if self._compactor is None:
+            return
+        while True:
+            active_files = {record.memory_file for record in self._session_store.values() if record.memory_file}
+            try:
+                with span("memory_compaction"):
+                    await asyncio.to_thread(self._compactor.run_once, active_files)
+            except Exception:  # noqa: BLE001
+                logger.exception("Memory compaction failed")
+            await asyncio.sleep(self._settings.codex_memory_compact_interval_sec)
+
+    def _spawn(self, coro: Awaitable[object]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _memory_context(self, conversation_key: str, user_text: str, resumed: bool) -> str:
+        if self._memory_index is None:
+            return ""
+        exclude_file: str | None = None
+        record = self._session_store.get(conversation_key)
+        if resumed and record is not None:
+            # The live session is already in the resumed thread's context.
+            exclude_file = record.memory_file
+        hits = await asyncio.to_thread(
+            self._memory_index.search,
+            conversation_key,
+            user_text,
+            self._settings.codex_memory_top_k,
+            exclude_file,
         )
+        return format_memory_hits(hits, self._settings.codex_memory_context_chars)
 
-    def _is_record_fresh(self, record: dict[str, object]) -> bool:
-        last_active_at = record.get("last_active_at")
-        if not isinstance(last_active_at, (int, float)):
-            return False
-        return time.time() - float(last_active_at) <= float(self._settings.codex_session_ttl_sec)
+    def _is_record_fresh(self, record: SessionRecord) -> bool:
+        return time.time() - record.last_active_at <= float(self._settings.codex_session_ttl_sec)
 
     def _safe_slug(self, text: str) -> str:
         chars = [c.lower() if c.isalnum() else "-" for c in text]
@@ -61,8 +282,8 @@ class CodexClient:
         filename = f"{stamp}_{key_slug}.md"
         return self._settings.codex_memory_dir / filename
 
-    def _parse_iso_utc(self, value: object) -> datetime | None:
-        if not isinstance(value, str) or not value:
+    def _parse_iso_utc(self, value: str | None) -> datetime | None:
+        if not value:
             return None
         try:
             parsed = datetime.fromisoformat(value)
@@ -72,34 +293,27 @@ class CodexClient:
             parsed = parsed.replace(tzinfo=timezone.utc)
         return parsed.astimezone(timezone.utc)
 
-    def _ensure_session_memory_path(self, conversation_key: str, record: dict[str, object]) -> Path:
-        existing = record.get("memory_file")
-        if isinstance(existing, str) and existing:
-            return Path(existing)
-        started_at = self._parse_iso_utc(record.get("started_at_iso")) or datetime.now(timezone.utc)
+    def _ensure_session_memory_path(self, conversation_key: str, record: SessionRecord) -> Path:
+        if record.memory_file:
+            return Path(record.memory_file)
+        started_at = self._parse_iso_utc(record.started_at_iso) or datetime.now(timezone.utc)
         path = self._memory_file_path(conversation_key, started_at)
-        record["memory_file"] = str(path)
+        record.memory_file = str(path)
         return path
 
-    def _append_session_memory(self, conversation_key: str, record: dict[str, object], reason: str) -> None:
-        turns = record.get("turns")
-        if not isinstance(turns, list) or not turns:
+    def _append_session_memory(self, conversation_key: str, record: SessionRecord, reason: str) -> None:
+        if not record.turns:
             return
 
-        started_at = self._parse_iso_utc(record.get("started_at_iso"))
+        started_at = self._parse_iso_utc(record.started_at_iso)
         event_at = datetime.now(timezone.utc)
         memory_path = self._ensure_session_memory_path(conversation_key, record)
         memory_path.parent.mkdir(parents=True, exist_ok=True)
         file_exists = memory_path.exists()
 
-        written_turns_raw = record.get("written_turns")
-        written_turns = written_turns_raw if isinstance(written_turns_raw, int) else 0
-        if written_turns < 0:
-            written_turns = 0
-        if written_turns > len(turns):
-            written_turns = 0
-
+        indexed_turns: list[tuple[str, str, str]] = []
         with memory_path.open("a", encoding="utf-8") as f:
+            start_offset = f.tell()
             if not file_exists:
                 lines = [
                     "# Mini OpenClaw Session Memory",
@@ -107,114 +321,225 @@ class CodexClient:
                     f"- conversation_key: {conversation_key}",
                     f"- session_started_at_utc: {(started_at or event_at).isoformat()}",
                 ]
-                thread_id = record.get("thread_id")
-                if isinstance(thread_id, str) and thread_id:
-                    lines.append(f"- codex_thread_id: {thread_id}")
+                if record.thread_id:
+                    lines.append(f"- codex_thread_id: {record.thread_id}")
                 lines.extend(["", "## Transcript", ""])
                 f.write("\n".join(lines))
 
-            for turn in turns[written_turns:]:
-                if not isinstance(turn, dict):
-                    continue
-                role = turn.get("role")
-                text = turn.get("text")
-                at = turn.get("at")
-                if not isinstance(role, str) or not isinstance(text, str):
-                    continue
-                timestamp = at if isinstance(at, str) and at else "unknown-time"
-                f.write(f"### {role} ({timestamp})\n\n{text.strip()}\n\n")
-
-            if reason in {"ttl_expired", "process_exit"}:
+            for _, turn in record.turns_after(record.written_seq):
+                text = turn.text.strip()
+                f.write(f"### {turn.role} ({turn.at})\n\n{text}\n\n")
+                indexed_turns.append((turn.role, turn.at, text))
+
+            if reason == "ttl_expired":
                 f.write(f"- session_end_reason: {reason} at {event_at.isoformat()}\n")
+            MEMORY_WRITE_BYTES.inc(f.tell() - start_offset)
 
-        record["written_turns"] = len(turns)
+        record.written_seq = record.turn_seq
+        if self._memory_index is not None:
+            self._memory_index.add_turns(conversation_key, memory_path, indexed_turns)
 
-    def _archive_session(self, conversation_key: str, record: dict[str, object], reason: str) -> None:
+    def _archive_session(self, conversation_key: str, record: SessionRecord, reason: str) -> None:
         self._append_session_memory(conversation_key, record, reason)
 
-    def _archive_if_stale(self, conversation_key: str) -> None:
+    def _archive_and_delete(self, conversation_key: str, record: SessionRecord, reason: str) -> None:
+        self._archive_session(conversation_key, record, reason=reason)
+        self._store.delete(conversation_key, record.started_at_iso)
+
+    async def _archive_if_stale(self, conversation_key: str) -> None:
         record = self._session_store.get(conversation_key)
-        if not isinstance(record, dict):
-            return
-        if self._is_record_fresh(record):
+        if record is None or self._is_record_fresh(record):
             return
-        self._archive_session(conversation_key, record, reason="ttl_expired")
+        # The message being handled (or typed, for a prewarm) usually saves its new session
+        # before this archive finishes; the store delete is limited to this record's generation.
         self._session_store.pop(conversation_key, None)
-        self._save_session_store()
-
-    def _archive_all_sessions_on_exit(self) -> None:
-        changed = False
+        self._expiry.discard(conversation_key)
+        with span("archive", trigger="message"):
+            await asyncio.to_thread(self._archive_and_delete, conversation_key, record, "ttl_expired")
+        SESSIONS_EXPIRED.inc(trigger="message")
+
+    def _checkpoint_sessions(self) -> None:
+        # Fresh sessions stay in the store (saved on every turn, memory file already current) so
+        # the next process resumes their Codex threads; only expired ones are archived now.
+        if self._closed:
+            return
+        self._closed = True
+        kept = 0
         for conversation_key, record in list(self._session_store.items()):
-            if not isinstance(record, dict):
+            if self._is_record_fresh(record):
+                kept += 1
                 continue
-            self._archive_session(conversation_key, record, reason="process_exit")
+            try:
+                self._archive_and_delete(conversation_key, record, "ttl_expired")
+            except Exception:  # noqa: BLE001
+                logger.exception("Failed to archive session %s", conversation_key)
             self._session_store.pop(conversation_key, None)
-            changed = True
-        if changed:
-            self._save_session_store()
+        self._store.close()
+        if self._memory_index is not None:
+            self._memory_index.close()
+        logger.info("Checkpointed %d live sessions for the next start", kept)
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    async def shutdown(self, timeout: float) -> None:
+        # Stop taking work, let running turns finish until `timeout`, then interrupt the rest.
+        self._draining = True
+        for task in list(self._background_tasks):
+            task.cancel()
+        running = set(self._run_tasks)
+        if running:
+            logger.info("Waiting up to %.0fs for %d Codex runs to finish", timeout, len(running))
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            interrupted = [task for task in pending if task in self._run_tasks]
+            for task in interrupted:
+                task.cancel()
+            if interrupted:
+                logger.warning("Interrupted %d Codex runs at the drain deadline", len(interrupted))
+                await asyncio.wait(interrupted, timeout=INTERRUPT_GRACE_SEC)
+        if self._worker_pool is not None:
+            await self._worker_pool.close()
+        await asyncio.to_thread(self._checkpoint_sessions)
+
+    async def prewarm(self, conversation_key: str) -> None:
+        # Someone is typing: do the work their message would otherwise wait for. Archiving a
+        # stale session, claiming the workspace and loading or starting the Codex thread are
+        # all idempotent, so a message that arrives mid-prewarm just finds less to do.
+        if self._draining or self._in_flight.get(conversation_key) or conversation_key in self._prewarming:
+            return
+        self._prewarming.add(conversation_key)
+        try:
+            with span("prewarm"):
+                await self._archive_if_stale(conversation_key)
+                cwd: Path | None = None
+                if self._workspaces is not None:
+                    cwd = await self._workspaces.acquire(conversation_key)
+                    self._workspaces.release(conversation_key)
+                if self._worker_pool is not None and self._settings.codex_prewarm_threads:
+                    await self._prewarm_thread(conversation_key, cwd)
+        except Exception:  # noqa: BLE001
+            logger.exception("Prewarm for %s failed", conversation_key)
+        finally:
+            self._prewarming.discard(conversation_key)
 
-    def _resolve_active_thread_id(self, conversation_key: str) -> str | None:
-        self._archive_if_stale(conversation_key)
+    async def _prewarm_thread(self, conversation_key: str, cwd: Path | None) -> None:
+        assert self._worker_pool is not None
         record = self._session_store.get(conversation_key)
-        if not isinstance(record, dict):
-            return None
-        thread_id = record.get("thread_id")
-        if not isinstance(thread_id, str) or not thread_id:
+        if record is not None and record.thread_id:
+            # Load the live thread into an idle worker so the turn skips thread/resume.
+            await self._worker_pool.prewarm(record.thread_id, str(cwd) if cwd is not None else None)
+            return
+        now = time.time()
+        self._expire_warm_threads(now)
+        if conversation_key in self._warm_threads:
+            return
+        if len(self._warm_threads) >= self._settings.codex_prewarm_max_threads:
+            oldest = next(iter(self._warm_threads))
+            self._worker_pool.discard_warm(self._warm_threads.pop(oldest).thread_id)
+            PREWARM_THREADS.inc(result="evicted")
+        thread_id = await self._worker_pool.prewarm(None, str(cwd) if cwd is not None else None)
+        if thread_id is None:
+            return
+        if self._in_flight.get(conversation_key) or conversation_key in self._session_store:
+            # The message beat the warm-up; its run already has a thread.
+            self._worker_pool.discard_warm(thread_id)
+            return
+        self._warm_threads[conversation_key] = WarmThread(thread_id, now + self._settings.codex_prewarm_ttl_sec)
+        PREWARM_THREADS.inc(result="started")
+
+    def _expire_warm_threads(self, now: float) -> None:
+        for conversation_key, warm in list(self._warm_threads.items()):
+            if warm.expires_at <= now:
+                del self._warm_threads[conversation_key]
+                if self._worker_pool is not None:
+                    self._worker_pool.discard_warm(warm.thread_id)
+                PREWARM_THREADS.inc(result="expired")
+
+    def _take_warm_thread(self, conversation_key: str) -> str | None:
+        self._expire_warm_threads(time.time())
+        warm = self._warm_threads.pop(conversation_key, None)
+        if warm is None:
             return None
-        return thread_id
+        PREWARM_THREADS.inc(result="used")
+        return warm.thread_id
 
-    def _record_turn_pair(
+    async def _resolve_active_thread_id(self, conversation_key: str) -> str | None:
+        await self._archive_if_stale(conversation_key)
+        record = self._session_store.get(conversation_key)
+        return record.thread_id if record is not None else None
+
+    def _persist_record(self, conversation_key: str, record: SessionRecord) -> None:
+        # Persist memory on every turn so context is searchable before TTL expiry.
+        self._append_session_memory(conversation_key, record, reason="in_progress")
+        self._store.save(conversation_key, record)
+
+    def _seen_prompt_sections(self, conversation_key: str) -> dict[str, str]:
+        record = self._session_store.get(conversation_key)
+        return record.prompt_sections if record is not None else {}
+
+    async def _record_turn_pair(
         self,
         conversation_key: str,
         thread_id: str | None,
         user_text: str,
         assistant_text: str,
+        prompt_hashes: dict[str, str] | None = None,
     ) -> None:
         now_iso = datetime.now(timezone.utc).isoformat()
-        now_epoch = time.time()
 
         record = self._session_store.get(conversation_key)
-        if not isinstance(record, dict):
-            record = {}
-
-        if not isinstance(record.get("started_at_iso"), str):
-            record["started_at_iso"] = now_iso
-
-        if isinstance(thread_id, str) and thread_id:
-            record["thread_id"] = thread_id
-
-        turns = record.get("turns")
-        if not isinstance(turns, list):
-            turns = []
-
-        turns.append({"at": now_iso, "role": "user", "text": user_text})
-        turns.append({"at": now_iso, "role": "assistant", "text": assistant_text})
+        if record is None:
+            record = SessionRecord.new(self._settings.codex_session_max_turns, started_at_iso=now_iso)
 
-        max_turns = self._settings.codex_session_max_turns
-        if len(turns) > max_turns:
-            turns = turns[-max_turns:]
-
-        record["turns"] = turns
-        record["last_active_at"] = now_epoch
+        if thread_id:
+            if record.thread_id != thread_id:
+                record.prompt_sections = {}
+            record.thread_id = thread_id
+            if prompt_hashes is not None:
+                # Only set after a successful run, so the thread is known to hold these sections.
+                # Merged, since cards selected for earlier messages are still in the thread.
+                record.prompt_sections = {**record.prompt_sections, **prompt_hashes}
+
+        # The deque's maxlen drops the oldest turns in place once CODEX_SESSION_MAX_TURNS is reached.
+        record.append(Turn(at=now_iso, role="user", text=user_text))
+        record.append(Turn(at=now_iso, role="assistant", text=assistant_text))
+        record.last_active_at = time.time()
 
-        # Persist memory on every turn so context is searchable before TTL expiry.
-        self._append_session_memory(conversation_key, record, reason="in_progress")
         self._session_store[conversation_key] = record
-        self._save_session_store()
+        self._schedule_expiry(conversation_key, record)
+        with span("persist"):
+            await asyncio.to_thread(self._persist_record, conversation_key, record)
 
     @staticmethod
-    def _extract_thread_id(stdout_text: str) -> str | None:
-        for line in stdout_text.splitlines():
-            line = line.strip()
-            if not line.startswith("{"):
-                continue
-            try:
-                payload = json.loads(line)
-            except json.JSONDecodeError:
+    async def _read_event_stream(
+        proc: asyncio.subprocess.Process,
+        on_event: EventCallback | None,
+        tail: OutputTail,
+        watch: RunWatch,
+    ) -> None:
+        # Only the watch (thread id, latest agent message, last steps) and a bounded tail survive
+        # the stream. Raises TimeoutError once no event has arrived for the run's idle budget.
+        assert proc.stdout is not None
+        while True:
+            raw = await asyncio.wait_for(read_line(proc.stdout), timeout=watch.remaining())
+            if not raw:
+                break
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            event = parse_event_line(line)
+            if event is None:
+                tail.append(line)
                 continue
-            if payload.get("type") == "thread.started" and isinstance(payload.get("thread_id"), str):
-                return payload["thread_id"]
-        return None
+            watch.observe(event)
+            if not agent_message_text(event):
+                # Agent messages are kept whole by the watch; do not hold a second copy in the tail.
+                tail.append(line)
+            if on_event is not None:
+                try:
+                    await on_event(event)
+                except Exception:  # noqa: BLE001
+                    logger.exception("Codex event callback failed")
+        await proc.wait()
 
     def _build_codex_cmd_prefix(self) -> list[str]:
         cmd = [self._settings.codex_command]
@@ -227,35 +552,320 @@ class CodexClient:
             cmd.extend(["--ask-for-approval", self._settings.codex_ask_for_approval])
         return cmd
 
+    def _build_worker_cmd(self) -> list[str]:
+        cmd = self._build_codex_cmd_prefix()
+        if self._settings.codex_enable_search:
+            cmd.append("--search")
+        cmd.extend(self._settings.codex_worker_args)
+        return cmd
+
     async def generate_reply(
         self,
         conversation_key: str,
         soul: str,
-        skills_context: str,
+        skills: SkillSelection,
+        user_text: str,
+        on_event: EventCallback | None = None,
+    ) -> CodexReply:
+        if self._draining:
+            return CodexReply(text=RESTARTING_TEXT, ok=False)
+        task = asyncio.current_task()
+        assert task is not None
+        # Marks the conversation busy so the expiry sweeper leaves its record alone.
+        self._in_flight[conversation_key] = self._in_flight.get(conversation_key, 0) + 1
+        self._run_tasks.add(task)
+        try:
+            return await self._generate_reply(conversation_key, soul, skills, user_text, on_event)
+        except asyncio.CancelledError:
+            if not self._draining:
+                raise
+            # Cancelled by shutdown(): nothing was recorded, so the resent message starts clean.
+            task.uncancel()
+            return CodexReply(text=INTERRUPTED_TEXT, ok=False)
+        finally:
+            self._run_tasks.discard(task)
+            remaining = self._in_flight[conversation_key] - 1
+            if remaining:
+                self._in_flight[conversation_key] = remaining
+            else:
+                del self._in_flight[conversation_key]
+
+    async def _generate_reply(
+        self,
+        conversation_key: str,
+        soul: str,
+        skills: SkillSelection,
         user_text: str,
-    ) -> str:
-        memory_dir = self._settings.codex_memory_dir
-        memory_hint = (
-            "MEMORY POLICY:\n"
-            f"- Session memory files are stored in: {memory_dir}\n"
-            "- Do not search memory by default for every message.\n"
-            "- Search memory when the user explicitly asks to check memory, when the message depends on prior context, or when needed context is missing.\n"
-            "- If memory is relevant, use only facts directly related to the current request.\n"
-            "- If memory is not found or still unclear, ask a concise clarification question instead of guessing."
+        on_event: EventCallback | None,
+    ) -> CodexReply:
+        thread_id = await self._resolve_active_thread_id(conversation_key)
+        # A prewarmed thread is empty, so it gets the same full prompt as a new one.
+        warm_thread_id = self._take_warm_thread(conversation_key) if thread_id is None else None
+        with span("memory_search"):
+            memory_context = await self._memory_context(conversation_key, user_text, resumed=thread_id is not None)
+
+        with span("prompt_build"):
+            sections = static_sections(soul, skills, self._settings.codex_memory_dir)
+            seen_hashes = self._seen_prompt_sections(conversation_key) if thread_id else None
+            instructions = build_prompt(sections, memory_context, user_text, seen_hashes)
+            prompt_hashes = section_hashes(sections)
+
+        async def fresh_instructions() -> str:
+            # A backup run starts a new thread, so it needs the full prompt.
+            if thread_id is None:
+                return instructions
+            context = await self._memory_context(conversation_key, user_text, resumed=False)
+            return build_prompt(sections, context, user_text, None)
+
+        mode = "resume" if thread_id else "new"
+        CODEX_RUNS.inc(mode=mode)
+        CODEX_IN_FLIGHT.inc()
+        run_started = time.perf_counter()
+        try:
+            with span("codex_run", mode=mode, backend=self._settings.codex_backend):
+                run, base_thread_id = await self._run_with_retries(
+                    conversation_key,
+                    thread_id or warm_thread_id,
+                    instructions,
+                    fresh_instructions,
+                    on_event,
+                )
+        finally:
+            CODEX_IN_FLIGHT.dec()
+        codex_sec = time.perf_counter() - run_started
+
+        def reply(text: str, ok: bool) -> CodexReply:
+            return CodexReply(
+                text=text,
+                ok=ok,
+                resumed=thread_id is not None and base_thread_id is not None,
+                exit_code=run.exit_code,
+                codex_sec=codex_sec,
+                timed_out=run.timed_out,
+            )
+
+        if run.timed_out:
+            CODEX_TIMEOUTS.inc()
+        elif run.exit_code != 0:
+            CODEX_NONZERO_EXITS.inc()
+        log_event(
+            "codex_run",
+            conversation_key=conversation_key,
+            mode=mode,
+            exit_code=run.exit_code,
+            timed_out=run.timed_out,
+            prompt_chars=len(instructions),
         )
+        # Only answers are written to the session; a failed run leaves it as it was, so the
+        # transcript never holds error text and the user can simply send the message again.
+        if run.timed_out:
+            # Whatever Codex had said and done so far beats a bare "timed out".
+            if run.last_message:
+                return reply(f"{run.last_message}\n\n⏱️ {run.output}", ok=False)
+            return reply(f"⏱️ {run.output}", ok=False)
+
+        if run.last_message:
+            await self._record_turn_pair(
+                conversation_key,
+                run.thread_id or base_thread_id,
+                user_text,
+                run.last_message,
+                prompt_hashes=prompt_hashes,
+            )
+            return reply(run.last_message, ok=run.exit_code == 0)
+
+        if run.exit_code != 0:
+            return reply(f"Codex CLI failed (exit {run.exit_code}).\n{run.output[:3000]}", ok=False)
+
+        return reply(run.output[:3000] or "Codex returned no output.", ok=False)
+
+    async def _run_with_retries(
+        self,
+        conversation_key: str,
+        thread_id: str | None,
+        instructions: str,
+        fresh_instructions: Callable[[], Awaitable[str]],
+        on_event: EventCallback | None,
+    ) -> tuple[CodexRun, str | None]:
+        # Returns the run that answered and the thread it continued (None for a new thread).
+        attempt = 0
+        while True:
+            run, base_thread_id = await self._run_hedged(
+                conversation_key,
+                thread_id,
+                instructions,
+                fresh_instructions,
+                on_event,
+            )
+            attempt += 1
+            if attempt >= self._settings.codex_retry_attempts or not is_transient(run):
+                return run, base_thread_id
+            delay = backoff_delay(attempt - 1)
+            CODEX_RETRIES.inc()
+            log_event("codex_retry", conversation_key=conversation_key, attempt=attempt, exit_code=run.exit_code)
+            logger.warning(
+                "Codex run for %s failed (exit %s); retrying in %.1fs",
+                conversation_key,
+                run.exit_code,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    def _hedge_delay(self) -> float | None:
+        # A backup would edit the conversation's workspace alongside the slow run, and one in a
+        # scratch copy would leave its edits behind there if it won; workspaces rule hedging out.
+        if not self._settings.codex_hedge or self._workspaces is not None:
+            return None
+        # Backups run outside the scheduler's slots; this caps the extra Codex processes.
+        if self._hedges_running >= max(1, self._settings.codex_max_concurrency // 2):
+            return None
+        p95 = self._first_output.p95()
+        if p95 is None:
+            return None
+        return max(self._settings.codex_hedge_min_delay_sec, p95)
 
-        instructions = (
-            "You are Mini OpenClaw, a Discord assistant. Follow the SOUL.md guidance exactly.\n\n"
-            f"SOUL.md:\n{soul}\n\n"
-            f"SKILLS:\n{skills_context}\n\n"
-            f"{memory_hint}\n\n"
-            f"USER MESSAGE:\n{user_text}"
+    async def _run_hedged(
+        self,
+        conversation_key: str,
+        thread_id: str | None,
+        instructions: str,
+        fresh_instructions: Callable[[], Awaitable[str]],
+        on_event: EventCallback | None,
+    ) -> tuple[CodexRun, str | None]:
+        started = time.perf_counter()
+        first_output = asyncio.Event()
+
+        async def observe(event: dict[str, object]) -> None:
+            if not first_output.is_set() and str(event.get("type", "")).startswith("item."):
+                first_output.set()
+                self._first_output.observe(time.perf_counter() - started)
+            if on_event is not None:
+                await on_event(event)
+
+        primary = asyncio.ensure_future(self._run_turn(conversation_key, thread_id, instructions, observe))
+        backup: asyncio.Future[CodexRun] | None = None
+        try:
+            delay = self._hedge_delay()
+            if delay is None:
+                return await primary, thread_id
+            waiter = asyncio.ensure_future(first_output.wait())
+            try:
+                await asyncio.wait({primary, waiter}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if primary.done() or first_output.is_set() or self._hedge_delay() is None:
+                return await primary, thread_id
+
+            # Nothing from the primary after the usual p95: race a backup on a new thread.
+            # It does not stream, so the two runs never interleave their progress in one reply.
+            logger.info("No Codex output for %s after %.1fs; starting a backup run", conversation_key, delay)
+            self._hedges_running += 1
+            backup = asyncio.ensure_future(self._run_backup(conversation_key, fresh_instructions))
+            backup.add_done_callback(lambda _: self._release_hedge())
+            pending: set[asyncio.Future[CodexRun]] = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, backup):
+                    if task not in done or task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is not None:
+                        # A run that raised just loses; the other may still answer.
+                        if task is backup:
+                            logger.warning("Backup Codex run for %s failed: %r", conversation_key, error)
+                        continue
+                    run = task.result()
+                    if run.last_message and run.exit_code == 0:
+                        CODEX_HEDGES.inc(result="won" if task is backup else "lost")
+                        return run, (thread_id if task is primary else None)
+            CODEX_HEDGES.inc(result="failed")
+            # Neither answered: the primary's outcome stands, its exception included.
+            return primary.result(), thread_id
+        finally:
+            # The loser is stopped (its process killed) as soon as the other run has answered.
+            primary.cancel()
+            if backup is not None:
+                backup.cancel()
+
+    def _release_hedge(self) -> None:
+        self._hedges_running -= 1
+
+    async def _run_backup(self, conversation_key: str, fresh_instructions: Callable[[], Awaitable[str]]) -> CodexRun:
+        instructions = await fresh_instructions()
+        return await self._run_turn(
+            conversation_key,
+            None,
+            instructions,
+            None,
+            model=self._settings.codex_hedge_model,
         )
 
-        with tempfile.NamedTemporaryFile(prefix="codex-last-", suffix=".txt", delete=False) as f:
-            output_file = Path(f.name)
+    async def _run_turn(
+        self,
+        conversation_key: str,
+        thread_id: str | None,
+        instructions: str,
+        on_event: EventCallback | None,
+        model: str | None = None,
+    ) -> CodexRun:
+        watch = RunWatch(self._latency.budget(conversation_key))
+        run = await self._run_in_workspace(conversation_key, thread_id, instructions, on_event, model, watch)
+        if not run.timed_out and run.exit_code == 0:
+            self._latency.observe(conversation_key, watch)
+        return run
+
+    async def _run_in_workspace(
+        self,
+        conversation_key: str,
+        thread_id: str | None,
+        instructions: str,
+        on_event: EventCallback | None,
+        model: str | None,
+        watch: RunWatch,
+    ) -> CodexRun:
+        if self._workspaces is None:
+            return await self._run_in(None, thread_id, instructions, on_event, model, watch)
+        try:
+            with span("workspace"):
+                cwd = await self._workspaces.acquire(conversation_key)
+        except (OSError, WorkspaceError) as exc:
+            logger.warning("Could not prepare a workspace for %s: %s", conversation_key, exc)
+            return CodexRun(thread_id=thread_id, last_message=None, exit_code=1, output=str(exc))
+        try:
+            return await self._run_in(cwd, thread_id, instructions, on_event, model, watch)
+        finally:
+            self._workspaces.release(conversation_key)
+
+    async def _run_in(
+        self,
+        cwd: Path | None,
+        thread_id: str | None,
+        instructions: str,
+        on_event: EventCallback | None,
+        model: str | None,
+        watch: RunWatch,
+    ) -> CodexRun:
+        if self._worker_pool is not None:
+            return await self._worker_pool.run_turn(
+                thread_id,
+                instructions,
+                on_event,
+                watch,
+                cwd=str(cwd) if cwd is not None else None,
+                model=model,
+            )
+        return await self._run_exec(cwd, thread_id, instructions, on_event, model, watch)
 
-        thread_id = self._resolve_active_thread_id(conversation_key)
+    async def _run_exec(
+        self,
+        cwd: Path | None,
+        thread_id: str | None,
+        instructions: str,
+        on_event: EventCallback | None,
+        model: str | None,
+        watch: RunWatch,
+    ) -> CodexRun:
+        model = model or self._settings.codex_model
         if thread_id:
             # Reuse session if it is still fresh.
             cmd = self._build_codex_cmd_prefix()
@@ -275,9 +885,8 @@ class CodexClient:
                     "--json",
                 ],
             )
-            if self._settings.codex_model:
-                cmd.extend(["--model", self._settings.codex_model])
-            cmd.extend(["--output-last-message", str(output_file)])
+            if model:
+                cmd.extend(["--model", model])
             cmd.append(instructions)
         else:
             cmd = self._build_codex_cmd_prefix()
@@ -291,48 +900,55 @@ class CodexClient:
                 cmd.append("--search")
             cmd.extend(self._settings.codex_base_args)
             cmd.append("--json")
-            if self._settings.codex_model:
-                cmd.extend(["--model", self._settings.codex_model])
-            cmd.extend(["--output-last-message", str(output_file)])
+            if model:
+                cmd.extend(["--model", model])
             cmd.append(instructions)
 
-        try:
+        watch.begin()
+        with span("codex_spawn"):
             proc = await asyncio.create_subprocess_exec(
                 *cmd,
-                cwd=str(self._settings.codex_workspace_root),
+                cwd=str(cwd or self._settings.codex_workspace_root),
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LINE_LIMIT,
             )
-            try:
-                stdout, _ = await asyncio.wait_for(
-                    proc.communicate(),
-                    timeout=float(self._settings.codex_timeout_sec),
+        assert proc.stderr is not None
+        stdout_tail = OutputTail()
+        # Kept short so it fits in the failure reply ahead of the stdout tail.
+        stderr_tail = OutputTail(max_chars=STDERR_TAIL_CHARS)
+        stderr_task = asyncio.ensure_future(drain_lines(proc.stderr, stderr_tail))
+        try:
+            with span("codex_stream"):
+                await asyncio.wait_for(
+                    self._read_event_stream(proc, on_event, stdout_tail, watch),
+                    timeout=watch.budget.total_sec,
                 )
-            except asyncio.TimeoutError:
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return CodexRun(
+                thread_id=watch.thread_id,
+                last_message=watch.last_message,
+                exit_code=proc.returncode,
+                output=watch.timeout_summary(),
+                timed_out=True,
+            )
+        except BaseException:
+            # Cancelled, or reading failed: nobody will read this run any more, so do not
+            # leave codex working in the background.
+            if proc.returncode is None:
                 proc.kill()
-                await proc.communicate()
-                timed_out_text = f"Codex timed out after {self._settings.codex_timeout_sec}s."
-                self._record_turn_pair(conversation_key, thread_id, user_text, timed_out_text)
-                return timed_out_text
-
-            stdout_text = (stdout or b"").decode("utf-8", errors="replace").strip()
-            discovered_thread_id = self._extract_thread_id(stdout_text)
-            active_thread_id = discovered_thread_id or thread_id
-
-            file_text = ""
-            if output_file.exists():
-                file_text = output_file.read_text(encoding="utf-8", errors="replace").strip()
-            if file_text:
-                self._record_turn_pair(conversation_key, active_thread_id, user_text, file_text)
-                return file_text
-
-            if proc.returncode != 0:
-                failure_text = f"Codex CLI failed (exit {proc.returncode}).\n{stdout_text[:3000]}"
-                self._record_turn_pair(conversation_key, active_thread_id, user_text, failure_text)
-                return failure_text
-
-            fallback_text = stdout_text[:3000] or "Codex returned no output."
-            self._record_turn_pair(conversation_key, active_thread_id, user_text, fallback_text)
-            return fallback_text
+            await proc.wait()
+            raise
         finally:
-            output_file.unlink(missing_ok=True)
+            await finish_drain(stderr_task)
+
+        return CodexRun(
+            thread_id=watch.thread_id,
+            last_message=watch.last_message,
+            exit_code=proc.returncode,
+            # stderr first: that is where codex reports why it failed.
+            output="\n".join(part for part in (stderr_tail.text(), stdout_tail.text()) if part),
+            error="\n".join(part for part in (stderr_tail.text(), *watch.errors) if part),
+        )
@@ -1,26 +1,98 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
+import signal
 import sys
+from multiprocessing.connection import wait
 
 from .bot import build_discord_client
-from .config import load_settings
+from .config import Settings, load_settings
+from .sharding import ShardPlan, plans_for, shard_settings, split_session_store
 
+logger = logging.getLogger(__name__)
+# On top of the drain deadline, before a shard that is still running is killed.
+SHARD_STOP_GRACE_SEC = 30.0
 
-def run() -> None:
+
+def _configure_logging(prefix: str = "") -> None:
     logging.basicConfig(
         level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        format=f"%(asctime)s %(levelname)s {prefix}%(name)s: %(message)s",
     )
 
+
+def _run_client(settings: Settings, plan: ShardPlan) -> None:
+    client = build_discord_client(shard_settings(settings, plan), plan)
+    client.run(settings.discord_bot_token, log_handler=None)
+
+
+def _run_shard_process(settings: Settings, plan: ShardPlan) -> None:
+    _configure_logging(prefix=f"[{plan.tag}] ")
+    _run_client(settings, plan)
+
+
+def _supervise(settings: Settings) -> int:
+    # One process per shard group; each runs its own event loop, scheduler and session store.
+    plans = plans_for(settings)
+    split_session_store(settings, plans)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_run_shard_process, args=(settings, plan), name=f"openclaw-{plan.tag}")
+        for plan in plans
+    ]
+    stopping = False
+
+    def stop(signum: int, _frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.start()
+    logger.info(
+        "Started %d shard processes for %d shards",
+        len(processes),
+        settings.discord_shard_count,
+    )
+
+    # Any shard exiting takes the group down, so the service manager restarts it as a whole.
+    ready = wait([process.sentinel for process in processes])
+    exit_code = 0
+    for process in processes:
+        if process.sentinel in ready:
+            # The sentinel fires before the child is reaped; join to get its exit code.
+            process.join()
+        if process.exitcode is not None and process.exitcode != 0 and not stopping:
+            logger.error("Shard process %s exited with code %s", process.name, process.exitcode)
+            exit_code = 1
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(settings.codex_drain_timeout_sec + SHARD_STOP_GRACE_SEC)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    return exit_code if not stopping else 0
+
+
+def run() -> None:
+    _configure_logging()
+
     try:
         settings = load_settings()
     except Exception as exc:  # noqa: BLE001
         print(f"Configuration error: {exc}", file=sys.stderr)
         raise SystemExit(2) from exc
 
-    client = build_discord_client(settings)
-    client.run(settings.discord_bot_token, log_handler=None)
+    if settings.discord_shard_processes > 1:
+        raise SystemExit(_supervise(settings))
+    _run_client(settings, ShardPlan(settings.discord_shard_count))
 
 
 if __name__ == "__main__":
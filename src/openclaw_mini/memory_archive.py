@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from .memory_index import ARCHIVE_DIRNAME, MemoryIndex
+from .metrics import MEMORY_COMPACTION
+
+logger = logging.getLogger(__name__)
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".compaction.lock"
+SESSION_STAMP_FORMAT = "%Y-%m-%d_%H%M%S"
+# A session file is only merged once it has been quiet this long; covers the window where a
+# TTL rollover has dropped the record but is still appending the end-of-session trailer.
+FINALIZE_GRACE_SEC = 600
+
+
+@dataclass
+class ArchiveEntry:
+    file: str
+    sessions: int = 0
+    bytes: int = 0
+    compressed: bool = False
+
+
+@dataclass
+class CompactionStats:
+    merged: int = 0
+    compressed: int = 0
+    expired: int = 0
+    evicted: int = 0
+    archive_bytes: int = 0
+
+
+def period_of(day: date, granularity: str) -> str:
+    if granularity == "day":
+        return day.isoformat()
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def period_end(period: str) -> datetime:
+    if len(period) == 7:
+        year, month = (int(part) for part in period.split("-"))
+        return datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return datetime.fromisoformat(period).replace(tzinfo=timezone.utc) + timedelta(days=1)
+
+
+def _session_file_info(path: Path) -> tuple[datetime, str] | None:
+    # Session files are named `<YYYY-mm-dd_HHMMSS>_<conversation slug>.md`.
+    stamp, sep, slug = path.stem.partition("_")
+    time_part, sep2, slug = slug.partition("_")
+    if not sep or not sep2 or not slug:
+        return None
+    try:
+        started = datetime.strptime(f"{stamp}_{time_part}", SESSION_STAMP_FORMAT)
+    except ValueError:
+        return None
+    return started.replace(tzinfo=timezone.utc), slug
+
+
+def _read_conversation_key(path: Path) -> str | None:
+    try:
+        with path.open("r", encoding="utf-8", errors="replace") as f:
+            for _ in range(8):
+                line = f.readline()
+                if line.startswith("- conversation_key: "):
+                    return line.removeprefix("- conversation_key: ").strip() or None
+    except OSError:
+        return None
+    return None
+
+
+class ArchiveManifest:
+    # conversation_key -> period -> entry, so merging a session finds its conversation's archive
+    # for that period with two dict lookups rather than a directory scan.
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._entries: dict[str, dict[str, ArchiveEntry]] = {}
+        self._load()
+
+    def reload(self) -> None:
+        self._entries = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self._path.exists():
+            return
+        try:
+            raw = json.loads(self._path.read_text(encoding="utf-8"))
+        except Exception:
+            logger.exception("Ignoring unreadable memory archive manifest %s", self._path)
+            return
+        conversations = raw.get("conversations") if isinstance(raw, dict) else None
+        if not isinstance(conversations, dict):
+            return
+        for conversation_key, periods in conversations.items():
+            if not isinstance(periods, dict):
+                continue
+            for period, entry in periods.items():
+                if not isinstance(entry, dict) or not isinstance(entry.get("file"), str):
+                    continue
+                self._entries.setdefault(conversation_key, {})[period] = ArchiveEntry(
+                    file=entry["file"],
+                    sessions=int(entry.get("sessions", 0)),
+                    bytes=int(entry.get("bytes", 0)),
+                    compressed=bool(entry.get("compressed", False)),
+                )
+
+    def get(self, conversation_key: str, period: str) -> ArchiveEntry | None:
+        return self._entries.get(conversation_key, {}).get(period)
+
+    def put(self, conversation_key: str, period: str, entry: ArchiveEntry) -> None:
+        self._entries.setdefault(conversation_key, {})[period] = entry
+
+    def remove(self, conversation_key: str, period: str) -> None:
+        periods = self._entries.get(conversation_key)
+        if periods is None:
+            return
+        periods.pop(period, None)
+        if not periods:
+            del self._entries[conversation_key]
+
+    def items(self) -> list[tuple[str, str, ArchiveEntry]]:
+        return [
+            (conversation_key, period, entry)
+            for conversation_key, periods in self._entries.items()
+            for period, entry in periods.items()
+        ]
+
+    def total_bytes(self) -> int:
+        return sum(entry.bytes for _, _, entry in self.items())
+
+    def save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": 1,
+            "conversations": {
+                conversation_key: {period: asdict(entry) for period, entry in sorted(periods.items())}
+                for conversation_key, periods in sorted(self._entries.items())
+            },
+        }
+        tmp_path = self._path.with_name(f"{self._path.name}.tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=True, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+
+
+class MemoryCompactor:
+    def __init__(
+        self,
+        memory_dir: Path,
+        granularity: str,
+        compress_after_days: int,
+        retention_days: int,
+        max_bytes: int,
+        index: MemoryIndex | None = None,
+        owns: Callable[[str], bool] | None = None,
+    ) -> None:
+        self.memory_dir = memory_dir
+        self.archive_dir = memory_dir / ARCHIVE_DIRNAME
+        self.manifest = ArchiveManifest(self.archive_dir / MANIFEST_NAME)
+        self._granularity = granularity
+        self._compress_after_days = compress_after_days
+        self._retention_days = retention_days
+        self._max_bytes = max_bytes
+        self._index = index
+        # Shard processes only merge their own conversations: nobody else knows which are active.
+        self._owns = owns
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        # Shard processes share the archive; one compaction pass at a time across all of them.
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with (self.archive_dir / LOCK_NAME).open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def run_once(self, active_files: set[str], now: datetime | None = None) -> CompactionStats:
+        now = now or datetime.now(timezone.utc)
+        stats = CompactionStats()
+        if not self.memory_dir.exists():
+            return stats
+        with self._exclusive():
+            self.manifest.reload()
+            self._merge_finalized(active_files, now, stats)
+            self._compress_closed_periods(now, stats)
+            self._enforce_budgets(now, stats)
+            self.manifest.save()
+            stats.archive_bytes = self.manifest.total_bytes()
+        for action in ("merged", "compressed", "expired", "evicted"):
+            count = getattr(stats, action)
+            if count:
+                MEMORY_COMPACTION.inc(count, action=action)
+        if stats.merged or stats.compressed or stats.expired or stats.evicted:
+            logger.info(
+                "Memory compaction: merged=%d compressed=%d expired=%d evicted=%d archive_bytes=%d",
+                stats.merged,
+                stats.compressed,
+                stats.expired,
+                stats.evicted,
+                stats.archive_bytes,
+            )
+        return stats
+
+    def _merge_finalized(self, active_files: set[str], now: datetime, stats: CompactionStats) -> None:
+        cutoff = now.timestamp() - FINALIZE_GRACE_SEC
+        for path in sorted(self.memory_dir.glob("*.md")):
+            if str(path) in active_files:
+                continue
+            info = _session_file_info(path)
+            if info is None:
+                continue
+            try:
+                if path.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            conversation_key = _read_conversation_key(path)
+            if conversation_key is None or (self._owns is not None and not self._owns(conversation_key)):
+                continue
+            started_at, slug = info
+            period = period_of(started_at.date(), self._granularity)
+            entry = self.manifest.get(conversation_key, period)
+            if entry is None:
+                entry = ArchiveEntry(file=f"{slug}/{period}.md")
+            target = self.archive_dir / entry.file
+            target.parent.mkdir(parents=True, exist_ok=True)
+            content = path.read_bytes()
+            # gzip members concatenate, so appending to a compressed archive stays one valid stream.
+            opener = gzip.open if entry.compressed else open
+            with opener(target, "ab") as f:
+                if entry.sessions:
+                    f.write(b"\n")
+                f.write(content)
+            entry.sessions += 1
+            entry.bytes = target.stat().st_size
+            self.manifest.put(conversation_key, period, entry)
+            if self._index is not None:
+                self._index.relocate(path, target)
+            path.unlink(missing_ok=True)
+            stats.merged += 1
+
+    def _compress_closed_periods(self, now: datetime, stats: CompactionStats) -> None:
+        horizon = now - timedelta(days=self._compress_after_days)
+        for conversation_key, period, entry in self.manifest.items():
+            if entry.compressed or period_end(period) > horizon:
+                continue
+            source = self.archive_dir / entry.file
+            if not source.exists():
+                self.manifest.remove(conversation_key, period)
+                continue
+            target = source.with_name(f"{source.name}.gz")
+            tmp_path = target.with_name(f"{target.name}.tmp")
+            with source.open("rb") as src, gzip.open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, target)
+            if self._index is not None:
+                self._index.relocate(source, target)
+            source.unlink(missing_ok=True)
+            entry.file = f"{entry.file}.gz"
+            entry.compressed = True
+            entry.bytes = target.stat().st_size
+            stats.compressed += 1
+
+    def _enforce_budgets(self, now: datetime, stats: CompactionStats) -> None:
+        entries = sorted(self.manifest.items(), key=lambda item: period_end(item[1]))
+        if self._retention_days > 0:
+            horizon = now - timedelta(days=self._retention_days)
+            kept = []
+            for conversation_key, period, entry in entries:
+                if period_end(period) <= horizon:
+                    self._drop(conversation_key, period, entry)
+                    stats.expired += 1
+                else:
+                    kept.append((conversation_key, period, entry))
+            entries = kept
+        if self._max_bytes > 0:
+            total = sum(entry.bytes for _, _, entry in entries)
+            for conversation_key, period, entry in entries:
+                if total <= self._max_bytes:
+                    break
+                self._drop(conversation_key, period, entry)
+                total -= entry.bytes
+                stats.evicted += 1
+
+    def _drop(self, conversation_key: str, period: str, entry: ArchiveEntry) -> None:
+        path = self.archive_dir / entry.file
+        path.unlink(missing_ok=True)
+        if self._index is not None:
+            self._index.forget(path)
+        self.manifest.remove(conversation_key, period)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import gzip
+import logging
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+    text,
+    conversation_key UNINDEXED,
+    memory_file UNINDEXED,
+    role UNINDEXED,
+    at UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+-- FTS5 cannot index memory_file, so this maps each file to its memory_fts rowids; relocating
+-- or forgetting a file then touches only its own rows instead of scanning the whole index.
+CREATE TABLE IF NOT EXISTS memory_rows (
+    id INTEGER PRIMARY KEY,
+    memory_file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_rows_file ON memory_rows (memory_file);
+CREATE TABLE IF NOT EXISTS indexed_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+_WORD_RE = re.compile(r"[^\W_]{3,}", re.UNICODE)
+_TURN_RE = re.compile(r"^### (\w+) \(([^)]*)\)\n\n", re.MULTILINE)
+STOPWORDS = frozenset(
+    {
+        "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "her", "was",
+        "one", "our", "out", "has", "have", "this", "that", "with", "what", "when", "where", "which",
+        "who", "why", "how", "from", "they", "them", "then", "than", "there", "their", "about",
+        "into", "would", "could", "should", "will", "just", "your", "yours", "please", "does", "did",
+        "been", "were", "also", "some", "more", "very", "its", "let",
+    },
+)
+MAX_QUERY_TERMS = 24
+ARCHIVE_DIRNAME = "archive"
+BUSY_TIMEOUT_SEC = 30.0
+
+
+@dataclass(frozen=True)
+class MemoryHit:
+    memory_file: str
+    role: str
+    at: str
+    text: str
+
+
+def _query_terms(text: str) -> list[str]:
+    seen: dict[str, None] = {}
+    for match in _WORD_RE.finditer(text.lower()):
+        word = match.group(0)
+        if word in STOPWORDS:
+            continue
+        seen.setdefault(word, None)
+        if len(seen) >= MAX_QUERY_TERMS:
+            break
+    return list(seen)
+
+
+def parse_memory_file(content: str) -> tuple[str | None, list[tuple[str, str, str]]]:
+    conversation_key: str | None = None
+    for line in content.splitlines()[:8]:
+        if line.startswith("- conversation_key: "):
+            conversation_key = line.removeprefix("- conversation_key: ").strip()
+            break
+    turns: list[tuple[str, str, str]] = []
+    matches = list(_TURN_RE.finditer(content))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(content)
+        body = content[match.end() : end]
+        body = body.split("\n- session_end_reason:", 1)[0].strip()
+        if body:
+            turns.append((match.group(1), match.group(2), body))
+    return conversation_key, turns
+
+
+class MemoryIndex:
+    def __init__(self, db_path: Path, memory_dir: Path) -> None:
+        self._memory_dir = memory_dir
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Shard processes share this database; wait out their writes instead of failing.
+        self._conn = sqlite3.connect(
+            str(db_path),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=BUSY_TIMEOUT_SEC,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._conn.execute("SELECT 1 FROM memory_rows LIMIT 1").fetchone() is None:
+                # Databases from before memory_rows existed: map their rows once.
+                self._conn.execute("INSERT INTO memory_rows (id, memory_file) SELECT rowid, memory_file FROM memory_fts")
+
+    def _insert_turns(self, conversation_key: str, memory_file: str, turns: list[tuple[str, str, str]]) -> None:
+        # Caller holds the lock and an open transaction.
+        for role, at, text in turns:
+            row_id = self._conn.execute("INSERT INTO memory_rows (memory_file) VALUES (?)", (memory_file,)).lastrowid
+            self._conn.execute(
+                "INSERT INTO memory_fts (rowid, text, conversation_key, memory_file, role, at) VALUES (?, ?, ?, ?, ?, ?)",
+                (row_id, text, conversation_key, memory_file, role, at),
+            )
+
+    def _delete_file_rows(self, memory_file: str) -> None:
+        self._conn.execute(
+            "DELETE FROM memory_fts WHERE rowid IN (SELECT id FROM memory_rows WHERE memory_file = ?)",
+            (memory_file,),
+        )
+        self._conn.execute("DELETE FROM memory_rows WHERE memory_file = ?", (memory_file,))
+
+    def add_turns(
+        self,
+        conversation_key: str,
+        memory_file: Path,
+        turns: list[tuple[str, str, str]],
+    ) -> None:
+        # Also called with no turns so the recorded size tracks trailer writes and the file
+        # is not re-parsed by the next backfill.
+        size = memory_file.stat().st_size if memory_file.exists() else 0
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._insert_turns(conversation_key, str(memory_file), turns)
+            self._conn.execute(
+                "INSERT INTO indexed_files (path, size) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size",
+                (str(memory_file), size),
+            )
+
+    def relocate(self, old_path: Path, new_path: Path) -> None:
+        # Session files get merged into (possibly compressed) archives; keep their rows searchable.
+        size = new_path.stat().st_size if new_path.exists() else 0
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "UPDATE memory_fts SET memory_file = ? WHERE rowid IN (SELECT id FROM memory_rows WHERE memory_file = ?)",
+                (str(new_path), str(old_path)),
+            )
+            self._conn.execute(
+                "UPDATE memory_rows SET memory_file = ? WHERE memory_file = ?",
+                (str(new_path), str(old_path)),
+            )
+            self._conn.execute("DELETE FROM indexed_files WHERE path = ?", (str(old_path),))
+            self._conn.execute(
+                "INSERT INTO indexed_files (path, size) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size",
+                (str(new_path), size),
+            )
+
+    def forget(self, path: Path) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._delete_file_rows(str(path))
+            self._conn.execute("DELETE FROM indexed_files WHERE path = ?", (str(path),))
+
+    def backfill(self) -> int:
+        if not self._memory_dir.exists():
+            return 0
+        with self._lock:
+            known = dict(self._conn.execute("SELECT path, size FROM indexed_files").fetchall())
+        indexed = 0
+        paths = sorted(self._memory_dir.glob("*.md"))
+        paths.extend(sorted(self._memory_dir.glob(f"{ARCHIVE_DIRNAME}/*/*.md")))
+        paths.extend(sorted(self._memory_dir.glob(f"{ARCHIVE_DIRNAME}/*/*.md.gz")))
+        for path in paths:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            if known.get(str(path)) == size:
+                continue
+            try:
+                if path.suffix == ".gz":
+                    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+                        content = f.read()
+                else:
+                    content = path.read_text(encoding="utf-8", errors="replace")
+            except (OSError, EOFError):
+                continue
+            conversation_key, turns = parse_memory_file(content)
+            if conversation_key is None:
+                continue
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN")
+                self._delete_file_rows(str(path))
+                self._insert_turns(conversation_key, str(path), turns)
+                self._conn.execute(
+                    "INSERT INTO indexed_files (path, size) VALUES (?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET size = excluded.size",
+                    (str(path), size),
+                )
+            indexed += 1
+        if indexed:
+            logger.info("Indexed %d memory files from %s", indexed, self._memory_dir)
+        return indexed
+
+    def search(
+        self,
+        conversation_key: str,
+        query: str,
+        limit: int,
+        exclude_file: str | None = None,
+    ) -> list[MemoryHit]:
+        terms = _query_terms(query)
+        if not terms:
+            return []
+        match_expr = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT memory_file, role, at, text FROM memory_fts "
+                    "WHERE memory_fts MATCH ? AND conversation_key = ? AND memory_file != ? "
+                    "ORDER BY bm25(memory_fts) LIMIT ?",
+                    (match_expr, conversation_key, exclude_file or "", limit),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                logger.exception("Memory index query failed")
+                return []
+        return [MemoryHit(memory_file=row[0], role=row[1], at=row[2], text=row[3]) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def format_memory_hits(hits: list[MemoryHit], budget_chars: int) -> str:
+    lines: list[str] = []
+    used = 0
+    for hit in hits:
+        remaining = budget_chars - used
+        if remaining < 80:
+            break
+        header = f"- [{hit.at} {hit.role}] "
+        text = " ".join(hit.text.split())
+        if len(header) + len(text) > remaining:
+            text = text[: max(0, remaining - len(header) - 1)] + "…"
+        line = header + text
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
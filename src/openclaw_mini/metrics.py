@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def render(self) -> list[str]: ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+
+class CallbackMetric(_Metric):
+    # Exposes a value owned elsewhere (cache counters, queue depths) at scrape time.
+    def __init__(self, name: str, help_text: str, kind: str, read: Callable[[], float]) -> None:
+        super().__init__(name, help_text)
+        self.kind = kind
+        self._read = read
+
+    def render(self) -> list[str]:
+        try:
+            value = float(self._read())
+        except Exception:  # noqa: BLE001
+            logger.exception("Metric callback %s failed", self.name)
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text)
+        self._buckets = tuple(sorted(buckets))
+        self._series: dict[LabelKey, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self._buckets) + 1), [0.0, 0.0])
+                self._series[key] = series
+            counts, totals = series
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        with self._lock:
+            items = [(key, list(counts), list(totals)) for key, (counts, totals) in self._series.items()]
+        for key, counts, (total_sum, total_count) in items:
+            cumulative = 0
+            for bound, count in zip((*self._buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(total_count)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))  # type: ignore[return-value]
+
+    def callback(self, name: str, help_text: str, kind: str, read: Callable[[], float]) -> None:
+        with self._lock:
+            # Re-registering replaces the reader so a rebuilt client reports its own state.
+            self._metrics[name] = CallbackMetric(name, help_text, kind, read)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("openclaw_stage_seconds", "Time spent per pipeline stage.")
+CODEX_IN_FLIGHT = REGISTRY.gauge("openclaw_codex_in_flight", "Codex runs currently executing.")
+CODEX_RUNS = REGISTRY.counter("openclaw_codex_runs_total", "Codex runs by thread mode (new/resume).")
+CODEX_TIMEOUTS = REGISTRY.counter("openclaw_codex_timeouts_total", "Codex runs killed by timeout.")
+CODEX_NONZERO_EXITS = REGISTRY.counter("openclaw_codex_nonzero_exits_total", "Codex runs that exited non-zero.")
+PREWARM_THREADS = REGISTRY.counter(
+    "openclaw_prewarm_threads_total",
+    "Codex threads started ahead of a message, by outcome (started/used/expired/evicted).",
+)
+CODEX_RETRIES = REGISTRY.counter("openclaw_codex_retries_total", "Codex runs retried after a transient failure.")
+CODEX_HEDGES = REGISTRY.counter(
+    "openclaw_codex_hedges_total",
+    "Backup Codex runs started for a slow run, by result (won/lost/failed).",
+)
+STORE_WRITE_BYTES = REGISTRY.counter("openclaw_session_store_write_bytes_total", "Bytes written to the session store.")
+MEMORY_WRITE_BYTES = REGISTRY.counter("openclaw_memory_write_bytes_total", "Bytes appended to memory files.")
+MESSAGES = REGISTRY.counter("openclaw_messages_total", "Discord messages handled, by outcome.")
+DISCORD_SENDS = REGISTRY.counter("openclaw_discord_sends_total", "Discord messages sent or edited, by kind.")
+DISCORD_SEND_RETRIES = REGISTRY.counter("openclaw_discord_send_retries_total", "Discord send retries, by reason.")
+SESSIONS_EXPIRED = REGISTRY.counter(
+    "openclaw_sessions_expired_total",
+    "Sessions archived after their TTL, by trigger (sweeper/message).",
+)
+MEMORY_COMPACTION = REGISTRY.counter(
+    "openclaw_memory_compaction_total",
+    "Memory files merged, compressed, expired or evicted by compaction.",
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "openclaw_admission_rejected_total",
+    "Codex requests turned away, by reason (user_rate/guild_rate/queue_full).",
+)
+SKILL_SELECTIONS = REGISTRY.counter(
+    "openclaw_skill_selected_total",
+    "Skill cards included in a Codex prompt, by card.",
+)
+for _unlabeled in (CODEX_IN_FLIGHT, CODEX_TIMEOUTS, CODEX_NONZERO_EXITS, CODEX_RETRIES, MEMORY_WRITE_BYTES):
+    # Export zero from the start so rate() and alerts see the series before the first event.
+    _unlabeled.inc(0)
+
+_json_logs = False
+_json_logger = logging.getLogger("openclaw_mini.metrics.events")
+
+
+def configure_json_logs(enabled: bool) -> None:
+    global _json_logs
+    _json_logs = enabled
+
+
+def log_event(event: str, **fields: object) -> None:
+    if not _json_logs:
+        return
+    payload = {"event": event, "ts": round(time.time(), 3), **fields}
+    _json_logger.info(json.dumps(payload, ensure_ascii=True, default=str))
+
+
+@contextmanager
+def span(stage: str, **fields: object) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        log_event("span", stage=stage, duration_ms=round(elapsed * 1000, 3), **fields)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: MetricsRegistry) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        while True:
+            header = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            if header in {b"\r\n", b"\n", b""}:
+                break
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+        if len(parts) >= 2 and parts[0] == "GET" and path == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4", registry.render().encode("utf-8")
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body,
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(lambda r, w: _handle_http(r, w, registry), host, port)
+    logger.info("Metrics endpoint listening on http://%s:%d/metrics", host, port)
+    return server
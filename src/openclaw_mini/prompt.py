@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+from .memory_index import ARCHIVE_DIRNAME
+from .skills import SkillSelection
+
+PROMPT_INTRO = "You are Mini OpenClaw, a Discord assistant. Follow the SOUL.md guidance exactly."
+
+
+def memory_policy(memory_dir: Path) -> str:
+    return (
+        "MEMORY POLICY:\n"
+        f"- Session memory files are stored in: {memory_dir}\n"
+        f"- Older sessions are merged into {memory_dir / ARCHIVE_DIRNAME}/<conversation>/<period>.md; "
+        "`.md.gz` archives are gzip-compressed (use zgrep/zcat).\n"
+        "- Do not search memory by default for every message.\n"
+        "- The most relevant excerpts from earlier sessions, if any, are included below as RELEVANT MEMORY; check those first.\n"
+        "- Search memory files only when the user explicitly asks to check memory, or when the message depends on prior context that the excerpts do not cover.\n"
+        "- If memory is relevant, use only facts directly related to the current request.\n"
+        "- If memory is not found or still unclear, ask a concise clarification question instead of guessing."
+    )
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def static_sections(soul: str, skills: SkillSelection, memory_dir: Path) -> dict[str, str]:
+    # Each selected card is its own section, so a resumed thread is only sent cards it has not seen.
+    sections = {"soul": f"SOUL.md:\n{soul}", "skills": f"SKILLS:\n{skills.catalog}"}
+    for card in skills.cards:
+        sections[f"skill:{card.name}"] = f"SKILL CARD ({card.name}):\n{card.prompt_text}"
+    sections["policy"] = memory_policy(memory_dir)
+    return sections
+
+
+def section_hashes(sections: dict[str, str]) -> dict[str, str]:
+    return {name: _digest(body) for name, body in sections.items()}
+
+
+def build_prompt(
+    sections: dict[str, str],
+    memory_context: str,
+    user_text: str,
+    seen_hashes: dict[str, str] | None,
+) -> str:
+    # `seen_hashes` is what the resumed thread already holds; None means a fresh thread.
+    memory_section = f"RELEVANT MEMORY:\n{memory_context}\n\n" if memory_context else ""
+    user_section = f"USER MESSAGE:\n{user_text}"
+
+    if seen_hashes is None:
+        static = "\n\n".join(sections.values())
+        return f"{PROMPT_INTRO}\n\n{static}\n\n{memory_section}{user_section}"
+
+    hashes = section_hashes(sections)
+    changed = [name for name, digest in hashes.items() if seen_hashes.get(name) != digest]
+    if not changed:
+        return f"{memory_section}{user_section}"
+    updated = "\n\n".join(sections[name] for name in changed)
+    return (
+        "INSTRUCTIONS UPDATED: the sections below are new or replace their earlier versions in this thread.\n\n"
+        f"{updated}\n\n{memory_section}{user_section}"
+    )
@@ -0,0 +1,292 @@
+"""Replay a recorded traffic trace (TRACE_PATH) through the bot against a fake Codex.
+
+Each trace line becomes a synthetic Discord message, delivered at its recorded offset divided
+by --speed. Codex turns take their recorded duration (divided by --codex-speed), exit code and
+reply size, so the run reproduces the bursts, message sizes, resume/new mix and channel fan-out
+of the recorded traffic. Bot tuning (CODEX_MAX_CONCURRENCY, CODEX_BACKEND, admission limits, ...)
+comes from the environment as usual; session state, memory and Codex are swapped for throwaway
+copies in a temporary directory.
+
+Example:
+
+    openclaw-mini-replay traces.jsonl
+    CODEX_MAX_CONCURRENCY=8 openclaw-mini-replay traces.jsonl --speed 10 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import itertools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .fake_codex import directive
+from .traces import read_trace
+
+_message_ids = itertools.count(1)
+
+
+@dataclass
+class FakeUser:
+    id: int
+    bot: bool = False
+
+
+@dataclass
+class FakeGuild:
+    id: int
+
+
+class _Typing:
+    async def __aenter__(self) -> "_Typing":
+        return self
+
+    async def __aexit__(self, *exc: object) -> bool:
+        return False
+
+
+@dataclass
+class FakeChannel:
+    id: int
+
+    def typing(self) -> _Typing:
+        return _Typing()
+
+
+@dataclass
+class _Sent:
+    content: str | None
+    owner: "FakeMessage"
+
+    async def edit(self, content: str | None = None, **_: object) -> None:
+        self.content = content
+        self.owner.mark_output()
+
+
+@dataclass
+class FakeMessage:
+    # Just enough of discord.Message for on_message and the delivery path.
+    content: str
+    channel: FakeChannel
+    guild: FakeGuild | None
+    author: FakeUser
+    id: int = field(default_factory=lambda: next(_message_ids))
+    replies: list[_Sent] = field(default_factory=list)
+    first_output_at: float | None = None
+
+    def mark_output(self) -> None:
+        if self.first_output_at is None:
+            self.first_output_at = time.perf_counter()
+
+    async def reply(self, content: str | None = None, **_: object) -> _Sent:
+        self.mark_output()
+        sent = _Sent(content=content, owner=self)
+        self.replies.append(sent)
+        return sent
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(max(values, default=0.0), 1),
+    }
+
+
+def _numbers(entries: list[dict[str, object]], key: str) -> list[float]:
+    return [float(value) for entry in entries if isinstance(value := entry.get(key), (int, float))]
+
+
+def _profile(entries: list[dict[str, object]]) -> dict[str, object]:
+    runs = [entry for entry in entries if "resume" in entry]
+    return {
+        "messages": len(entries),
+        "paths": dict(Counter(str(entry.get("path")) for entry in entries).most_common()),
+        "resumed_share": round(sum(1 for entry in runs if entry["resume"]) / len(runs), 3) if runs else 0.0,
+        "latency_ms": _summary(_numbers(entries, "total_ms")),
+        "queue_ms": _summary(_numbers(entries, "queue_ms")),
+        "codex_ms": _summary(_numbers(entries, "codex_ms")),
+    }
+
+
+def _hex_id(value: object) -> int:
+    return int(str(value), 16) if value else 0
+
+
+def build_messages(entries: list[dict[str, object]], codex_speed: float) -> list[tuple[float, FakeMessage]]:
+    # Messages with the same `msg` hash get the same text, so cache hits and coalescing replay too.
+    start = float(entries[0]["ts"])  # type: ignore[arg-type]
+    contents: dict[object, str] = {}
+    messages = []
+    for index, entry in enumerate(entries):
+        if entry.get("path") == "skill_command":
+            content = "/ping"
+        else:
+            key = entry.get("msg") or f"unique-{index}"
+            content = contents.get(key, "")
+            if not content:
+                head = f"replayed message {index}"
+                if isinstance(entry.get("codex_ms"), (int, float)):
+                    exit_code = entry.get("exit") if isinstance(entry.get("exit"), int) else 0
+                    head = directive(
+                        float(entry["codex_ms"]) / codex_speed,  # type: ignore[arg-type]
+                        exit_code if exit_code >= 0 else 1,
+                        int(entry.get("reply_chars") or 0),  # type: ignore[call-overload]
+                    )
+                chars = int(entry.get("chars") or 0)  # type: ignore[call-overload]
+                content = head + " " + "x" * max(0, chars - len(head) - 1)
+                contents[key] = content
+            if entry.get("fresh"):
+                content = f"/fresh {content}"
+        guild = FakeGuild(id=_hex_id(entry["guild"])) if entry.get("guild") else None
+        message = FakeMessage(
+            content=content,
+            channel=FakeChannel(id=_hex_id(entry.get("conv"))),
+            guild=guild,
+            author=FakeUser(id=_hex_id(entry.get("user"))),
+        )
+        messages.append((float(entry["ts"]) - start, message))  # type: ignore[arg-type]
+    return messages
+
+
+def configure_environment(workdir: Path, entries: list[dict[str, object]], codex_speed: float) -> None:
+    launcher = workdir / "fake-codex"
+    launcher.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        f"sys.path.insert(0, {str(Path(__file__).resolve().parent.parent)!r})\n"
+        "from openclaw_mini.fake_codex import main\n"
+        "raise SystemExit(main())\n",
+        encoding="utf-8",
+    )
+    launcher.chmod(0o755)
+    # Turns without a recorded duration (rejected, drained) fall back to the typical one.
+    codex_ms = _numbers(entries, "codex_ms")
+    typical_ms = statistics.median(codex_ms) / codex_speed if codex_ms else 200.0
+    os.environ.setdefault("DISCORD_BOT_TOKEN", "replay")
+    os.environ.update(
+        {
+            "CODEX_COMMAND": str(launcher),
+            "CODEX_WORKSPACE_ROOT": str(workdir),
+            "CODEX_WORKSPACES_DIR": str(workdir / "workspaces"),
+            "CODEX_SESSION_DB_PATH": str(workdir / "sessions.db"),
+            "CODEX_SESSION_STORE_PATH": str(workdir / "sessions.json"),
+            "CODEX_MEMORY_INDEX_PATH": str(workdir / "memory-index.db"),
+            "CODEX_MEMORY_DIR": "memory",
+            "METRICS_PORT": "0",
+            "TRACE_PATH": str(workdir / "replay-trace.jsonl"),
+            "FAKE_CODEX_LATENCY_MS": str(typical_ms),
+            "FAKE_CODEX_LATENCY_DIST": "fixed",
+            "FAKE_CODEX_FAILURE_RATE": "0",
+        },
+    )
+
+
+async def replay(messages: list[tuple[float, FakeMessage]], speed: float) -> dict[str, object]:
+    from .bot import build_discord_client
+    from .config import load_settings
+
+    settings = load_settings()
+    client = build_discord_client(settings)
+    await client.setup_hook()
+    on_message = client.on_message
+    lateness: list[float] = []
+
+    async def deliver(offset: float, message: FakeMessage) -> None:
+        due = wall_start + offset / speed
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        # How far behind schedule the driver itself fell; large values mean the numbers are off.
+        lateness.append((time.perf_counter() - due) * 1000)
+        await on_message(message)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(deliver(offset, message) for offset, message in messages))
+    wall = time.perf_counter() - wall_start
+    client.trace_recorder.flush()  # type: ignore[attr-defined]
+    replayed = list(read_trace(settings.trace_path)) if settings.trace_path is not None else []
+    return {
+        "wall_sec": round(wall, 3),
+        "messages_per_sec": round(len(messages) / wall, 2) if wall else 0.0,
+        "delivery_lateness_ms": _summary(lateness),
+        **_profile(replayed),
+    }
+
+
+def print_report(report: dict[str, object], indent: str = "") -> None:
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        if isinstance(value, dict) and key in {"recorded", "replayed"}:
+            print(f"{indent}{key}:")
+            print_report(value, indent + "  ")
+            continue
+        if isinstance(value, dict):
+            value = "  ".join(f"{k}={v}" for k, v in value.items())
+        print(f"{indent}{key.ljust(width)}  {value}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", type=Path, help="JSONL trace written with TRACE_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival speed-up (1 = recorded pace)")
+    parser.add_argument("--codex-speed", type=float, default=None, help="Codex run speed-up (default: --speed)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N messages")
+    parser.add_argument("--workdir", type=Path, default=None, help="keep artifacts here instead of a temp dir")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.speed <= 0 or (args.codex_speed is not None and args.codex_speed <= 0):
+        parser.error("--speed and --codex-speed must be > 0")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    entries = sorted(read_trace(args.trace), key=lambda entry: float(entry["ts"]))  # type: ignore[arg-type]
+    if args.limit:
+        entries = entries[: args.limit]
+    if not entries:
+        print(f"No trace entries in {args.trace}", file=sys.stderr)
+        return 1
+    codex_speed = args.codex_speed or args.speed
+    workdir = args.workdir
+    if workdir is None:
+        workdir = Path(tempfile.mkdtemp(prefix="openclaw-replay-"))
+        # Registered before the bot's own exit hooks, so it runs after them.
+        atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    workdir.mkdir(parents=True, exist_ok=True)
+    configure_environment(workdir, entries, codex_speed)
+    messages = build_messages(entries, codex_speed)
+    span = float(entries[-1]["ts"]) - float(entries[0]["ts"])  # type: ignore[arg-type]
+    report = {
+        "speed": args.speed,
+        "codex_speed": codex_speed,
+        "recorded_span_sec": round(span, 3),
+        "recorded": _profile(entries),
+        "replayed": asyncio.run(replay(messages, args.speed)),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+T = TypeVar("T")
+# Per-flow finish tags are only pruned once the table gets this big.
+MAX_TRACKED_FLOWS = 1024
+
+
+class _Lane:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        # asyncio.Lock hands ownership to waiters in arrival order, which gives a FIFO lane.
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class _FairSlots:
+    # Start-time fair queuing over a fixed number of slots. A waiter's finish tag is
+    # max(virtual time, its flow's previous finish tag) + 1/weight and free slots go to the lowest
+    # tag, so a flow with many queued jobs is interleaved with others instead of served FIFO.
+    def __init__(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._free = capacity
+        self._waiters: list[tuple[float, int, float, str, asyncio.Future[None]]] = []
+        self._order = itertools.count()
+        self._virtual = 0.0
+        self._finish: dict[str, float] = {}
+
+    @property
+    def waiting_flows(self) -> int:
+        return len({flow for _, _, _, flow, future in self._waiters if not future.done()})
+
+    async def acquire(self, flow: str, weight: float = 1.0) -> None:
+        start = max(self._virtual, self._finish.get(flow, 0.0))
+        finish = start + 1.0 / weight
+        self._finish[flow] = finish
+        if self._free > 0:
+            # Slots are only free while nobody live is waiting; anything left is cancelled.
+            self._waiters.clear()
+            self._free -= 1
+            self._virtual = start
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (finish, next(self._order), start, flow, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted and cancelled in the same tick: hand the slot on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, start, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._virtual = start
+            future.set_result(None)
+            return
+        self._free += 1
+        if self._free == self._capacity:
+            # Tags only order flows against each other while there is a backlog.
+            self._finish.clear()
+        elif len(self._finish) > MAX_TRACKED_FLOWS:
+            self._finish = {flow: tag for flow, tag in self._finish.items() if tag > self._virtual}
+
+
+class ConversationScheduler:
+    def __init__(self, max_concurrency: int) -> None:
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be > 0")
+        self._max_concurrency = max_concurrency
+        self._slots = _FairSlots(max_concurrency)
+        self._lanes: dict[str, _Lane] = {}
+        self._running = 0
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def pending(self) -> int:
+        return sum(lane.pending for lane in self._lanes.values()) - self._running
+
+    @property
+    def waiting_flows(self) -> int:
+        return self._slots.waiting_flows
+
+    async def run(
+        self,
+        conversation_key: str,
+        job: Callable[[], Awaitable[T]],
+        flow: str | None = None,
+        weight: float = 1.0,
+    ) -> T:
+        lane = self._lanes.get(conversation_key)
+        if lane is None:
+            lane = _Lane()
+            self._lanes[conversation_key] = lane
+        lane.pending += 1
+        try:
+            # Take the lane first so a queued conversation never parks on a global slot.
+            async with lane.lock:
+                await self._slots.acquire(flow or conversation_key, weight)
+                self._running += 1
+                try:
+                    return await job()
+                finally:
+                    self._running -= 1
+                    self._slots.release()
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0 and self._lanes.get(conversation_key) is lane:
+                del self._lanes[conversation_key]
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from itertools import islice
+
+
+@dataclass(slots=True)
+class Turn:
+    at: str
+    role: str
+    text: str
+
+    def to_dict(self) -> dict[str, str]:
+        return {"at": self.at, "role": self.role, "text": self.text}
+
+
+def parse_turns(raw: object) -> list[Turn]:
+    if not isinstance(raw, list):
+        return []
+    turns: list[Turn] = []
+    for item in raw:
+        if not isinstance(item, dict):
+            continue
+        role = item.get("role")
+        text = item.get("text")
+        if not isinstance(role, str) or not isinstance(text, str):
+            continue
+        at = item.get("at")
+        turns.append(Turn(at=at if isinstance(at, str) and at else "unknown-time", role=role, text=text))
+    return turns
+
+
+# `turn_seq` counts every turn ever recorded, so a turn's absolute sequence number is stable
+# while the ring buffer drops old ones. `written_seq` (memory file) and `persisted_seq` (session
+# store) are cursors in that numbering.
+@dataclass(slots=True)
+class SessionRecord:
+    turns: deque[Turn]
+    thread_id: str | None = None
+    started_at_iso: str | None = None
+    last_active_at: float = 0.0
+    memory_file: str | None = None
+    prompt_sections: dict[str, str] = field(default_factory=dict)
+    turn_seq: int = 0
+    written_seq: int = 0
+    persisted_seq: int = 0
+
+    @classmethod
+    def new(cls, max_turns: int, started_at_iso: str) -> SessionRecord:
+        return cls(turns=deque(maxlen=max_turns), started_at_iso=started_at_iso)
+
+    @property
+    def first_seq(self) -> int:
+        return self.turn_seq - len(self.turns) + 1
+
+    def append(self, turn: Turn) -> None:
+        self.turns.append(turn)
+        self.turn_seq += 1
+
+    def turns_after(self, seq: int) -> Iterable[tuple[int, Turn]]:
+        first_seq = self.first_seq
+        skip = max(0, seq - first_seq + 1)
+        return enumerate(islice(self.turns, skip, None), start=first_seq + skip)
+
+    def meta(self) -> dict[str, object]:
+        data: dict[str, object] = {
+            "last_active_at": self.last_active_at,
+            "written_seq": self.written_seq,
+        }
+        if self.thread_id:
+            data["thread_id"] = self.thread_id
+        if self.started_at_iso:
+            data["started_at_iso"] = self.started_at_iso
+        if self.memory_file:
+            data["memory_file"] = self.memory_file
+        if self.prompt_sections:
+            data["prompt_sections"] = self.prompt_sections
+        return data
+
+    def to_dict(self) -> dict[str, object]:
+        data = self.meta()
+        data["turn_seq"] = self.turn_seq
+        data["turns"] = [turn.to_dict() for turn in self.turns]
+        return data
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: dict[str, object],
+        turns: list[Turn],
+        max_turns: int,
+        turn_seq: int | None = None,
+    ) -> SessionRecord:
+        # All validation of stored data happens here, once per record at load time.
+        if turn_seq is None:
+            raw_seq = data.get("turn_seq")
+            turn_seq = raw_seq if isinstance(raw_seq, int) and raw_seq >= len(turns) else len(turns)
+        record = cls(turns=deque(turns, maxlen=max_turns), turn_seq=turn_seq)
+        thread_id = data.get("thread_id")
+        record.thread_id = thread_id if isinstance(thread_id, str) and thread_id else None
+        started_at_iso = data.get("started_at_iso")
+        record.started_at_iso = started_at_iso if isinstance(started_at_iso, str) and started_at_iso else None
+        last_active_at = data.get("last_active_at")
+        record.last_active_at = float(last_active_at) if isinstance(last_active_at, (int, float)) else 0.0
+        memory_file = data.get("memory_file")
+        record.memory_file = memory_file if isinstance(memory_file, str) and memory_file else None
+        sections = data.get("prompt_sections")
+        if isinstance(sections, dict):
+            record.prompt_sections = {k: v for k, v in sections.items() if isinstance(k, str) and isinstance(v, str)}
+
+        written_seq = data.get("written_seq")
+        if isinstance(written_seq, int):
+            record.written_seq = written_seq
+        else:
+            # Older records counted written turns relative to the (trimmed) turn list.
+            written_turns = data.get("written_turns")
+            offset = written_turns if isinstance(written_turns, int) and 0 <= written_turns <= len(turns) else 0
+            record.written_seq = record.first_seq - 1 + offset
+        record.written_seq = min(max(record.written_seq, 0), turn_seq)
+        return record
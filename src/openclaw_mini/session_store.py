@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Protocol
+
+from .config import Settings
+from .metrics import STORE_WRITE_BYTES
+from .session import SessionRecord, Turn, parse_turns
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(Protocol):
+    def load_all(self) -> dict[str, SessionRecord]: ...
+
+    def save(self, conversation_key: str, record: SessionRecord) -> None: ...
+
+    def delete(self, conversation_key: str, started_at_iso: str | None) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def _read_json_records(path: Path, max_turns: int) -> dict[str, SessionRecord]:
+    if not path.exists():
+        return {}
+    try:
+        raw = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if not isinstance(raw, dict):
+        return {}
+    parsed: dict[str, SessionRecord] = {}
+    for key, value in raw.items():
+        if not isinstance(key, str) or not isinstance(value, dict):
+            continue
+        parsed[key] = SessionRecord.from_dict(value, parse_turns(value.get("turns")), max_turns)
+    return parsed
+
+
+# Legacy single-file backend: every save rewrites the whole file (atomically via rename).
+class JsonSessionStore:
+    def __init__(self, path: Path, max_turns: int) -> None:
+        self._path = path
+        self._max_turns = max_turns
+        # Serialized form of each record as of its last save. Saves run off the event loop while
+        # it keeps appending to other conversations' records, so those are never read live here.
+        self._snapshots: dict[str, dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def load_all(self) -> dict[str, SessionRecord]:
+        with self._lock:
+            records = _read_json_records(self._path, self._max_turns)
+            self._snapshots = {key: record.to_dict() for key, record in records.items()}
+            return records
+
+    def save(self, conversation_key: str, record: SessionRecord) -> None:
+        # Only this conversation's record is read, and its next turn waits for this save.
+        snapshot = record.to_dict()
+        with self._lock:
+            self._snapshots[conversation_key] = snapshot
+            self._flush()
+            record.persisted_seq = record.turn_seq
+
+    def delete(self, conversation_key: str, started_at_iso: str | None) -> None:
+        # Only the session that started at `started_at_iso`: a new one may already have been
+        # saved under the same key while the old one was being archived.
+        with self._lock:
+            snapshot = self._snapshots.get(conversation_key)
+            if snapshot is not None and snapshot.get("started_at_iso") == started_at_iso:
+                del self._snapshots[conversation_key]
+                self._flush()
+
+    def close(self) -> None:
+        return None
+
+    def _flush(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f"{self._path.name}.tmp")
+        payload = json.dumps(self._snapshots, ensure_ascii=True, indent=2)
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self._path)
+        STORE_WRITE_BYTES.inc(len(payload), backend="json")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    last_active_at REAL,
+    turn_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    at TEXT,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (conversation_key, seq)
+) WITHOUT ROWID;
+"""
+
+
+# Only turns past the record's `persisted_seq` cursor are inserted on each save.
+class SqliteSessionStore:
+    def __init__(self, db_path: Path, max_turns: int, legacy_json_path: Path | None = None) -> None:
+        self._db_path = db_path
+        self._max_turns = max_turns
+        self._legacy_json_path = legacy_json_path
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def load_all(self) -> dict[str, SessionRecord]:
+        with self._lock:
+            self._migrate_legacy_json()
+            rows: dict[str, tuple[dict[str, object], int]] = {}
+            for key, data, turn_seq in self._conn.execute(
+                "SELECT conversation_key, data, turn_seq FROM conversations",
+            ):
+                try:
+                    meta = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(meta, dict):
+                    rows[key] = (meta, int(turn_seq))
+            turns: dict[str, list[Turn]] = {key: [] for key in rows}
+            for key, at, role, text in self._conn.execute(
+                "SELECT conversation_key, at, role, text FROM turns ORDER BY conversation_key, seq",
+            ):
+                bucket = turns.get(key)
+                if bucket is not None:
+                    bucket.append(Turn(at=at or "unknown-time", role=role, text=text))
+            records: dict[str, SessionRecord] = {}
+            for key, (meta, turn_seq) in rows.items():
+                record = SessionRecord.from_dict(meta, turns[key], self._max_turns, turn_seq=turn_seq)
+                record.persisted_seq = turn_seq
+                records[key] = record
+            return records
+
+    def save(self, conversation_key: str, record: SessionRecord) -> None:
+        with self._lock:
+            self._save_locked(conversation_key, record)
+
+    def _save_locked(self, conversation_key: str, record: SessionRecord) -> None:
+        turn_seq = record.turn_seq
+        persisted = record.persisted_seq
+        if persisted > turn_seq:
+            persisted = 0
+        data = json.dumps(record.meta(), ensure_ascii=True)
+        new_rows = [
+            (conversation_key, seq, turn.at, turn.role, turn.text) for seq, turn in record.turns_after(persisted)
+        ]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            if persisted == 0:
+                # A fresh record may reuse the key of an archived one; clear any leftover turns.
+                self._conn.execute("DELETE FROM turns WHERE conversation_key = ?", (conversation_key,))
+            self._conn.execute(
+                "INSERT INTO conversations (conversation_key, data, last_active_at, turn_seq) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(conversation_key) DO UPDATE SET "
+                "data = excluded.data, last_active_at = excluded.last_active_at, turn_seq = excluded.turn_seq",
+                (conversation_key, data, record.last_active_at, turn_seq),
+            )
+            if new_rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO turns (conversation_key, seq, at, role, text) VALUES (?, ?, ?, ?, ?)",
+                    new_rows,
+                )
+            self._conn.execute(
+                "DELETE FROM turns WHERE conversation_key = ? AND seq < ?",
+                (conversation_key, record.first_seq),
+            )
+        record.persisted_seq = turn_seq
+        written = len(data) + sum(len(row[4].encode("utf-8")) for row in new_rows)
+        STORE_WRITE_BYTES.inc(written, backend="sqlite")
+
+    def delete(self, conversation_key: str, started_at_iso: str | None) -> None:
+        # Only the session that started at `started_at_iso` (see JsonSessionStore.delete). A newer
+        # one's first save has already cleared the old turns.
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                deleted = self._conn.execute(
+                    "DELETE FROM conversations WHERE conversation_key = ? "
+                    "AND json_extract(data, '$.started_at_iso') IS ?",
+                    (conversation_key, started_at_iso),
+                ).rowcount
+                if deleted:
+                    self._conn.execute("DELETE FROM turns WHERE conversation_key = ?", (conversation_key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _migrate_legacy_json(self) -> None:
+        legacy = self._legacy_json_path
+        if legacy is None or not legacy.exists():
+            return
+        (existing,) = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()
+        if existing:
+            return
+        records = _read_json_records(legacy, self._max_turns)
+        for key, record in records.items():
+            self._save_locked(key, record)
+        migrated_path = legacy.with_name(f"{legacy.name}.migrated")
+        os.replace(legacy, migrated_path)
+        logger.info("Migrated %d sessions from %s into %s", len(records), legacy, self._db_path)
+
+
+def open_session_store(settings: Settings) -> SessionStore:
+    if settings.codex_session_store_backend == "json":
+        return JsonSessionStore(settings.codex_session_store_path, settings.codex_session_max_turns)
+    return SqliteSessionStore(
+        settings.codex_session_db_path,
+        settings.codex_session_max_turns,
+        legacy_json_path=settings.codex_session_store_path,
+    )
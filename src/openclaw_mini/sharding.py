@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import zlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from .config import Settings
+from .session_store import open_session_store
+
+logger = logging.getLogger(__name__)
+
+# Discord delivers every DM to shard 0.
+DM_SHARD = 0
+
+
+def guild_shard(guild_id: int, shard_count: int) -> int:
+    # Discord's own routing: a guild always lands on this shard for a given shard count.
+    return (guild_id >> 22) % shard_count
+
+
+def conversation_shard(conversation_key: str, shard_count: int) -> int:
+    # Keys are `guild:<guild_id>:channel:<channel_id>` or `dm:<channel_id>`.
+    if shard_count <= 1:
+        return 0
+    kind, _, rest = conversation_key.partition(":")
+    if kind == "dm":
+        return DM_SHARD
+    if kind == "guild":
+        guild_id, _, _ = rest.partition(":")
+        if guild_id.isdigit():
+            return guild_shard(int(guild_id), shard_count)
+    return zlib.crc32(conversation_key.encode("utf-8")) % shard_count
+
+
+@dataclass(frozen=True)
+class ShardPlan:
+    shard_count: int = 1
+    process_count: int = 1
+    process_index: int = 0
+
+    @property
+    def sharded(self) -> bool:
+        return self.shard_count > 1
+
+    @property
+    def shard_ids(self) -> tuple[int, ...]:
+        return tuple(range(self.process_index, self.shard_count, self.process_count))
+
+    @property
+    def tag(self) -> str:
+        return f"p{self.process_index}of{self.process_count}"
+
+    def owns(self, conversation_key: str) -> bool:
+        if self.process_count <= 1:
+            return True
+        return conversation_shard(conversation_key, self.shard_count) % self.process_count == self.process_index
+
+
+def plans_for(settings: Settings) -> list[ShardPlan]:
+    return [
+        ShardPlan(settings.discord_shard_count, settings.discord_shard_processes, index)
+        for index in range(settings.discord_shard_processes)
+    ]
+
+
+def _tagged(path: Path, tag: str) -> Path:
+    return path.with_name(f"{path.stem}.{tag}{path.suffix}")
+
+
+def shard_settings(settings: Settings, plan: ShardPlan) -> Settings:
+    # Each process keeps its own session store and workspaces; memory files and the memory index stay shared.
+    if plan.process_count <= 1:
+        return settings
+    return replace(
+        settings,
+        codex_session_store_path=_tagged(settings.codex_session_store_path, plan.tag),
+        codex_session_db_path=_tagged(settings.codex_session_db_path, plan.tag),
+        codex_workspaces_dir=_tagged(settings.codex_workspaces_dir, plan.tag),
+        trace_path=_tagged(settings.trace_path, plan.tag) if settings.trace_path is not None else None,
+        metrics_port=settings.metrics_port + plan.process_index if settings.metrics_port else 0,
+    )
+
+
+def _store_path(settings: Settings) -> Path:
+    if settings.codex_session_store_backend == "json":
+        return settings.codex_session_store_path
+    return settings.codex_session_db_path
+
+
+def split_session_store(settings: Settings, plans: list[ShardPlan]) -> int:
+    # Run by the supervisor before the shard processes start. The first time an install runs
+    # with shard processes, each session in its unsharded store (including a legacy JSON store
+    # not yet migrated) is copied into the store of the process that owns its conversation, so
+    # Codex threads carry over; the unsharded store is then renamed to `.migrated`.
+    # Returns the number of sessions copied.
+    if len(plans) <= 1 or any(_store_path(shard_settings(settings, plan)).exists() for plan in plans):
+        return 0
+    _warn_other_shard_stores(settings, len(plans))
+    source_path = _store_path(settings)
+    if not source_path.exists() and not settings.codex_session_store_path.exists():
+        return 0
+    source = open_session_store(settings)
+    records = source.load_all()
+    source.close()
+    for plan in plans:
+        target = open_session_store(shard_settings(settings, plan))
+        target.load_all()
+        for conversation_key, record in records.items():
+            if plan.owns(conversation_key):
+                record.persisted_seq = 0
+                target.save(conversation_key, record)
+        target.close()
+    if source_path.exists():
+        os.replace(source_path, source_path.with_name(f"{source_path.name}.migrated"))
+    logger.warning(
+        "Split %d sessions from %s into %d shard process stores",
+        len(records),
+        source_path,
+        len(plans),
+    )
+    return len(records)
+
+
+def _warn_other_shard_stores(settings: Settings, process_count: int) -> None:
+    path = _store_path(settings)
+    pattern = re.compile(rf"{re.escape(path.stem)}\.p\d+of(\d+){re.escape(path.suffix)}")
+    stale = sorted(
+        sibling.name
+        for sibling in path.parent.glob(f"{path.stem}.p*of*{path.suffix}")
+        if (match := pattern.fullmatch(sibling.name)) and int(match.group(1)) != process_count
+    )
+    if stale:
+        logger.warning(
+            "Session stores for a different DISCORD_SHARD_PROCESSES are not carried over: %s",
+            ", ".join(stale),
+        )
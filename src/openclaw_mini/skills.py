@@ -1,8 +1,20 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import math
+import re
+from collections import Counter
+from collections.abc import Hashable, Mapping
 from dataclasses import dataclass
 from pathlib import Path
 
+from .filecache import CachedLoader, file_signature
+from .memory_index import STOPWORDS
+from .metrics import SKILL_SELECTIONS
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass(frozen=True)
 class SkillResult:
@@ -15,16 +27,77 @@ HELP_TEXT = """Commands:
 - /ping   Health check
 - /skills Show available skills
 - /soul   Show current soul summary
+- /fresh <message> Ask Codex, skipping the reply cache
 
 Anything else is sent to local Codex CLI."""
 
 
-def load_skill_cards(skills_dir: Path | None = None) -> list[tuple[str, str]]:
+CARD_MAX_CHARS = 1200
+# A card needs one keyword hit or a couple of body-word hits to count as relevant.
+MIN_SKILL_SCORE = 2.0
+KEYWORD_WEIGHT = 3.0
+TRIGGER_SCORE = 100.0
+_WORD_RE = re.compile(r"[^\W_]{3,}", re.UNICODE)
+
+
+@dataclass(frozen=True)
+class SkillCard:
+    name: str
+    body: str
+    triggers: tuple[str, ...] = ()
+    keywords: frozenset[str] = frozenset()
+    always: bool = False
+    priority: int = 0
+
+    @property
+    def prompt_text(self) -> str:
+        return self.body[:CARD_MAX_CHARS]
+
+
+def _terms(text: str) -> set[str]:
+    return {word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS}
+
+
+def _split_list(raw: str) -> list[str]:
+    return [item.strip().strip("\"'").lower() for item in raw.strip().strip("[]").split(",") if item.strip()]
+
+
+def parse_skill_card(name: str, content: str) -> SkillCard:
+    # Optional front-matter: `---` lines around `key: value` pairs (triggers, keywords, always,
+    # priority); lists are comma-separated. Cards without it are matched on their text alone.
+    lines = content.splitlines()
+    if not lines or lines[0].strip() != "---":
+        return SkillCard(name=name, body=content)
+    try:
+        end = next(index for index in range(1, len(lines)) if lines[index].strip() == "---")
+    except StopIteration:
+        return SkillCard(name=name, body=content)
+    meta: dict[str, str] = {}
+    for line in lines[1:end]:
+        key, sep, value = line.partition(":")
+        if sep:
+            meta[key.strip().lower()] = value.strip()
+    priority = 0
+    try:
+        priority = int(meta.get("priority", "0") or 0)
+    except ValueError:
+        logger.warning("Ignoring invalid priority in skill card %s: %s", name, meta["priority"])
+    return SkillCard(
+        name=name,
+        body="\n".join(lines[end + 1 :]).strip(),
+        triggers=tuple(_split_list(meta.get("triggers", ""))),
+        keywords=frozenset(_terms(" ".join(_split_list(meta.get("keywords", ""))))),
+        always=meta.get("always", "").lower() in {"1", "true", "yes", "on"},
+        priority=priority,
+    )
+
+
+def load_skill_cards(skills_dir: Path | None = None) -> list[SkillCard]:
     base_dir = skills_dir or Path("skills")
     if not base_dir.exists():
         return []
 
-    cards: list[tuple[str, str]] = []
+    cards: list[SkillCard] = []
     for path in sorted(base_dir.glob("*.md")):
         try:
             content = path.read_text(encoding="utf-8").strip()
@@ -32,24 +105,145 @@ def load_skill_cards(skills_dir: Path | None = None) -> list[tuple[str, str]]:
             continue
         if not content:
             continue
-        cards.append((path.stem, content))
+        card = parse_skill_card(path.stem, content)
+        if card.body:
+            cards.append(card)
     return cards
 
 
-def format_skill_cards_for_prompt(cards: list[tuple[str, str]]) -> str:
-    if not cards:
-        return "No external skill cards loaded."
-    lines = []
-    for name, content in cards:
-        lines.append(f"[{name}]")
-        lines.append(content[:1200])
-    return "\n\n".join(lines)
+@dataclass(frozen=True)
+class SkillSelection:
+    catalog: str
+    cards: tuple[SkillCard, ...]
+
+
+class SkillIndex:
+    # Built once per skills-directory change: an inverted index from term to (card, weight),
+    # weighted by inverse document frequency so words every card uses count for little.
+    def __init__(self, cards: list[SkillCard]) -> None:
+        self.cards = cards
+        document_terms: list[dict[str, float]] = []
+        for card in cards:
+            terms = {term: 1.0 for term in _terms(card.prompt_text)}
+            for term in card.keywords | _terms(card.name.replace("-", " ")):
+                terms[term] = KEYWORD_WEIGHT
+            document_terms.append(terms)
+        frequency: dict[str, int] = {}
+        for terms in document_terms:
+            for term in terms:
+                frequency[term] = frequency.get(term, 0) + 1
+        self._postings: dict[str, list[tuple[int, float]]] = {}
+        for position, terms in enumerate(document_terms):
+            for term, weight in terms.items():
+                idf = math.log(1.0 + len(cards) / frequency[term])
+                self._postings.setdefault(term, []).append((position, weight * idf))
+        names = ", ".join(card.name for card in cards)
+        self.catalog = (
+            f"Skill cards available: {names}. The ones relevant to a message are included as SKILL CARD sections."
+            if cards
+            else "No external skill cards loaded."
+        )
+
+    def select(self, text: str, budget_chars: int) -> SkillSelection:
+        scores = [0.0] * len(self.cards)
+        for term in _terms(text):
+            for position, weight in self._postings.get(term, ()):
+                scores[position] += weight
+        lowered = text.lower()
+        for position, card in enumerate(self.cards):
+            if any(trigger in lowered for trigger in card.triggers):
+                scores[position] += TRIGGER_SCORE
+
+        ranked = sorted(
+            (
+                (not card.always, -scores[position], -card.priority, card.name, card)
+                for position, card in enumerate(self.cards)
+                if card.always or scores[position] >= MIN_SKILL_SCORE
+            ),
+        )
+        chosen: list[SkillCard] = []
+        used = 0
+        for *_, card in ranked:
+            size = len(card.prompt_text)
+            if used + size > budget_chars:
+                continue
+            chosen.append(card)
+            used += size
+        return SkillSelection(catalog=self.catalog, cards=tuple(chosen))
+
+
+FRESH_COMMAND = "/fresh"
+
+
+def split_fresh_command(message: str) -> tuple[str, bool]:
+    text = message.strip()
+    parts = text.split(None, 1)
+    if len(parts) == 2 and parts[0].lower() == FRESH_COMMAND:
+        return parts[1].strip(), True
+    return text, False
+
+
+@dataclass(frozen=True)
+class SkillsSnapshot:
+    cards: list[SkillCard]
+    index: SkillIndex
+    digest: str
+
+
+class SkillCardsCache:
+    def __init__(self, skills_dir: Path | None, check_interval_sec: float) -> None:
+        self._skills_dir = skills_dir or Path("skills")
+        # Selection counts survive reloads of the library; cards are keyed by name.
+        self.selected: Counter[str] = Counter()
+        self.selections = 0
+        self._loader = CachedLoader(
+            signature=self._signature,
+            build=self._build,
+            check_interval_sec=check_interval_sec,
+        )
+
+    def _signature(self) -> Hashable:
+        base_dir = self._skills_dir
+        # Directory mtime catches added/removed cards; per-file stats catch in-place edits.
+        entries = tuple((path.name, file_signature(path)) for path in sorted(base_dir.glob("*.md")))
+        return (file_signature(base_dir), entries)
+
+    def _build(self) -> SkillsSnapshot:
+        cards = load_skill_cards(self._skills_dir)
+        digest = hashlib.sha256()
+        for card in cards:
+            digest.update(repr(card).encode("utf-8"))
+        return SkillsSnapshot(cards=cards, index=SkillIndex(cards), digest=digest.hexdigest())
+
+    def get(self) -> SkillsSnapshot:
+        return self._loader.get()
+
+    def select(self, snapshot: SkillsSnapshot, text: str, budget_chars: int) -> SkillSelection:
+        selection = snapshot.index.select(text, budget_chars)
+        for card in selection.cards:
+            self.selected[card.name] += 1
+            SKILL_SELECTIONS.inc(card=card.name)
+        self.selections += 1
+        return selection
+
+
+def _describe_card(card: SkillCard, selected: Mapping[str, int], selections: int) -> str:
+    tags = []
+    if card.always:
+        tags.append("always")
+    if card.triggers:
+        tags.append("triggers: " + ", ".join(card.triggers))
+    if selections:
+        tags.append(f"used in {selected.get(card.name, 0)}/{selections} prompts")
+    return f"- {card.name}" + (f" ({'; '.join(tags)})" if tags else "")
 
 
 def handle_skill_command(
     message: str,
     soul_excerpt: str,
-    skill_cards: list[tuple[str, str]],
+    skill_cards: list[SkillCard],
+    selected: Mapping[str, int] | None = None,
+    selections: int = 0,
 ) -> SkillResult:
     text = message.strip()
     if not text.startswith("/"):
@@ -61,16 +255,18 @@ def handle_skill_command(
     if lower.startswith("/ping"):
         return SkillResult(handled=True, response="pong")
     if lower.startswith("/skills"):
-        external = ", ".join(name for name, _ in skill_cards) or "(none)"
+        external = "\n".join(_describe_card(card, selected or {}, selections) for card in skill_cards) or "(none)"
         return SkillResult(
             handled=True,
             response=(
-                "Built-in skills: help, ping, skills, soul\n"
-                f"Skill cards from ./skills: {external}"
+                "Built-in skills: help, ping, skills, soul, fresh\n"
+                f"Skill cards from ./skills:\n{external}"
             ),
         )
     if lower.startswith("/soul"):
         return SkillResult(handled=True, response=f"Soul:\n{soul_excerpt}")
+    if lower.startswith(FRESH_COMMAND):
+        return SkillResult(handled=True, response=f"Usage: {FRESH_COMMAND} <message>")
 
     return SkillResult(
         handled=True,
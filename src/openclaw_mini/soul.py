@@ -1,11 +1,44 @@
 from __future__ import annotations
 
+import hashlib
+from dataclasses import dataclass
 from pathlib import Path
 
+from .filecache import CachedLoader, file_signature
+
 DEFAULT_SOUL = """# SOUL.md - Default Soul\n\nBe helpful, concise, and accurate.\n"""
+SOUL_EXCERPT_LEN = 1200
+
+
+@dataclass(frozen=True)
+class SoulSnapshot:
+    text: str
+    excerpt: str
+    digest: str
 
 
 def load_soul(soul_path: Path) -> str:
     if soul_path.exists():
         return soul_path.read_text(encoding="utf-8").strip()
     return DEFAULT_SOUL
+
+
+class SoulCache:
+    def __init__(self, soul_path: Path, check_interval_sec: float) -> None:
+        self._loader = CachedLoader(
+            signature=lambda: file_signature(soul_path),
+            build=lambda: self._build(soul_path),
+            check_interval_sec=check_interval_sec,
+        )
+
+    @staticmethod
+    def _build(soul_path: Path) -> SoulSnapshot:
+        text = load_soul(soul_path)
+        return SoulSnapshot(
+            text=text,
+            excerpt=text[:SOUL_EXCERPT_LEN],
+            digest=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        )
+
+    def get(self) -> SoulSnapshot:
+        return self._loader.get()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import discord
+
+from .events import agent_message_text, describe_progress
+
+logger = logging.getLogger(__name__)
+PLACEHOLDER_TEXT = "⏳ Working on it…"
+MAX_PROGRESS_LINES = 4
+
+
+class ReplyStreamer:
+    def __init__(self, message: discord.Message, edit_interval_sec: float, max_len: int) -> None:
+        self._message = message
+        self._edit_interval_sec = edit_interval_sec
+        self._max_len = max_len
+        self._placeholder: discord.Message | None = None
+        self._agent_text = ""
+        self._progress: list[str] = []
+        self._last_edit_at = 0.0
+        self._last_rendered = ""
+        self._flush_task: asyncio.Task[None] | None = None
+        self._finished = False
+
+    async def start(self) -> None:
+        try:
+            self._placeholder = await self._message.reply(PLACEHOLDER_TEXT, mention_author=False)
+        except discord.HTTPException:
+            logger.warning("Could not post streaming placeholder; falling back to plain replies")
+            self._placeholder = None
+        self._last_edit_at = time.monotonic()
+        self._last_rendered = PLACEHOLDER_TEXT
+
+    async def on_event(self, event: dict[str, object]) -> None:
+        if self._placeholder is None or self._finished:
+            return
+        text = agent_message_text(event)
+        if text:
+            self._agent_text = text
+        else:
+            progress = describe_progress(event)
+            if not progress:
+                return
+            self._progress.append(progress)
+            del self._progress[:-MAX_PROGRESS_LINES]
+        self._schedule_flush()
+
+    def stop(self) -> discord.Message | None:
+        # Freezes progress edits and hands over the placeholder for the final reply.
+        self._finished = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        return self._placeholder
+
+    def _render(self) -> str:
+        footer = "\n".join(f"> {line}" for line in self._progress)
+        body = self._agent_text
+        if not body:
+            return f"{PLACEHOLDER_TEXT}\n{footer}".strip()
+        room = self._max_len - len(footer) - 2
+        if room < 200:
+            footer = ""
+            room = self._max_len
+        if len(body) > room:
+            body = "…" + body[-(room - 1):]
+        return f"{body}\n\n{footer}".strip()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        delay = max(0.0, self._last_edit_at + self._edit_interval_sec - time.monotonic())
+        self._flush_task = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        if self._placeholder is None or self._finished:
+            return
+        rendered = self._render()
+        if rendered == self._last_rendered:
+            return
+        self._last_edit_at = time.monotonic()
+        self._last_rendered = rendered
+        try:
+            await self._placeholder.edit(content=rendered)
+        except discord.HTTPException as exc:
+            logger.debug("Streaming edit failed: %s", exc)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from .events import agent_message_text, describe_progress, event_error_message, event_thread_id
+
+# A conversation's idle budget is this many times its typical longest silence in a run.
+IDLE_GAP_FACTOR = 3.0
+# While a command or tool call is open Codex is waiting on it, not stuck; it gets longer.
+OPEN_ITEM_IDLE_FACTOR = 4.0
+EWMA_ALPHA = 0.3
+MAX_TRACKED_CONVERSATIONS = 10_000
+PARTIAL_STEPS = 4
+
+
+@dataclass(frozen=True)
+class RunBudget:
+    idle_sec: float
+    total_sec: float
+
+
+class RunWatch:
+    # Liveness of one Codex run: when its last JSON event arrived, the longest silence so far,
+    # and enough of what it did (thread, latest agent message, last steps) to report on a timeout.
+    def __init__(self, budget: RunBudget) -> None:
+        self.budget = budget
+        self.started = time.monotonic()
+        self.last_event = self.started
+        self.longest_gap = 0.0
+        self.thread_id: str | None = None
+        self.last_message: str | None = None
+        self.steps: deque[str] = deque(maxlen=PARTIAL_STEPS)
+        self.errors: deque[str] = deque(maxlen=PARTIAL_STEPS)
+        self._open_items: set[str] = set()
+
+    def begin(self) -> None:
+        # Called once the run has its process or worker; waiting for one does not count.
+        self.started = time.monotonic()
+        self.last_event = self.started
+
+    def observe(self, event: dict[str, object]) -> None:
+        now = time.monotonic()
+        self.longest_gap = max(self.longest_gap, now - self.last_event)
+        self.last_event = now
+        self.thread_id = self.thread_id or event_thread_id(event)
+        self.last_message = agent_message_text(event) or self.last_message
+        error = event_error_message(event)
+        if error:
+            self.errors.append(error)
+        item = event.get("item")
+        item_id = item.get("id") if isinstance(item, dict) else None
+        if isinstance(item_id, str):
+            if event.get("type") == "item.started":
+                self._open_items.add(item_id)
+            elif event.get("type") == "item.completed":
+                self._open_items.discard(item_id)
+        step = describe_progress(event)
+        if step:
+            self.steps.append(step)
+
+    def idle_limit(self) -> float:
+        factor = OPEN_ITEM_IDLE_FACTOR if self._open_items else 1.0
+        return self.budget.idle_sec * factor
+
+    def remaining(self) -> float:
+        deadline = min(self.last_event + self.idle_limit(), self.started + self.budget.total_sec)
+        return max(0.0, deadline - time.monotonic())
+
+    def timeout_summary(self) -> str:
+        now = time.monotonic()
+        if now - self.started >= self.budget.total_sec:
+            reason = f"it hit the {self.budget.total_sec:.0f}s limit"
+        else:
+            reason = f"it produced no output for {now - self.last_event:.0f}s"
+        steps = "\n".join(f"> {step}" for step in self.steps)
+        return f"Codex was stopped after {now - self.started:.0f}s because {reason}." + (
+            f"\nLast steps:\n{steps}" if steps else ""
+        )
+
+
+class LatencyHistory:
+    # Per-conversation EWMA of the longest silence inside completed runs. Conversations whose
+    # runs routinely sit quiet (long builds, big tool calls) get a wider idle budget; the floor
+    # and the hard cap come from settings.
+    def __init__(self, idle_floor_sec: float, total_cap_sec: float) -> None:
+        self._idle_floor_sec = idle_floor_sec
+        self._total_cap_sec = total_cap_sec
+        self._gaps: dict[str, float] = {}
+
+    def budget(self, conversation_key: str) -> RunBudget:
+        gap = self._gaps.get(conversation_key)
+        idle = self._idle_floor_sec if gap is None else max(self._idle_floor_sec, IDLE_GAP_FACTOR * gap)
+        return RunBudget(idle_sec=min(idle, self._total_cap_sec), total_sec=self._total_cap_sec)
+
+    def observe(self, conversation_key: str, watch: RunWatch) -> None:
+        # Only completed runs are learned from; a killed run's silence is the budget itself.
+        previous = self._gaps.pop(conversation_key, None)
+        gap = watch.longest_gap if previous is None else previous + EWMA_ALPHA * (watch.longest_gap - previous)
+        # Re-inserted so the dict stays ordered by last use; the oldest entries go first.
+        self._gaps[conversation_key] = gap
+        while len(self._gaps) > MAX_TRACKED_CONVERSATIONS:
+            del self._gaps[next(iter(self._gaps))]
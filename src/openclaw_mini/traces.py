@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TRACE_FLUSH_SEC = 1.0
+
+
+def trace_id(value: object) -> str:
+    # Stable within and across traces, so conversations and users line up on replay. Hashed,
+    # not anonymized: anyone holding the raw IDs can recompute these.
+    return hashlib.blake2b(str(value).encode("utf-8"), digest_size=6).hexdigest()
+
+
+class TraceRecorder:
+    # One compact JSON line per handled message: timing, sizes and the path it took, never
+    # message text. Lines are buffered and appended off the event loop about once a second.
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._pending: list[str] = []
+        self._write_lock = threading.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self.recorded = 0
+
+    def record(self, **fields: object) -> None:
+        entry = {key: value for key, value in fields.items() if value is not None}
+        self._pending.append(json.dumps(entry, separators=(",", ":")))
+        self.recorded += 1
+
+    def start(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.ensure_future(self._flush_loop())
+
+    def flush(self) -> None:
+        lines, self._pending = self._pending, []
+        self._write(lines)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(TRACE_FLUSH_SEC)
+            lines, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except OSError:
+                logger.exception("Writing trace to %s failed", self._path)
+
+    def _write(self, lines: list[str]) -> None:
+        if not lines:
+            return
+        with self._write_lock, self._path.open("a", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+
+def read_trace(path: Path) -> Iterator[dict[str, object]]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a torn last line.
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get("ts"), (int, float)):
+                yield entry
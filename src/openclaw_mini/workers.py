@@ -0,0 +1,490 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+from collections import deque
+
+from .capture import read_line
+from .config import Settings
+from .events import CodexRun, EventCallback, agent_message_text
+from .timeouts import RunWatch
+
+logger = logging.getLogger(__name__)
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+WORKER_REQUEST_TIMEOUT_SEC = 60.0
+WORKER_SHUTDOWN_GRACE_SEC = 5.0
+
+# `codex app-server` speaks JSON-RPC over stdio (one message per line) and reports turn
+# progress as v2 notifications. They are translated into the same event shape that
+# `codex exec --json` prints so streaming and reply extraction work for both backends.
+_ITEM_TYPES = {
+    "agentMessage": "agent_message",
+    "commandExecution": "command_execution",
+    "fileChange": "file_change",
+    "mcpToolCall": "mcp_tool_call",
+    "webSearch": "web_search",
+    "reasoning": "reasoning",
+    "todoList": "todo_list",
+}
+_CAMEL_RE = re.compile(r"(?<!^)(?=[A-Z])")
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def _snake_keys(item: dict[str, object]) -> dict[str, object]:
+    converted = {_CAMEL_RE.sub("_", key).lower(): value for key, value in item.items()}
+    item_type = item.get("type")
+    if isinstance(item_type, str):
+        converted["type"] = _ITEM_TYPES.get(item_type, _CAMEL_RE.sub("_", item_type).lower())
+    if converted.get("type") == "reasoning" and not isinstance(converted.get("text"), str):
+        summary = converted.get("summary")
+        if isinstance(summary, list):
+            converted["text"] = "\n".join(part for part in summary if isinstance(part, str))
+    return converted
+
+
+def translate_notification(method: str, params: dict[str, object]) -> dict[str, object] | None:
+    if method in {"item/started", "item/completed"}:
+        item = params.get("item")
+        if not isinstance(item, dict):
+            return None
+        event_type = "item.started" if method == "item/started" else "item.completed"
+        return {"type": event_type, "item": _snake_keys(item)}
+    if method == "turn/started":
+        return {"type": "turn.started"}
+    if method == "turn/completed":
+        turn = params.get("turn")
+        status = turn.get("status") if isinstance(turn, dict) else None
+        if status in {"failed", "interrupted"}:
+            error = turn.get("error") if isinstance(turn, dict) else None
+            message = error.get("message") if isinstance(error, dict) else None
+            return {"type": "turn.failed", "error": {"message": message or f"turn {status}"}}
+        return {"type": "turn.completed"}
+    if method == "error":
+        error = params.get("error")
+        message = error.get("message") if isinstance(error, dict) else params.get("message")
+        return {"type": "error", "message": message if isinstance(message, str) else "unknown error"}
+    return None
+
+
+def thread_start_params(settings: Settings) -> dict[str, object]:
+    params: dict[str, object] = {"cwd": str(settings.codex_workspace_root.resolve())}
+    if settings.codex_model:
+        params["model"] = settings.codex_model
+    if settings.codex_dangerous_bypass:
+        params["sandbox"] = "danger-full-access"
+        params["approvalPolicy"] = "never"
+        return params
+    if settings.codex_sandbox:
+        params["sandbox"] = settings.codex_sandbox
+    if settings.codex_ask_for_approval:
+        params["approvalPolicy"] = settings.codex_ask_for_approval
+    if settings.codex_use_full_auto and not (settings.codex_sandbox or settings.codex_ask_for_approval):
+        params["sandbox"] = "workspace-write"
+        params["approvalPolicy"] = "on-request"
+    return params
+
+
+def _thread_overrides(cwd: str | None, model: str | None) -> dict[str, object]:
+    # A per-conversation workspace overrides the pool-wide cwd for the thread, and a
+    # hedged backup run may ask for a different model.
+    overrides: dict[str, object] = {"cwd": cwd} if cwd else {}
+    if model:
+        overrides["model"] = model
+    return overrides
+
+
+class CodexWorker:
+    def __init__(self, worker_id: int, command: list[str], cwd: str) -> None:
+        self.worker_id = worker_id
+        self._command = command
+        self._cwd = cwd
+        self._proc: asyncio.subprocess.Process | None = None
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future[dict[str, object]]] = {}
+        self._sink: asyncio.Queue[tuple[str, dict[str, object]] | None] | None = None
+        self._reader: asyncio.Task[None] | None = None
+        self._stderr_reader: asyncio.Task[None] | None = None
+        self._stderr_tail: deque[str] = deque(maxlen=40)
+        self._closed = False
+        self.loaded_threads: set[str] = set()
+        self.requests_served = 0
+        self.busy = False
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed and self._proc is not None and self._proc.returncode is None
+
+    @property
+    def pid(self) -> int | None:
+        return self._proc.pid if self._proc is not None else None
+
+    async def start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._command,
+            cwd=self._cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LINE_LIMIT,
+        )
+        self._reader = asyncio.create_task(self._read_loop())
+        self._stderr_reader = asyncio.create_task(self._drain_stderr())
+        await self.request("initialize", {"clientInfo": {"name": "openclaw-mini", "version": "0.1.0"}})
+        self._write({"method": "initialized"})
+        logger.info("Codex worker %d started (pid %s)", self.worker_id, self.pid)
+
+    async def request(
+        self,
+        method: str,
+        params: dict[str, object],
+        timeout: float = WORKER_REQUEST_TIMEOUT_SEC,
+    ) -> dict[str, object]:
+        if not self.alive:
+            raise WorkerError(f"worker {self.worker_id} is not running")
+        request_id = next(self._ids)
+        future: asyncio.Future[dict[str, object]] = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._write({"id": request_id, "method": method, "params": params})
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def run_turn(
+        self,
+        thread_id: str | None,
+        prompt: str,
+        on_event: EventCallback | None,
+        thread_params: dict[str, object],
+        watch: RunWatch,
+        cwd: str | None = None,
+        model: str | None = None,
+    ) -> CodexRun:
+        sink: asyncio.Queue[tuple[str, dict[str, object]] | None] = asyncio.Queue()
+        self._sink = sink
+        overrides = _thread_overrides(cwd, model)
+        try:
+            if thread_id is None:
+                result = await self.request("thread/start", {**thread_params, **overrides})
+                thread_id = self._thread_id_from(result)
+                started_event: dict[str, object] = {"type": "thread.started", "thread_id": thread_id}
+                watch.observe(started_event)
+                if on_event is not None:
+                    await on_event(started_event)
+            elif thread_id not in self.loaded_threads:
+                await self.request("thread/resume", {"threadId": thread_id, **overrides})
+            self.loaded_threads.add(thread_id)
+
+            await self.request(
+                "turn/start",
+                {"threadId": thread_id, "input": [{"type": "text", "text": prompt}]},
+            )
+
+            last_message: str | None = None
+            output: deque[str] = deque(maxlen=20)
+            while True:
+                # Raises TimeoutError once the turn has been silent for its idle budget.
+                notification = await asyncio.wait_for(sink.get(), timeout=watch.remaining())
+                if notification is None:
+                    tail = "\n".join(self._stderr_tail)
+                    return CodexRun(
+                        thread_id=thread_id,
+                        last_message=last_message,
+                        exit_code=1,
+                        output=tail,
+                        error=f"worker {self.worker_id} exited\n{tail}",
+                    )
+                method, params = notification
+                event = translate_notification(method, params)
+                if event is None:
+                    continue
+                watch.observe(event)
+                output.append(json.dumps(event, ensure_ascii=True))
+                last_message = agent_message_text(event) or last_message
+                if on_event is not None:
+                    try:
+                        await on_event(event)
+                    except Exception:  # noqa: BLE001
+                        logger.exception("Codex event callback failed")
+                if event["type"] == "turn.completed":
+                    return CodexRun(thread_id=thread_id, last_message=last_message, exit_code=0, output="")
+                if event["type"] == "turn.failed":
+                    return CodexRun(
+                        thread_id=thread_id,
+                        last_message=last_message,
+                        exit_code=1,
+                        output="\n".join(output),
+                        error="\n".join(watch.errors),
+                    )
+        finally:
+            self._sink = None
+
+    async def close(self) -> None:
+        self._closed = True
+        proc = self._proc
+        if proc is not None and proc.returncode is None:
+            if proc.stdin is not None:
+                proc.stdin.close()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=WORKER_SHUTDOWN_GRACE_SEC)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        for task in (self._reader, self._stderr_reader):
+            if task is not None:
+                task.cancel()
+
+    def kill(self) -> None:
+        self._closed = True
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+
+    @staticmethod
+    def _thread_id_from(result: dict[str, object]) -> str:
+        thread = result.get("thread")
+        thread_id = thread.get("id") if isinstance(thread, dict) else result.get("threadId")
+        if not isinstance(thread_id, str) or not thread_id:
+            raise WorkerError(f"thread/start returned no thread id: {result}")
+        return thread_id
+
+    def _write(self, payload: dict[str, object]) -> None:
+        assert self._proc is not None and self._proc.stdin is not None
+        self._proc.stdin.write(json.dumps(payload, ensure_ascii=True).encode("utf-8") + b"\n")
+
+    async def _read_loop(self) -> None:
+        assert self._proc is not None and self._proc.stdout is not None
+        try:
+            while True:
+                raw = await read_line(self._proc.stdout)
+                if not raw:
+                    break
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(message, dict):
+                    self._dispatch(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(WorkerError(f"worker {self.worker_id} exited"))
+            if self._sink is not None:
+                self._sink.put_nowait(None)
+
+    def _dispatch(self, message: dict[str, object]) -> None:
+        message_id = message.get("id")
+        method = message.get("method")
+        if isinstance(method, str) and message_id is not None:
+            # Server-initiated request (e.g. an approval prompt). Nobody is at the keyboard,
+            # so approvals are declined and anything else is rejected.
+            if "approval" in method.lower():
+                self._write({"id": message_id, "result": {"decision": "decline"}})
+            else:
+                self._write({"id": message_id, "error": {"code": -32601, "message": f"unsupported: {method}"}})
+            return
+        if isinstance(method, str):
+            params = message.get("params")
+            if self._sink is not None:
+                self._sink.put_nowait((method, params if isinstance(params, dict) else {}))
+            return
+        if not isinstance(message_id, int):
+            return
+        future = self._pending.get(message_id)
+        if future is None or future.done():
+            return
+        error = message.get("error")
+        if isinstance(error, dict):
+            future.set_exception(WorkerError(str(error.get("message") or error)))
+            return
+        result = message.get("result")
+        future.set_result(result if isinstance(result, dict) else {})
+
+    async def _drain_stderr(self) -> None:
+        assert self._proc is not None and self._proc.stderr is not None
+        while True:
+            raw = await read_line(self._proc.stderr)
+            if not raw:
+                return
+            self._stderr_tail.append(raw.decode("utf-8", errors="replace").rstrip())
+
+
+class CodexWorkerPool:
+    # Long-lived `codex app-server` processes. Each worker runs one turn at a time; turns for a
+    # thread prefer a worker that already has it loaded, and workers are recycled after
+    # `max_requests` turns or on any protocol failure/timeout.
+    def __init__(self, settings: Settings, command: list[str]) -> None:
+        self._command = command
+        self._cwd = str(settings.codex_workspace_root)
+        self._size = settings.codex_worker_pool_size
+        self._max_requests = settings.codex_worker_max_requests
+        self._thread_params = thread_start_params(settings)
+        self._workers: list[CodexWorker] = []
+        self._ids = itertools.count(1)
+        self._changed = asyncio.Condition()
+        self._retiring: set[asyncio.Task[None]] = set()
+        # Threads started by prewarm() that no turn has used yet.
+        self._warm_threads: set[str] = set()
+        self.started = 0
+        self.recycled = 0
+
+    @property
+    def workers(self) -> list[CodexWorker]:
+        return list(self._workers)
+
+    async def run_turn(
+        self,
+        thread_id: str | None,
+        prompt: str,
+        on_event: EventCallback | None,
+        watch: RunWatch,
+        cwd: str | None = None,
+        model: str | None = None,
+    ) -> CodexRun:
+        try:
+            worker = await self._acquire(thread_id)
+        except (OSError, WorkerError) as exc:
+            logger.warning("Could not start Codex worker: %s", exc)
+            return CodexRun(thread_id=thread_id, last_message=None, exit_code=1, output=str(exc), error=str(exc))
+        if thread_id in self._warm_threads:
+            self._warm_threads.discard(thread_id)
+            # A warm thread is empty and only exists in the worker that started it; if that
+            # worker is busy or gone, a new thread is just as good.
+            if thread_id not in worker.loaded_threads:
+                thread_id = None
+        healthy = True
+        watch.begin()
+        try:
+            return await asyncio.wait_for(
+                worker.run_turn(thread_id, prompt, on_event, self._thread_params, watch, cwd, model),
+                timeout=watch.budget.total_sec,
+            )
+        except asyncio.CancelledError:
+            # A cancelled run (the losing side of a hedge) may still be mid-turn in the worker.
+            healthy = False
+            raise
+        except asyncio.TimeoutError:
+            healthy = False
+            return CodexRun(
+                thread_id=watch.thread_id or thread_id,
+                last_message=watch.last_message,
+                exit_code=None,
+                output=watch.timeout_summary(),
+                timed_out=True,
+            )
+        except WorkerError as exc:
+            healthy = False
+            logger.warning("Codex worker %d failed: %s", worker.worker_id, exc)
+            return CodexRun(thread_id=thread_id, last_message=None, exit_code=1, output=str(exc), error=str(exc))
+        finally:
+            await self._release(worker, healthy)
+
+    async def prewarm(self, thread_id: str | None, cwd: str | None = None) -> str | None:
+        # Starts a thread (or loads `thread_id`) on an idle worker ahead of its first turn,
+        # spawning a worker if the pool has room. Never waits for a busy pool.
+        async with self._changed:
+            if thread_id is not None and any(
+                thread_id in worker.loaded_threads for worker in self._workers if worker.alive
+            ):
+                return thread_id
+            worker = self._pick(None)
+            spawn = worker is None
+            if worker is None:
+                if len(self._workers) >= self._size:
+                    return None
+                worker = CodexWorker(next(self._ids), self._command, self._cwd)
+                self._workers.append(worker)
+            worker.busy = True
+        healthy = True
+        try:
+            if spawn:
+                await worker.start()
+                self.started += 1
+            overrides = _thread_overrides(cwd, None)
+            if thread_id is None:
+                result = await worker.request("thread/start", {**self._thread_params, **overrides})
+                thread_id = worker._thread_id_from(result)
+                self._warm_threads.add(thread_id)
+            else:
+                await worker.request("thread/resume", {"threadId": thread_id, **overrides})
+            worker.loaded_threads.add(thread_id)
+            return thread_id
+        except (OSError, WorkerError) as exc:
+            healthy = False
+            logger.warning("Prewarming Codex worker %d failed: %s", worker.worker_id, exc)
+            return None
+        except asyncio.CancelledError:
+            healthy = False
+            raise
+        finally:
+            # Counted as a request, so workers holding discarded warm threads still get recycled.
+            await self._release(worker, healthy)
+
+    def discard_warm(self, thread_id: str) -> None:
+        self._warm_threads.discard(thread_id)
+
+    async def close(self) -> None:
+        workers, self._workers = self._workers, []
+        await asyncio.gather(
+            *(worker.close() for worker in workers),
+            *self._retiring,
+            return_exceptions=True,
+        )
+
+    def _pick(self, thread_id: str | None) -> CodexWorker | None:
+        idle = [worker for worker in self._workers if not worker.busy and worker.alive]
+        if not idle:
+            return None
+        if thread_id is not None:
+            for worker in idle:
+                if thread_id in worker.loaded_threads:
+                    return worker
+        return min(idle, key=lambda worker: worker.requests_served)
+
+    async def _acquire(self, thread_id: str | None) -> CodexWorker:
+        async with self._changed:
+            while True:
+                # Health check: drop workers whose process has exited while idle.
+                for worker in [w for w in self._workers if not w.busy and not w.alive]:
+                    self._workers.remove(worker)
+                    self.recycled += 1
+                worker = self._pick(thread_id)
+                if worker is not None:
+                    worker.busy = True
+                    return worker
+                if len(self._workers) < self._size:
+                    worker = CodexWorker(next(self._ids), self._command, self._cwd)
+                    worker.busy = True
+                    self._workers.append(worker)
+                    break
+                await self._changed.wait()
+        try:
+            await worker.start()
+        except Exception:
+            worker.kill()
+            await self._release(worker, healthy=False)
+            raise
+        self.started += 1
+        return worker
+
+    async def _release(self, worker: CodexWorker, healthy: bool) -> None:
+        worker.requests_served += 1
+        retire = not healthy or not worker.alive or worker.requests_served >= self._max_requests
+        async with self._changed:
+            worker.busy = False
+            if retire and worker in self._workers:
+                self._workers.remove(worker)
+                self.recycled += 1
+            self._changed.notify_all()
+        if retire:
+            if not healthy:
+                worker.kill()
+            # Let the caller return its reply while the old process shuts down.
+            task = asyncio.create_task(worker.close())
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
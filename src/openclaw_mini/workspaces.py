@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import secrets
+import shutil
+import sys
+import time
+import zlib
+from collections.abc import Iterable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SPARE_PREFIX = ".spare-"
+TRASH_PREFIX = ".trash-"
+# A copy or checkout that takes longer than this fails the run instead of hanging it.
+PREPARE_TIMEOUT_SEC = 300.0
+GC_INTERVAL_SEC = 300.0
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+_SHARD_TAG_RE = re.compile(r"\.p\d+of\d+(?=\.|$)")
+_SIDECARS = r"(?:\.migrated|\.tmp|-journal|-wal|-shm)*"
+
+
+class WorkspaceError(RuntimeError):
+    pass
+
+
+def workspace_name(conversation_key: str) -> str:
+    # Readable, filesystem-safe and still unique if two keys sanitize to the same text.
+    safe = _UNSAFE_RE.sub("_", conversation_key).strip("._")[:80] or "conversation"
+    return f"{safe}-{zlib.crc32(conversation_key.encode('utf-8')):08x}"
+
+
+def template_exclusions(template: Path, paths: Iterable[Path]) -> re.Pattern[str] | None:
+    # Matches top-level template entries holding bot state (memory, session stores, traces, the
+    # workspaces themselves); copying them would hand every conversation everyone else's history.
+    # Each state file is matched with its shard-tagged siblings (`name.p1of2.db`) and the files
+    # written next to it: SQLite journals, the store's `.tmp` and the `.migrated` legacy store.
+    root = template.resolve()
+    patterns: set[str] = set()
+    for path in paths:
+        try:
+            relative = path.resolve().relative_to(root)
+        except ValueError:
+            continue
+        if not relative.parts:
+            continue
+        if len(relative.parts) > 1:
+            patterns.add(re.escape(relative.parts[0]))
+            continue
+        name = Path(_SHARD_TAG_RE.sub("", relative.parts[0], count=1))
+        patterns.add(f"{re.escape(name.stem)}(?:\\.p\\d+of\\d+)?{re.escape(name.suffix)}{_SIDECARS}")
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in sorted(patterns)))
+
+
+class WorkspaceManager:
+    # One working directory per conversation, made from the template (CODEX_WORKSPACE_ROOT) by
+    # a reflink copy or a git worktree. The scheduler runs one turn per conversation at a time,
+    # so a workspace never has two runs in it. A few spares are kept ready so a new conversation
+    # does not wait for the copy, and workspaces idle for `idle_ttl_sec` are removed.
+    def __init__(
+        self,
+        template: Path,
+        root: Path,
+        mode: str,
+        pool_size: int,
+        idle_ttl_sec: int,
+        exclude: re.Pattern[str] | None = None,
+    ) -> None:
+        self._template = template.resolve()
+        self._root = root.resolve()
+        self._mode = mode
+        self._pool_size = pool_size
+        self._idle_ttl_sec = idle_ttl_sec
+        self._exclude = exclude
+        # Creation, moves and removal are serialized; git takes repo-wide locks for worktrees anyway.
+        self._lock = asyncio.Lock()
+        self._wanted = asyncio.Event()
+        self._spares: list[Path] = []
+        self._in_use: dict[str, int] = {}
+        self._removing: set[str] = set()
+        self.active = 0
+        self.created = 0
+        self.removed = 0
+
+    @property
+    def spares(self) -> int:
+        return len(self._spares)
+
+    async def acquire(self, conversation_key: str) -> Path:
+        name = workspace_name(conversation_key)
+        path = self._root / name
+        self._in_use[name] = self._in_use.get(name, 0) + 1
+        try:
+            if name in self._removing or not path.is_dir():
+                async with self._lock:
+                    if not path.is_dir():
+                        await self._claim(path)
+            # The directory mtime is the last-used time the collector goes by, also across restarts.
+            os.utime(path)
+        except BaseException:
+            self.release(conversation_key)
+            raise
+        return path
+
+    def release(self, conversation_key: str) -> None:
+        name = workspace_name(conversation_key)
+        remaining = self._in_use.get(name, 0) - 1
+        if remaining > 0:
+            self._in_use[name] = remaining
+        else:
+            self._in_use.pop(name, None)
+
+    async def maintain(self) -> None:
+        await self._recover()
+        while True:
+            self._wanted.clear()
+            try:
+                await self._refill()
+                await self.collect()
+            except Exception:  # noqa: BLE001
+                logger.exception("Workspace maintenance failed")
+            try:
+                await asyncio.wait_for(self._wanted.wait(), timeout=GC_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                pass
+
+    async def collect(self) -> int:
+        cutoff = time.time() - self._idle_ttl_sec
+        removed = 0
+        async with self._lock:
+            for entry in list(self._root.iterdir()):
+                if entry.name.startswith(".") or self._in_use.get(entry.name):
+                    continue
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                self._removing.add(entry.name)
+                try:
+                    await self._remove(entry)
+                finally:
+                    self._removing.discard(entry.name)
+                self.active -= 1
+                removed += 1
+        if removed:
+            logger.info("Removed %d idle workspaces", removed)
+        return removed
+
+    async def _recover(self) -> None:
+        # Spares and half-finished copies from a previous run are not trusted; rebuild them.
+        self._root.mkdir(parents=True, exist_ok=True)
+        async with self._lock:
+            for entry in list(self._root.iterdir()):
+                if entry.name.startswith("."):
+                    await asyncio.to_thread(shutil.rmtree, entry, True)
+            self.active = sum(1 for entry in self._root.iterdir() if not entry.name.startswith("."))
+            if self._mode == "worktree":
+                await self._git("worktree", "prune")
+
+    async def _refill(self) -> None:
+        while len(self._spares) < self._pool_size:
+            async with self._lock:
+                spare = self._root / f"{SPARE_PREFIX}{secrets.token_hex(6)}"
+                await self._create(spare)
+                self._spares.append(spare)
+
+    async def _claim(self, path: Path) -> None:
+        if self._spares:
+            await self._move(self._spares.pop(), path)
+        else:
+            staging = self._root / f"{SPARE_PREFIX}{secrets.token_hex(6)}"
+            await self._create(staging)
+            await self._move(staging, path)
+        self.active += 1
+        self._wanted.set()
+
+    async def _create(self, path: Path) -> None:
+        try:
+            if self._mode == "worktree":
+                await self._git("worktree", "add", "--detach", str(path), "HEAD")
+            else:
+                await self._copy(path)
+        except BaseException:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            raise
+        self.created += 1
+
+    async def _copy(self, path: Path) -> None:
+        path.mkdir(parents=True)
+        sources = sorted(str(entry) for entry in self._template.iterdir() if not self._excluded(entry.name))
+        if not sources:
+            return
+        # Reflinks share blocks until a file is written, so a copy costs metadata only on
+        # btrfs/XFS/APFS. Hardlinks are not used: Codex edits files in place and would change the template.
+        if sys.platform.startswith("linux"):
+            command = ["cp", "-a", "--reflink=auto", *sources, str(path)]
+        elif sys.platform == "darwin":
+            command = ["cp", "-a", "-c", *sources, str(path)]
+        else:
+            command = None
+        if command is not None:
+            try:
+                await self._run(command)
+                return
+            except WorkspaceError as exc:
+                logger.warning("Fast workspace copy failed, copying file by file: %s", exc)
+        await asyncio.to_thread(self._copy_tree, path)
+
+    def _excluded(self, name: str) -> bool:
+        return self._exclude is not None and self._exclude.fullmatch(name) is not None
+
+    def _copy_tree(self, path: Path) -> None:
+        for entry in self._template.iterdir():
+            if self._excluded(entry.name):
+                continue
+            target = path / entry.name
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.copytree(entry, target, symlinks=True, dirs_exist_ok=True)
+            else:
+                shutil.copy2(entry, target, follow_symlinks=False)
+
+    async def _move(self, source: Path, target: Path) -> None:
+        if self._mode == "worktree":
+            # A plain rename would leave git pointing at the old path.
+            await self._git("worktree", "move", str(source), str(target))
+        else:
+            source.rename(target)
+
+    async def _remove(self, path: Path) -> None:
+        if self._mode == "worktree":
+            try:
+                await self._git("worktree", "remove", "--force", str(path))
+                self.removed += 1
+                return
+            except WorkspaceError as exc:
+                logger.warning("git worktree remove failed for %s: %s", path, exc)
+        # Renamed first so a new run for the conversation never sees a half-deleted directory.
+        trash = path.with_name(f"{TRASH_PREFIX}{secrets.token_hex(6)}")
+        path.rename(trash)
+        await asyncio.to_thread(shutil.rmtree, trash, True)
+        if self._mode == "worktree":
+            await self._git("worktree", "prune")
+        self.removed += 1
+
+    async def _git(self, *args: str) -> None:
+        await self._run(["git", "-C", str(self._template), *args])
+
+    async def _run(self, command: list[str]) -> None:
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=PREPARE_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise WorkspaceError(f"{command[0]} timed out after {PREPARE_TIMEOUT_SEC:.0f}s") from None
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        if proc.returncode != 0:
+            detail = stderr.decode("utf-8", errors="replace").strip()[-500:]
+            raise WorkspaceError(f"{' '.join(command[:3])} failed (exit {proc.returncode}): {detail}")
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from openclaw_mini.config import Settings, load_settings
+
+FAKE_CODEX = Path(__file__).resolve().parent.parent / "benchmarks" / "fake_codex.py"
+
+
+@pytest.fixture
+def fake_codex() -> Path:
+    return FAKE_CODEX
+
+
+@pytest.fixture
+def make_settings(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Callable[..., Settings]:
+    # Settings as load_settings() builds them, with every state path in tmp_path and
+    # benchmarks/fake_codex.py standing in for the codex CLI. Keyword arguments are extra
+    # environment variables.
+    monkeypatch.chdir(tmp_path)
+
+    def build(**env: str) -> Settings:
+        defaults = {
+            "DISCORD_BOT_TOKEN": "test-token",
+            "CODEX_COMMAND": str(FAKE_CODEX),
+            "CODEX_WORKSPACE_ROOT": str(tmp_path),
+            "CODEX_MEMORY_DIR": str(tmp_path / "memory"),
+            "CODEX_SESSION_DB_PATH": str(tmp_path / "sessions.db"),
+            "CODEX_SESSION_STORE_PATH": str(tmp_path / "sessions.json"),
+            "CODEX_MEMORY_INDEX_PATH": str(tmp_path / "memory-index.db"),
+            "FAKE_CODEX_LATENCY_MS": "20",
+            "FAKE_CODEX_LATENCY_DIST": "fixed",
+            "FAKE_CODEX_TOOL_EVENTS": "1",
+        }
+        for name, value in {**defaults, **env}.items():
+            monkeypatch.setenv(name, value)
+        return load_settings()
+
+    return build
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import random
+import re
+
+import pytest
+
+from openclaw_mini.bot import DISCORD_MESSAGE_SAFE_LIMIT, _chunk_text
+
+# Discord rejects messages over this many characters.
+DISCORD_MESSAGE_LIMIT = 2000
+FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu queue worker shard".split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def random_markdown(rng: random.Random, target_chars: int) -> str:
+    # Prose, headings, lists, tables, fenced code (with over-limit lines), long unbroken
+    # words and CRLF input: everything a Codex reply tends to contain.
+    blocks: list[str] = []
+    size = 0
+    while size < target_chars:
+        kind = rng.random()
+        if kind < 0.35:
+            block = " ".join(_sentence(rng, rng.randint(4, 30)) for _ in range(rng.randint(1, 12)))
+        elif kind < 0.45:
+            block = "#" * rng.randint(1, 3) + " " + _sentence(rng, rng.randint(2, 6))
+        elif kind < 0.6:
+            block = "\n".join(f"- {_sentence(rng, rng.randint(3, 20))}" for _ in range(rng.randint(2, 40)))
+        elif kind < 0.68:
+            rows = [f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} |" for _ in range(rng.randint(2, 30))]
+            block = "| name | value |\n| --- | --- |\n" + "\n".join(rows)
+        elif kind < 0.9:
+            marker = rng.choice(["```", "````", "~~~"])
+            lang = rng.choice(["", "python", "bash", "json"])
+            lines = [
+                "    " * rng.randint(0, 3) + " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 15)))
+                for _ in range(rng.randint(1, 200))
+            ]
+            if rng.random() < 0.1:
+                lines.append("x" * rng.randint(2000, 6000))
+            block = f"{marker}{lang}\n" + "\n".join(lines) + f"\n{marker}"
+        elif kind < 0.95:
+            block = " ".join(rng.choice(WORDS) for _ in range(rng.randint(300, 1500)))
+        else:
+            block = "y" * rng.randint(1900, 8000)
+        blocks.append(block)
+        size += len(block) + 2
+    separator = "\r\n\r\n" if rng.random() < 0.1 else "\n\n"
+    return separator.join(blocks)
+
+
+def _strip_fences(text: str) -> str:
+    # Chunks re-open and close fences at their edges, and whitespace moves at split points;
+    # everything else must come through unchanged and in order.
+    kept = [line for line in text.splitlines() if not FENCE_LINE_RE.match(line)]
+    return "".join("".join(kept).split())
+
+
+def _fences_balanced(chunk: str) -> bool:
+    open_marker: str | None = None
+    for line in chunk.splitlines():
+        match = FENCE_LINE_RE.match(line)
+        if match is None:
+            continue
+        stripped = line.strip()
+        if open_marker is None:
+            open_marker = match.group(1)
+        elif stripped.startswith(open_marker) and stripped == stripped[0] * len(stripped):
+            open_marker = None
+    return open_marker is None
+
+
+def _cases(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    return [random_markdown(rng, rng.choice([500, 3000, 20000, 80000])) for _ in range(count)]
+
+
+@pytest.mark.parametrize("max_len", [DISCORD_MESSAGE_SAFE_LIMIT, 300])
+@pytest.mark.parametrize("seed", range(4))
+def test_chunks_keep_content_fences_and_limit(seed: int, max_len: int) -> None:
+    for text in _cases(seed, 25):
+        chunks = _chunk_text(text, max_len)
+        assert all(len(chunk) <= max_len for chunk in chunks)
+        assert all(len(chunk) <= DISCORD_MESSAGE_LIMIT for chunk in chunks)
+        assert all(_fences_balanced(chunk) for chunk in chunks)
+        assert all(chunk.strip() for chunk in chunks)
+        assert _strip_fences("\n".join(chunks)) == _strip_fences(text)
+
+
+def test_short_text_is_one_chunk() -> None:
+    assert _chunk_text("hello") == ["hello"]
+
+
+def test_long_fence_is_reopened_in_every_chunk() -> None:
+    text = "```python\n" + "\n".join(f"print({i})" for i in range(600)) + "\n```"
+    chunks = _chunk_text(text)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("```python\n") and chunk.endswith("```") for chunk in chunks)
+    assert all(len(chunk) <= DISCORD_MESSAGE_SAFE_LIMIT for chunk in chunks)
+    assert _strip_fences("\n".join(chunks)) == _strip_fences(text)
+
+
+def test_unbroken_word_is_hard_split() -> None:
+    text = "z" * 5000
+    chunks = _chunk_text(text)
+    assert all(len(chunk) <= DISCORD_MESSAGE_SAFE_LIMIT for chunk in chunks)
+    assert "".join(chunks) == text
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+
+import pytest
+
+from openclaw_mini.config import Settings
+from openclaw_mini.events import CodexRun, EventCallback
+from openclaw_mini.llm import CodexClient
+
+ANSWER = CodexRun(thread_id="t", last_message="answer", exit_code=0, output="")
+
+
+def _outcome(result: CodexRun | Exception, delay: float) -> Callable[[], object]:
+    async def run() -> CodexRun:
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return run
+
+
+def _hedged(
+    settings: Settings,
+    primary: Callable[[], object],
+    backup: Callable[[], object],
+) -> tuple[CodexRun, str | None]:
+    client = CodexClient(settings)
+    client._hedge_delay = lambda: 0.01  # type: ignore[method-assign]
+
+    async def run_turn(
+        conversation_key: str,
+        thread_id: str | None,
+        instructions: str,
+        on_event: EventCallback | None,
+        model: str | None = None,
+    ) -> CodexRun:
+        # The backup is the run that does not stream.
+        return await (primary if on_event is not None else backup)()  # type: ignore[misc]
+
+    async def fresh_instructions() -> str:
+        return "instructions"
+
+    client._run_turn = run_turn  # type: ignore[method-assign]
+    return asyncio.run(client._run_hedged("dm:1", "thread-1", "instructions", fresh_instructions, None))
+
+
+@pytest.fixture
+def settings(make_settings: Callable[..., Settings]) -> Settings:
+    return make_settings(CODEX_HEDGE="true")
+
+
+def test_backup_error_does_not_fail_a_healthy_primary(settings: Settings) -> None:
+    run, thread_id = _hedged(settings, _outcome(ANSWER, 0.1), _outcome(OSError("spawn failed"), 0))
+    assert run.last_message == "answer"
+    assert thread_id == "thread-1"
+
+
+def test_primary_error_does_not_fail_a_healthy_backup(settings: Settings) -> None:
+    run, thread_id = _hedged(settings, _outcome(OSError("worker gone"), 0.05), _outcome(ANSWER, 0.1))
+    assert run.last_message == "answer"
+    assert thread_id is None
+
+
+def test_primary_error_wins_when_both_fail(settings: Settings) -> None:
+    with pytest.raises(OSError, match="primary"):
+        _hedged(settings, _outcome(OSError("primary"), 0.1), _outcome(RuntimeError("backup"), 0))
+
+
+def test_failed_primary_run_is_returned_when_backup_raises(settings: Settings) -> None:
+    failed = CodexRun(thread_id="t", last_message=None, exit_code=1, output="boom", error="boom")
+    run, _ = _hedged(settings, _outcome(failed, 0.05), _outcome(OSError("backup"), 0))
+    assert run is failed
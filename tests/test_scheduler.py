@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+import pytest
+
+from openclaw_mini.config import Settings
+from openclaw_mini.scheduler import ConversationScheduler
+
+
+async def _service_order(jobs: list[tuple[str, float]]) -> list[str]:
+    # One slot, held while every job queues in list order; returns the flows in the order run.
+    scheduler = ConversationScheduler(1)
+    hold = asyncio.Event()
+    order: list[str] = []
+
+    async def holder() -> None:
+        await hold.wait()
+
+    def record(flow: str) -> Callable[[], Awaitable[None]]:
+        async def job() -> None:
+            order.append(flow)
+
+        return job
+
+    held = asyncio.ensure_future(scheduler.run("holder", holder, flow="holder"))
+    await asyncio.sleep(0)
+    tasks = []
+    for index, (flow, weight) in enumerate(jobs):
+        # Separate conversations, so all of them wait on the shared slot rather than a lane.
+        tasks.append(asyncio.ensure_future(scheduler.run(f"c{index}", record(flow), flow=flow, weight=weight)))
+        await asyncio.sleep(0)
+    hold.set()
+    await asyncio.gather(held, *tasks)
+    return order
+
+
+def test_equal_weights_alternate_flows() -> None:
+    jobs = [("a", 1.0)] * 4 + [("b", 1.0)] * 4
+    assert asyncio.run(_service_order(jobs)) == ["a", "b", "a", "b", "a", "b", "a", "b"]
+
+
+def test_heavier_flow_gets_proportionally_more_slots() -> None:
+    # Finish tags: a = 0.5, 1, 1.5, 2 and b = 1, 2, 3, 4; ties go to the earlier arrival.
+    jobs = [("a", 2.0)] * 4 + [("b", 1.0)] * 4
+    assert asyncio.run(_service_order(jobs)) == ["a", "a", "b", "a", "a", "b", "b", "b"]
+
+
+def test_user_weights_setting(make_settings: Callable[..., Settings]) -> None:
+    settings = make_settings(CODEX_USER_WEIGHTS="111=2, 222=0.5")
+    assert settings.codex_user_weights == {111: 2.0, 222: 0.5}
+    assert make_settings(CODEX_USER_WEIGHTS="").codex_user_weights == {}
+    for bad in ("111", "x=2", "111=0"):
+        with pytest.raises(ValueError, match="CODEX_USER_WEIGHTS"):
+            make_settings(CODEX_USER_WEIGHTS=bad)
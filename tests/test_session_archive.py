@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import Callable
+
+import pytest
+
+from openclaw_mini.config import Settings
+from openclaw_mini.llm import CodexClient
+from openclaw_mini.session import SessionRecord, Turn
+from openclaw_mini.session_store import open_session_store
+
+KEY = "dm:1"
+
+
+def _record(started_at_iso: str, *texts: str) -> SessionRecord:
+    record = SessionRecord.new(20, started_at_iso=started_at_iso)
+    for text in texts:
+        record.append(Turn(at=started_at_iso, role="user", text=text))
+    return record
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_delete_spares_a_newer_session_under_the_same_key(
+    make_settings: Callable[..., Settings], backend: str
+) -> None:
+    store = open_session_store(make_settings(CODEX_SESSION_STORE_BACKEND=backend))
+    store.load_all()
+    store.save(KEY, _record("2026-01-01T00:00:00+00:00", "old"))
+    store.save(KEY, _record("2026-01-02T00:00:00+00:00", "new"))
+
+    store.delete(KEY, "2026-01-01T00:00:00+00:00")
+    assert [turn.text for turn in store.load_all()[KEY].turns] == ["new"]
+
+    store.delete(KEY, "2026-01-02T00:00:00+00:00")
+    assert store.load_all() == {}
+    store.close()
+
+
+class _BlockedArchive:
+    # Holds the archive thread just before it writes the memory file and deletes the session,
+    # so the test can land a message in that window.
+    def __init__(self, client: CodexClient) -> None:
+        self.started = threading.Event()
+        self.resume = threading.Event()
+        self._archive = client._archive_session
+
+    def __call__(self, *args: object, **kwargs: object) -> None:
+        self.started.set()
+        self.resume.wait(5)
+        self._archive(*args, **kwargs)
+
+
+async def _message_during_archive(client: CodexClient, archive: Callable[[], object]) -> None:
+    blocked = _BlockedArchive(client)
+    client._archive_session = blocked  # type: ignore[method-assign]
+    task = asyncio.ensure_future(archive())
+    await asyncio.to_thread(blocked.started.wait, 5)
+    await client._record_turn_pair(KEY, "thread-new", "new question", "new answer")
+    blocked.resume.set()
+    await task
+
+
+def _stale_client(settings: Settings) -> CodexClient:
+    client = CodexClient(settings)
+    asyncio.run(client._record_turn_pair(KEY, "thread-old", "old question", "old answer"))
+    client._session_store[KEY].last_active_at = 0.0
+    return client
+
+
+def _assert_new_session_persisted(settings: Settings) -> None:
+    store = open_session_store(settings)
+    record = store.load_all()[KEY]
+    store.close()
+    assert record.thread_id == "thread-new"
+    assert [turn.text for turn in record.turns] == ["new question", "new answer"]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_sweeper_archive_keeps_session_started_meanwhile(
+    make_settings: Callable[..., Settings], backend: str
+) -> None:
+    settings = make_settings(CODEX_SESSION_STORE_BACKEND=backend)
+    client = _stale_client(settings)
+    client._schedule_expiry(KEY, client._session_store[KEY])
+
+    asyncio.run(_message_during_archive(client, client._sweep_expired))
+
+    assert client._session_store[KEY].thread_id == "thread-new"
+    _assert_new_session_persisted(settings)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_prewarm_archive_keeps_session_started_meanwhile(
+    make_settings: Callable[..., Settings], backend: str
+) -> None:
+    # Typing prewarms (and archives the stale session); the message being typed then starts
+    # the new session while that archive is still running.
+    settings = make_settings(CODEX_SESSION_STORE_BACKEND=backend, CODEX_PREWARM="true")
+    client = _stale_client(settings)
+
+    asyncio.run(_message_during_archive(client, lambda: client.prewarm(KEY)))
+
+    assert client._session_store[KEY].thread_id == "thread-new"
+    _assert_new_session_persisted(settings)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+
+from openclaw_mini.session import SessionRecord, Turn
+from openclaw_mini.session_store import SqliteSessionStore
+
+STARTED = "2026-01-01T00:00:00+00:00"
+
+
+def _record(max_turns: int, *texts: str) -> SessionRecord:
+    record = SessionRecord.new(max_turns, started_at_iso=STARTED)
+    record.thread_id = "thread-1"
+    record.last_active_at = 1000.0
+    for text in texts:
+        record.append(Turn(at=STARTED, role="user", text=text))
+    return record
+
+
+def _turn_rows(db_path: Path) -> list[tuple[int, str]]:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT seq, text FROM turns WHERE conversation_key = 'dm:1' ORDER BY seq").fetchall()
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    store = SqliteSessionStore(tmp_path / "s.db", 10)
+    record = _record(10, "a", "b")
+    record.memory_file = "memory/dm-1.md"
+    record.prompt_sections = {"soul": "hash"}
+    record.written_seq = 1
+    store.save("dm:1", record)
+    store.close()
+
+    store = SqliteSessionStore(tmp_path / "s.db", 10)
+    loaded = store.load_all()["dm:1"]
+    store.close()
+    assert [turn.text for turn in loaded.turns] == ["a", "b"]
+    assert loaded.thread_id == "thread-1"
+    assert loaded.started_at_iso == STARTED
+    assert loaded.last_active_at == 1000.0
+    assert loaded.memory_file == "memory/dm-1.md"
+    assert loaded.prompt_sections == {"soul": "hash"}
+    assert (loaded.turn_seq, loaded.written_seq, loaded.persisted_seq) == (2, 1, 2)
+
+
+def test_saves_insert_only_turns_past_persisted_seq(tmp_path: Path) -> None:
+    db_path = tmp_path / "s.db"
+    store = SqliteSessionStore(db_path, 10)
+    record = _record(10, "a", "b")
+    store.save("dm:1", record)
+    assert record.persisted_seq == 2
+
+    # Rewrite a stored turn behind the store's back: a save that rewrote every turn would undo it.
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE turns SET text = 'kept' WHERE conversation_key = 'dm:1' AND seq = 1")
+    record.append(Turn(at=STARTED, role="assistant", text="c"))
+    store.save("dm:1", record)
+
+    assert _turn_rows(db_path) == [(1, "kept"), (2, "b"), (3, "c")]
+    assert record.persisted_seq == 3
+    store.close()
+
+
+def test_ring_buffer_trims_stored_turns(tmp_path: Path) -> None:
+    db_path = tmp_path / "s.db"
+    store = SqliteSessionStore(db_path, 3)
+    record = _record(3, "a", "b")
+    store.save("dm:1", record)
+    for text in ("c", "d", "e"):
+        record.append(Turn(at=STARTED, role="user", text=text))
+    store.save("dm:1", record)
+    store.close()
+
+    assert _turn_rows(db_path) == [(3, "c"), (4, "d"), (5, "e")]
+    store = SqliteSessionStore(db_path, 3)
+    loaded = store.load_all()["dm:1"]
+    store.close()
+    assert [turn.text for turn in loaded.turns] == ["c", "d", "e"]
+    assert loaded.turn_seq == 5
+    assert loaded.first_seq == 3
+
+
+def test_fresh_record_replaces_leftover_turns_of_the_key(tmp_path: Path) -> None:
+    db_path = tmp_path / "s.db"
+    store = SqliteSessionStore(db_path, 10)
+    store.save("dm:1", _record(10, "old-1", "old-2", "old-3"))
+    store.save("dm:1", _record(10, "new"))
+    assert _turn_rows(db_path) == [(1, "new")]
+    store.close()
+
+
+def _write_legacy_json(path: Path) -> None:
+    legacy = {
+        "dm:1": {
+            "thread_id": "legacy-thread",
+            "started_at_iso": STARTED,
+            "last_active_at": 500.0,
+            "written_turns": 1,
+            "turns": [
+                {"at": STARTED, "role": "user", "text": "hi"},
+                {"at": STARTED, "role": "assistant", "text": "hello"},
+            ],
+        },
+        "guild:2": {"turns": [{"role": "user", "text": "no timestamp"}, "not a turn"]},
+    }
+    path.write_text(json.dumps(legacy), encoding="utf-8")
+
+
+def test_legacy_json_is_migrated_once_and_renamed(tmp_path: Path) -> None:
+    legacy_path = tmp_path / "sessions.json"
+    _write_legacy_json(legacy_path)
+    store = SqliteSessionStore(tmp_path / "s.db", 10, legacy_json_path=legacy_path)
+    records = store.load_all()
+    store.close()
+
+    assert not legacy_path.exists()
+    assert (tmp_path / "sessions.json.migrated").exists()
+    assert set(records) == {"dm:1", "guild:2"}
+    migrated = records["dm:1"]
+    assert migrated.thread_id == "legacy-thread"
+    assert [turn.text for turn in migrated.turns] == ["hi", "hello"]
+    assert (migrated.turn_seq, migrated.written_seq, migrated.persisted_seq) == (2, 1, 2)
+    assert [(turn.at, turn.text) for turn in records["guild:2"].turns] == [("unknown-time", "no timestamp")]
+
+    # Reopened from the database alone, the migrated sessions are unchanged.
+    store = SqliteSessionStore(tmp_path / "s.db", 10, legacy_json_path=legacy_path)
+    reopened = store.load_all()
+    store.close()
+    assert [turn.text for turn in reopened["dm:1"].turns] == ["hi", "hello"]
+    assert reopened["dm:1"].written_seq == 1
+
+
+def test_legacy_json_is_left_alone_when_the_database_has_sessions(tmp_path: Path) -> None:
+    store = SqliteSessionStore(tmp_path / "s.db", 10)
+    store.save("dm:9", _record(10, "current"))
+    store.close()
+    legacy_path = tmp_path / "sessions.json"
+    _write_legacy_json(legacy_path)
+
+    store = SqliteSessionStore(tmp_path / "s.db", 10, legacy_json_path=legacy_path)
+    records = store.load_all()
+    store.close()
+    assert set(records) == {"dm:9"}
+    assert legacy_path.exists()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Callable
+
+import pytest
+
+from openclaw_mini.config import Settings
+from openclaw_mini.session import SessionRecord, Turn
+from openclaw_mini.session_store import open_session_store
+from openclaw_mini.sharding import plans_for, shard_settings, split_session_store
+
+# With 4 shards over 2 processes: DMs and guild shard 2 belong to process 0, guild shard 1 to process 1.
+KEYS = {
+    "dm:1": 0,
+    f"guild:{2 << 22}:channel:7": 0,
+    f"guild:{1 << 22}:channel:8": 1,
+}
+
+
+def _record(text: str) -> SessionRecord:
+    record = SessionRecord.new(10, started_at_iso="2026-01-01T00:00:00+00:00")
+    record.thread_id = f"thread-{text}"
+    record.append(Turn(at="2026-01-01T00:00:00+00:00", role="user", text=text))
+    return record
+
+
+def _shard_records(settings: Settings) -> list[dict[str, SessionRecord]]:
+    records = []
+    for plan in plans_for(settings):
+        store = open_session_store(shard_settings(settings, plan))
+        records.append(store.load_all())
+        store.close()
+    return records
+
+
+def _sharded(make_settings: Callable[..., Settings], **env: str) -> Settings:
+    return make_settings(DISCORD_SHARD_COUNT="4", DISCORD_SHARD_PROCESSES="2", **env)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_unsharded_store_is_split_between_processes(
+    make_settings: Callable[..., Settings], backend: str
+) -> None:
+    settings = _sharded(make_settings, CODEX_SESSION_STORE_BACKEND=backend)
+    store = open_session_store(settings)
+    store.load_all()
+    for key in KEYS:
+        store.save(key, _record(key))
+    store.close()
+
+    assert split_session_store(settings, plans_for(settings)) == len(KEYS)
+
+    shards = _shard_records(settings)
+    for key, process in KEYS.items():
+        assert shards[process][key].thread_id == f"thread-{key}"
+        assert [turn.text for turn in shards[process][key].turns] == [key]
+        assert key not in shards[1 - process]
+    source = settings.codex_session_db_path if backend == "sqlite" else settings.codex_session_store_path
+    assert not source.exists()
+    assert source.with_name(f"{source.name}.migrated").exists()
+
+    # Only the first start with shard processes splits.
+    assert split_session_store(settings, plans_for(settings)) == 0
+
+
+def test_legacy_json_store_is_split_too(make_settings: Callable[..., Settings]) -> None:
+    settings = _sharded(make_settings)
+    legacy = {key: {"thread_id": f"thread-{key}", "turns": [{"role": "user", "text": key}]} for key in KEYS}
+    settings.codex_session_store_path.write_text(json.dumps(legacy), encoding="utf-8")
+
+    assert split_session_store(settings, plans_for(settings)) == len(KEYS)
+
+    shards = _shard_records(settings)
+    assert {key for shard in shards for key in shard} == set(KEYS)
+    assert shards[1][f"guild:{1 << 22}:channel:8"].thread_id == f"thread-guild:{1 << 22}:channel:8"
+    assert not settings.codex_session_store_path.exists()
+
+
+def test_stores_for_another_process_count_are_reported(
+    make_settings: Callable[..., Settings], caplog: pytest.LogCaptureFixture
+) -> None:
+    settings = _sharded(make_settings)
+    stale = settings.codex_session_db_path.with_name("sessions.p0of3.db")
+    stale.touch()
+
+    with caplog.at_level(logging.WARNING, logger="openclaw_mini.sharding"):
+        assert split_session_store(settings, plans_for(settings)) == 0
+    assert "sessions.p0of3.db" in caplog.text
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import pytest
+
+from openclaw_mini.config import Settings
+from openclaw_mini.events import CodexRun
+from openclaw_mini.fake_codex import directive
+from openclaw_mini.timeouts import RunBudget, RunWatch
+from openclaw_mini.workers import CodexWorkerPool
+
+
+def _watch() -> RunWatch:
+    return RunWatch(RunBudget(idle_sec=10.0, total_sec=30.0))
+
+
+def _with_pool(
+    settings: Settings,
+    fake_codex: Path,
+    body: Callable[[CodexWorkerPool], Awaitable[None]],
+) -> None:
+    async def main() -> None:
+        pool = CodexWorkerPool(settings, [sys.executable, str(fake_codex), "app-server"])
+        try:
+            await body(pool)
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+
+async def _turn(
+    pool: CodexWorkerPool,
+    prompt: str,
+    thread_id: str | None = None,
+    events: list[dict[str, object]] | None = None,
+) -> CodexRun:
+    async def on_event(event: dict[str, object]) -> None:
+        if events is not None:
+            events.append(event)
+
+    return await pool.run_turn(thread_id, prompt, on_event, _watch())
+
+
+def test_turn_starts_and_resumes_a_thread(make_settings: Callable[..., Settings], fake_codex: Path) -> None:
+    async def body(pool: CodexWorkerPool) -> None:
+        events: list[dict[str, object]] = []
+        first = await _turn(pool, "hello", events=events)
+        assert first.exit_code == 0
+        assert first.last_message == "fake-codex reply to: hello"
+        assert first.thread_id
+        assert events[0] == {"type": "thread.started", "thread_id": first.thread_id}
+        assert any(event.get("type") == "item.completed" for event in events)
+
+        second = await _turn(pool, "again", thread_id=first.thread_id)
+        assert second.thread_id == first.thread_id
+        assert second.last_message == "fake-codex reply to: again"
+        assert pool.started == 1
+        assert first.thread_id in pool.workers[0].loaded_threads
+
+    _with_pool(make_settings(CODEX_BACKEND="worker", CODEX_WORKER_POOL_SIZE="1"), fake_codex, body)
+
+
+def test_failed_turn_reports_the_error_and_keeps_the_worker(
+    make_settings: Callable[..., Settings], fake_codex: Path
+) -> None:
+    async def body(pool: CodexWorkerPool) -> None:
+        failed = await _turn(pool, f"break {directive(10, 1, 0)}")
+        assert failed.exit_code == 1
+        assert failed.last_message is None
+        assert "simulated failure" in failed.error
+
+        # A failed turn is a Codex answer, not a protocol failure: the worker stays.
+        ok = await _turn(pool, "next")
+        assert ok.exit_code == 0
+        assert pool.started == 1
+        assert pool.recycled == 0
+
+    _with_pool(make_settings(CODEX_BACKEND="worker", CODEX_WORKER_POOL_SIZE="1"), fake_codex, body)
+
+
+def test_workers_are_recycled_after_max_requests_and_when_dead(
+    make_settings: Callable[..., Settings], fake_codex: Path
+) -> None:
+    async def body(pool: CodexWorkerPool) -> None:
+        for prompt in ("one", "two"):
+            assert (await _turn(pool, prompt)).exit_code == 0
+        assert pool.started == 1
+        assert pool.recycled == 1
+        assert pool.workers == []
+
+        assert (await _turn(pool, "three")).exit_code == 0
+        assert pool.started == 2
+        worker = pool.workers[0]
+        worker.kill()
+        await worker._proc.wait()  # type: ignore[union-attr]
+
+        # The dead idle worker is dropped and replaced before the next turn.
+        assert (await _turn(pool, "four")).exit_code == 0
+        assert pool.started == 3
+        assert pool.recycled == 2
+
+    settings = make_settings(CODEX_BACKEND="worker", CODEX_WORKER_POOL_SIZE="1", CODEX_WORKER_MAX_REQUESTS="2")
+    _with_pool(settings, fake_codex, body)
+
+
+def test_approval_requests_are_declined(
+    make_settings: Callable[..., Settings], fake_codex: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("FAKE_CODEX_APPROVALS", "2")
+
+    async def body(pool: CodexWorkerPool) -> None:
+        events: list[dict[str, object]] = []
+        run = await _turn(pool, "clean up", events=events)
+        assert run.exit_code == 0
+        statuses = [
+            event["item"].get("status")  # type: ignore[union-attr]
+            for event in events
+            if event.get("type") == "item.completed"
+            and str(event["item"].get("command", "")).startswith("rm -rf")  # type: ignore[union-attr]
+        ]
+        assert statuses == ["declined", "declined"]
+
+    _with_pool(make_settings(CODEX_BACKEND="worker", CODEX_WORKER_POOL_SIZE="1"), fake_codex, body)